@@ -0,0 +1,152 @@
+"""
+Two-tier answer cache in front of RAG_Engine.
+
+- Exact tier: keyed by the normalized question within a namespace made of the
+  index version, LLM model and prompt, so any of those changing misses.
+- Semantic tier: reuses an answer whose question embedding is within a cosine
+  similarity threshold of the incoming query's embedding.
+
+Entries expire after a TTL and the least recently used are evicted past
+`max_entries`. Switching to a new namespace (e.g. after an index rebuild) drops
+everything cached under the old one, and an answer computed under the old
+namespace that lands after the switch is not stored.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, remove punctuation, collapse whitespace (same rules as evaluate.normalize)."""
+    if text is None:
+        return ""
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_namespace(index_version: str, model: str, prompt: str) -> str:
+    payload = "\x1f".join([index_version, model, prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 semantic_threshold: float = ANSWER_CACHE_SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.namespace = None
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "exact_misses": 0, "expirations": 0, "semantic_hits": 0,
+                      "semantic_misses": 0, "evictions": 0, "invalidations": 0, "stale_writes": 0}
+
+    def set_namespace(self, namespace: str):
+        """Activates `namespace`, dropping every entry cached under a previous one."""
+        with self._lock:
+            if namespace != self.namespace:
+                if self._entries:
+                    self.stats["invalidations"] += 1
+                self._entries.clear()
+                self._matrix = None
+                self.namespace = namespace
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry["created_at"] > self.ttl
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def get_exact(self, question: str):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["exact_misses"] += 1
+                return None
+            if self._expired(entry, time.time()):
+                self._drop(key)
+                self.stats["expirations"] += 1
+                self.stats["exact_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry
+
+    def get_semantic(self, query_vector):
+        """Returns the closest cached entry if its similarity clears the threshold, else None."""
+        import numpy as np
+
+        with self._lock:
+            if not self._entries:
+                self.stats["semantic_misses"] += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = [k for k, e in self._entries.items() if e["vector"] is not None]
+                if not self._matrix_keys:
+                    self.stats["semantic_misses"] += 1
+                    return None
+                self._matrix = np.vstack([self._entries[k]["vector"] for k in self._matrix_keys])
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            key = self._matrix_keys[best]
+            entry = self._entries.get(key)
+            if entry is None or scores[best] < self.semantic_threshold or self._expired(entry, time.time()):
+                self.stats["semantic_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["semantic_hits"] += 1
+            return dict(entry, similarity=float(scores[best]))
+
+    def hit_rate(self) -> float:
+        """Share of lookups answered from either tier (every lookup tries the exact tier first)."""
+        with self._lock:
+            lookups = self.stats["exact_hits"] + self.stats["exact_misses"]
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return hits / lookups if lookups else 0.0
+
+    def put(self, question: str, query_vector, answer: str, sources, namespace: str = None):
+        """
+        Caches an answer. Without a `query_vector` it is only reachable through
+        the exact tier. `namespace` is the one active when the query started;
+        if it has been switched since, the answer is stale and is dropped.
+        """
+        import numpy as np
+
+        vector = None
+        if query_vector is not None:
+            vector = np.asarray(query_vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = normalize_question(question)
+        with self._lock:
+            if namespace is not None and namespace != self.namespace:
+                self.stats["stale_writes"] += 1
+                return
+            self._entries[key] = {
+                "question": question,
+                "vector": vector,
+                "answer": answer,
+                "sources": sources,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,7 +1,16 @@
 # app.py
 
+import os
 import streamlit as st
-from rag_engine import RAG_Engine
+from query_client import QUERY_SERVICE_URL, QueryServiceClient
+from conversation import ConversationHistory
+
+# The engine reads its key from the environment; fall back to Streamlit secrets
+if not os.getenv("OPENROUTER_API_KEY"):
+    try:
+        os.environ["OPENROUTER_API_KEY"] = st.secrets["OPENROUTER_API_KEY"]
+    except Exception:
+        pass
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -13,51 +22,105 @@ st.set_page_config(
 # --- State Management and Engine Initialization ---
 
 # This is the core of the new setup. 
-# @st.cache_resource ensures the RAG_Engine is loaded only ONCE.
-# This prevents re-loading the PDF and re-building the vector store every time the user asks a question.
+# @st.cache_resource ensures the corpus registry is created only ONCE per process.
+# Each project brief's index is loaded on its first question and kept until the
+# memory budget (RAG_CORPUS_MEMORY_BUDGET_MB) forces the least recently used one out.
+# The app never builds an index itself: run `python ingest.py --corpora` first to create them.
+# With RAG_QUERY_SERVICE_URL set, every worker shares one query_service.py instead.
+@st.cache_resource
+def load_corpus_registry():
+    """Creates the registry of corpora (corpora.json, or just the Project Nova brief)."""
+    from corpus_registry import CorpusRegistry
+    return CorpusRegistry(build_if_missing=False)
+
 @st.cache_resource
-def load_rag_engine():
-    """Loads the RAG Engine and caches it."""
+def connect_query_service(corpus=None):
+    """Connects to the shared query service, routed to `corpus`; None if it isn't ready."""
+    client = QueryServiceClient(QUERY_SERVICE_URL, corpus=corpus)
+    return client if client.ready() else None
+
+def corpus_names():
+    if QUERY_SERVICE_URL:
+        client = connect_query_service()
+        # A service started without --corpora serves just its --pdf
+        return (client.corpora() if client is not None else []) or [None]
+    return load_corpus_registry().names()
+
+def load_rag_engine(corpus):
+    """The engine for `corpus` (or a query service client); None if its index is missing."""
+    if QUERY_SERVICE_URL:
+        return connect_query_service(corpus)
     try:
-        engine = RAG_Engine("project_nova_brief.pdf")
-        return engine
+        # Loads the index and LLM client on first use, so later questions don't wait for them
+        return load_corpus_registry().get(corpus)
     except FileNotFoundError:
         return None
 
-# Load the engine
-engine = load_rag_engine()
+# Pick the corpus and load its engine
+names = corpus_names()
+corpus = st.sidebar.selectbox("Project brief", names) if len(names) > 1 else names[0]
+try:
+    engine = load_rag_engine(corpus)
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
 
 # --- Streamlit UI ---
 
-st.title("🤖 Project Nova AI Assistant")
+st.title(f"🤖 Project {(corpus or 'nova').title()} AI Assistant")
 st.caption("This chatbot uses RAG to answer questions from the project brief.")
 
-if engine is None:
-    st.error("The knowledge base file 'project_nova_brief.pdf' was not found. Please add it to the same folder as this script and restart.")
+if engine is None and QUERY_SERVICE_URL:
+    st.error(f"The query service at {QUERY_SERVICE_URL} is not ready. Start `python query_service.py` and refresh.")
+    connect_query_service.clear()
+elif engine is None:
+    path = load_corpus_registry().corpora[corpus]
+    st.error(f"The knowledge base for '{path}' was not found. Add it next to this script, run `python ingest.py --corpora`, and restart.")
 else:
-    # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {"role": "assistant", "content": "Hello! I have studied the Project Nova brief. How can I help you?"}
-        ]
-
-    # Display chat messages
-    for message in st.session_state.messages:
+    # Initialize chat history (one per corpus): a bounded window of recent messages, older turns compacted into a summary
+    history_key = f"history:{corpus}"
+    if history_key not in st.session_state:
+        st.session_state[history_key] = ConversationHistory()
+        st.session_state[history_key].append(
+            "assistant", f"Hello! I have studied the Project {(corpus or 'nova').title()} brief. How can I help you?"
+        )
+    history = st.session_state[history_key]
+
+    # Display chat messages (only the window is re-rendered on each rerun)
+    if history.summary_lines:
+        with st.expander(f"Earlier conversation ({history.compacted} messages summarized)"):
+            st.markdown(history.summary.replace("\n", "  \n"))
+    for message in history.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
     # Get user input
     if prompt := st.chat_input("Ask about the project timeline, team, or tech stack..."):
-        # Add user message to history and display
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        # Display the question; it joins the history once answered, so the engine sees only earlier turns
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Get assistant response using the RAG engine
+        # Get assistant response using the RAG engine, rendering tokens as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Searching the document and thinking..."):
-                response = engine.query(prompt)
+            try:
+                with st.spinner("Searching the document..."):
+                    stream = engine.stream_query(prompt, history=history)
+                response = st.write_stream(stream)
+                st.caption(
+                    f"First token in {stream.timings['time_to_first_token']:.2f}s · "
+                    f"total {stream.timings['total']:.2f}s"
+                    + (f" · cached ({stream.cache_hit})" if stream.cache_hit else "")
+                    + (" · no relevant passage, LLM skipped" if stream.abstained else "")
+                    + (" · answered by the fallback model" if stream.outcome == "fallback" else "")
+                    + (" · degraded: the model did not answer in time" if stream.outcome == "degraded" else "")
+                )
+                with st.expander("Sources"):
+                    for doc in stream.sources:
+                        st.markdown(f"**Page {doc.metadata.get('page', 0) + 1}:** {doc.page_content[:300]}...")
+            except Exception as e:
+                response = f"Error occurred during query: {e}"
                 st.markdown(response)
         
-        # Add assistant response to history
-        st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+        # Add the turn to history
+        history.append("user", prompt)
+        history.append("assistant", response)
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Concurrent, resumable batch runner for evaluation and bulk question files.
+
+Questions run through RAG_Engine.aquery with bounded concurrency (and an
+optional QPS cap). Every finished question is appended to a JSONL checkpoint,
+so an interrupted run picks up where it left off when started again with
+`--resume` and the same checkpoint (questions that errored are retried).
+Checkpoint rows are keyed by the question's id plus a hash of the test case and
+the engine configuration, so a changed question file or config reruns instead
+of replaying stale answers. Without `--resume` the checkpoint starts empty.
+Scoring and the summary are the ones from evaluate.py.
+
+    python batch_runner.py                                  # the 25 built-in test cases
+    python batch_runner.py questions.jsonl --concurrency 16 --max-qps 8
+    python batch_runner.py questions.csv --checkpoint run1.jsonl --output run1.csv
+    python batch_runner.py questions.csv --checkpoint run1.jsonl --output run1.csv --resume
+
+Question files are JSONL (one test-case dict per line, same keys as
+evaluate.test_cases) or CSV with a `question` column and optional `id`, `type`,
+`behavior`, `match_mode`, `keywords` and `acceptable` columns. List-valued CSV
+cells are either JSON or `|`-separated.
+"""
+import os
+import csv
+import json
+import time
+import hashlib
+import asyncio
+import argparse
+
+from query_client import QUERY_SERVICE_URL, QueryServiceClient
+from evaluate import test_cases, score_case, print_summary, save_results
+from run_history import record_run, run_config
+
+
+def _parse_list_cell(value):
+    value = (value or "").strip()
+    if not value:
+        return []
+    if value.startswith("["):
+        return json.loads(value)
+    return [item.strip() for item in value.split("|") if item.strip()]
+
+
+def load_questions(path):
+    """Loads test cases from a JSONL or CSV file; each gets a string `id`."""
+    cases = []
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                case = {k: v for k, v in row.items() if v not in (None, "")}
+                if "keywords" in case:
+                    case["keywords"] = _parse_list_cell(case["keywords"])
+                if "acceptable" in case:
+                    groups = _parse_list_cell(case["acceptable"])
+                    case["acceptable"] = [g if isinstance(g, list) else [g] for g in groups]
+                cases.append(case)
+    else:
+        with open(path) as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+
+    for i, case in enumerate(cases):
+        case["id"] = str(case.get("id", i + 1))
+        case.setdefault("type", "Positive" if case.get("behavior", "ANSWER") == "ANSWER" else "Negative")
+    return cases
+
+
+def case_key(case, config):
+    """Checkpoint key: the case id plus a hash of the whole test case and the run configuration."""
+    payload = json.dumps({"case": case, "config": config}, sort_keys=True, default=str)
+    return f"{case['id']}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def load_checkpoint(path):
+    """Returns {key: result row} for every question already finished (see case_key)."""
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a truncated last line; that question just reruns
+                    continue
+                # Rows from before keys were recorded can't be matched safely, so they rerun
+                if "Key" in row:
+                    done[row.pop("Key")] = row
+    return done
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/max_qps seconds apart."""
+
+    def __init__(self, max_qps):
+        self.interval = 1.0 / max_qps if max_qps else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.perf_counter()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def run_batch(engine, cases, checkpoint_path, concurrency=8, max_qps=None, resume=False, config=None):
+    """
+    Runs every case and returns (result rows in case order, number of
+    questions actually queried); with `resume`, rows already in the checkpoint
+    for the same case and `config` are reused instead.
+    """
+    keys = {c["id"]: case_key(c, config or {}) for c in cases}
+    checkpointed = load_checkpoint(checkpoint_path) if resume else {}
+    done = {c["id"]: checkpointed[keys[c["id"]]] for c in cases if keys[c["id"]] in checkpointed}
+    pending = [c for c in cases if c["id"] not in done]
+    if resume:
+        print(f"{len(done)} of {len(cases)} questions already in {checkpoint_path}; running {len(pending)}.\n")
+    elif os.path.exists(checkpoint_path):
+        print(f"Starting a fresh checkpoint in {checkpoint_path} (pass --resume to continue the previous run).\n")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(max_qps)
+    finished = len(done)
+
+    with open(checkpoint_path, "a" if resume else "w") as checkpoint:
+        async def run_one(case):
+            nonlocal finished
+            async with semaphore:
+                await limiter.wait()
+                start = time.perf_counter()
+                response = await engine.aquery(case["question"])
+                duration = time.perf_counter() - start
+
+            is_correct, reason = score_case(response, case)
+            row = {
+                "ID": case["id"],
+                "Data Type": case["type"],
+                "Question": case["question"],
+                "Expected": case.get("behavior", "ANSWER"),
+                "Actual Response": response.strip(),
+                "Result": "PASS" if is_correct else "FAIL",
+                "Time": f"{duration:.2f}s",
+            }
+            # Failed queries are left out of the checkpoint so a resumed run retries them
+            if not response.startswith("Error occurred during query"):
+                checkpoint.write(json.dumps(dict(row, Key=keys[case["id"]])) + "\n")
+                checkpoint.flush()
+            done[case["id"]] = row
+            finished += 1
+            print(f"[{finished}/{len(cases)}] ({case['type']}) Q: {case['question']}")
+            print(f"  -> {'✅ PASS' if is_correct else '❌ FAIL'}: {reason} | {duration:.2f}s")
+
+        await asyncio.gather(*(run_one(c) for c in pending))
+
+    return [done[c["id"]] for c in cases], len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many questions through the RAG engine concurrently.")
+    parser.add_argument("questions", nargs="?", help="JSONL or CSV file (default: evaluate.test_cases).")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max questions in flight.")
+    parser.add_argument("--max-qps", type=float, default=None, help="Cap on question start rate.")
+    parser.add_argument("--checkpoint", default="batch_checkpoint.jsonl")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse answers already in the checkpoint for the same questions and config.")
+    parser.add_argument("--output", default="evaluation_results.csv")
+    parser.add_argument("--service", default=QUERY_SERVICE_URL,
+                        help="URL of a running query_service.py to use instead of a local engine.")
+    args = parser.parse_args()
+
+    if args.questions:
+        cases = load_questions(args.questions)
+    else:
+        cases = [dict(case, id=str(i + 1)) for i, case in enumerate(test_cases)]
+
+    try:
+        if args.service:
+            engine = QueryServiceClient(args.service)
+        else:
+            from rag_engine import RAG_Engine
+            engine = RAG_Engine(args.pdf)
+    except Exception as e:
+        print(f"Failed to initialize: {e}")
+        return
+
+    print(f"--- Starting Batch Evaluation ({len(cases)} Questions, concurrency {args.concurrency}) ---")
+    config = run_config(engine, questions=args.questions or "evaluate.test_cases")
+    results, queried = asyncio.run(run_batch(engine, cases, args.checkpoint, args.concurrency, args.max_qps,
+                                             resume=args.resume, config=config))
+    print_summary(results)
+    save_results(results, args.output)
+    if not queried:
+        # Nothing new was measured; recording the replay would look like a fresh run to the regression gate
+        print("Every answer came from the checkpoint; not recording a run.")
+        return
+    record_run("batch", results, dict(config, concurrency=args.concurrency, max_qps=args.max_qps,
+                                      resumed=len(results) - queried))
+
+
+if __name__ == "__main__":
+    main()
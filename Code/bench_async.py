@@ -0,0 +1,68 @@
+"""
+Benchmarks RAG_Engine.query (sequential) against RAG_Engine.aquery (concurrent)
+using the local OpenRouter stand-in, so no API key or network is needed.
+
+    python bench_async.py --questions 50 --concurrency 25 --chat-latency 0.5
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from mock_openrouter import MockOpenRouter
+
+
+async def run_concurrent(engine, questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with semaphore:
+            return await engine.aquery(q)
+
+    return await asyncio.gather(*(one(q) for q in questions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs async query throughput against a local stub.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with MockOpenRouter(embedding_latency=args.embedding_latency, chat_latency=args.chat_latency) as mock, \
+            tempfile.TemporaryDirectory() as tmp:
+        # rag_engine reads its configuration at import time, so point it at the stub first
+        os.environ["OPENROUTER_API_BASE"] = mock.base_url
+        os.environ["OPENROUTER_API_KEY"] = "stub"
+        os.environ["RAG_EMBEDDING_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        from rag_engine import RAG_Engine
+        from evaluate import test_cases
+
+        engine = RAG_Engine(args.pdf, cache_dir=os.path.join(tmp, "index"))
+        base = [t["question"] for t in test_cases]
+        # Suffix each question so the embedding cache can't short-circuit repeats
+        questions = [f"{base[i % len(base)]} (#{i})" for i in range(args.questions)]
+
+        start = time.perf_counter()
+        for q in questions:
+            engine.query(q)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(run_concurrent(engine, questions, args.concurrency))
+        concurrent = time.perf_counter() - start
+
+    print("\n" + "=" * 40)
+    print("ASYNC QUERY BENCHMARK")
+    print("=" * 40)
+    print(f"Questions: {args.questions} | Concurrency: {args.concurrency} | Chat latency: {args.chat_latency:.2f}s")
+    print(f"Sequential query():  {sequential:.2f}s ({args.questions / sequential:.1f} q/s)")
+    print(f"Concurrent aquery(): {concurrent:.2f}s ({args.questions / concurrent:.1f} q/s)")
+    print(f"Speed-up: {sequential / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
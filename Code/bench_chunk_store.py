@@ -0,0 +1,134 @@
+"""
+Chunk text memory benchmark: LangChain's InMemoryDocstore (a Document object
+per chunk, what index.pkl used to hold) versus the compact, memory-mapped
+ChunkStore (chunk_store.py).
+
+Splits a PDF the way ingestion does, repeated `--copies` times to stand in for a
+larger corpus, and reports per chunk: the Python heap each store takes once
+loaded (tracemalloc), its size on disk, the memory-mapped bytes (page cache,
+shared between processes and reclaimable) and the time to materialize one
+Document. No embeddings or network are needed.
+
+    python bench_chunk_store.py
+    python bench_chunk_store.py --copies 50 --chunk-size 500 --chunk-overlap 150
+"""
+import os
+import time
+import uuid
+import pickle
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from chunk_store import CHUNK_FILES, ChunkStore, write_chunk_store
+
+
+def split_chunks(pdf_path, copies, chunk_size, chunk_overlap):
+    """(docstore id, text, metadata) for every chunk, as ingest_pipeline.run_pipeline produces them."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from langchain_core.documents import Document
+    from ingest_pipeline import iter_pages
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=True)
+    pages = list(iter_pages(pdf_path))
+    chunks = []
+    for copy in range(copies):
+        for page in pages:
+            source = page.metadata["source"] if copies == 1 else f"{page.metadata['source']}#{copy}"
+            doc = Document(page_content=page.page_content, metadata=dict(page.metadata, source=source))
+            chunks.extend((str(uuid.uuid4()), c.page_content, c.metadata) for c in splitter.split_documents([doc]))
+    return chunks
+
+
+def traced_bytes(load):
+    """Calls `load()` and returns (its result, the heap bytes still allocated by it)."""
+    tracemalloc.start()
+    try:
+        result = load()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+
+def lookup_us(docstore, ids, samples=2000, seed=0):
+    """Mean microseconds to materialize one Document by id."""
+    sample = random.Random(seed).choices(ids, k=samples)
+    start = time.perf_counter()
+    for doc_id in sample:
+        docstore.search(doc_id)
+    return (time.perf_counter() - start) / samples * 1e6
+
+
+def bench_docstore(chunks):
+    """The pre-chunk_store layout: an unpickled (InMemoryDocstore, index_to_docstore_id)."""
+    from langchain_core.documents import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    docstore = InMemoryDocstore({doc_id: Document(page_content=text, metadata=metadata)
+                                 for doc_id, text, metadata in chunks})
+    payload = pickle.dumps((docstore, {pos: doc_id for pos, (doc_id, _, _) in enumerate(chunks)}))
+    del docstore
+    # What load_index used to do: unpickle every Document into the heap
+    (loaded, _), heap = traced_bytes(lambda: pickle.loads(payload))
+    return {"heap": heap, "disk": len(payload), "mapped": 0,
+            "lookup_us": lookup_us(loaded, [doc_id for doc_id, _, _ in chunks])}
+
+
+def load_chunk_store(path):
+    """What load_index does now: the store, plus index_to_docstore_id sharing its id strings."""
+    store = ChunkStore(path)
+    return store, dict(enumerate(store.ids))
+
+
+def bench_chunk_store(chunks, tmp):
+    stats = write_chunk_store(tmp, chunks)
+    (store, _), heap = traced_bytes(lambda: load_chunk_store(tmp))
+    disk = sum(os.path.getsize(os.path.join(tmp, name)) for name in CHUNK_FILES)
+
+    # Same chunks back, text and metadata
+    for doc_id, text, metadata in chunks:
+        doc = store.search(doc_id)
+        if doc.page_content != text or doc.metadata != metadata:
+            raise AssertionError(f"Chunk {doc_id} did not round-trip")
+    return {"heap": heap, "disk": disk, "mapped": store.mapped_bytes(),
+            "lookup_us": lookup_us(store, store.ids)}, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per chunk: InMemoryDocstore vs the mmapped ChunkStore.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--copies", type=int, default=20, help="Times the document is repeated.")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    args = parser.parse_args()
+
+    chunks = split_chunks(args.pdf, args.copies, args.chunk_size, args.chunk_overlap)
+    if not chunks:
+        print(f"❌ No text found in {args.pdf}.")
+        return
+    n = len(chunks)
+    before = bench_docstore(chunks)
+    with tempfile.TemporaryDirectory() as tmp:
+        after, stats = bench_chunk_store(chunks, tmp)
+
+    print("\n" + "=" * 40)
+    print("CHUNK STORE MEMORY")
+    print("=" * 40)
+    print(f"{n} chunks ({args.copies} x {args.pdf}, size {args.chunk_size}, overlap {args.chunk_overlap}), "
+          f"{stats['text_bytes'] / n:.0f} bytes of UTF-8 text per chunk")
+    print(f"\n{'Store':<18}{'Heap/chunk':>12}{'Mapped/chunk':>14}{'Disk/chunk':>12}{'Heap total':>12}{'Lookup':>10}")
+    for name, r in (("InMemoryDocstore", before), ("ChunkStore", after)):
+        print(f"{name:<18}{r['heap'] / n:>10.0f} B{r['mapped'] / n:>12.0f} B{r['disk'] / n:>10.0f} B"
+              f"{r['heap'] / 2 ** 20:>9.1f} MB{r['lookup_us']:>8.1f}us")
+    print(f"\nOverlap shared once: text blob is {stats['stored_bytes'] / max(stats['text_bytes'], 1):.0%} of the "
+          f"chunk texts ({(stats['text_bytes'] - stats['stored_bytes']) / n:.0f} bytes saved per chunk).")
+    print(f"✅ Heap per chunk: {before['heap'] / n:.0f} B -> {after['heap'] / n:.0f} B "
+          f"({before['heap'] / max(after['heap'], 1):.1f}x less); mapped text is paged in on demand "
+          f"and shared by every process serving the index.")
+
+
+if __name__ == "__main__":
+    main()
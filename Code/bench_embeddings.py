@@ -0,0 +1,126 @@
+"""
+Compares embedding backends: remote OpenRouter vs a local sentence-transformers
+model on CPU (optionally int8 / ONNX).
+
+For each backend it reports ingest throughput (embedding every chunk of the
+PDF), single query-embedding latency, and throughput for concurrent query
+embeddings (where the local backend's dynamic batching kicks in). No embedding
+cache is used. The remote backend is the local OpenRouter stand-in with
+`--remote-latency` per request unless `--live` is given.
+
+    python bench_embeddings.py
+    python bench_embeddings.py --local-variants fp32,int8,onnx --threads 4 --copies 10
+    python bench_embeddings.py --live
+"""
+import time
+import asyncio
+import argparse
+
+from mock_openrouter import MockOpenRouter
+from calculate_latency import percentile
+
+LOCAL_VARIANTS = {
+    "fp32": {},
+    "int8": {"int8": True},
+    "onnx": {"onnx": True},
+    "onnx-int8": {"onnx": True, "int8": True},
+}
+
+
+def load_chunks(pdf_path, copies):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from rag_engine import CHUNK_SIZE, CHUNK_OVERLAP
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    texts = [d.page_content for d in splitter.split_documents(PyPDFLoader(pdf_path).load())]
+    # Suffixed copies, so every chunk is a distinct text
+    return [f"{text} [{copy}]" for copy in range(copies) for text in texts]
+
+
+async def concurrent_queries(embeddings, questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with semaphore:
+            return await embeddings.aembed_query(q)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    return time.perf_counter() - start
+
+
+def bench(name, embeddings, chunks, questions, concurrency):
+    # Warm-up: model load / connection set-up is not what we are measuring
+    embeddings.embed_query("warm up")
+
+    start = time.perf_counter()
+    embeddings.embed_documents(chunks)
+    ingest = time.perf_counter() - start
+
+    latencies = []
+    for q in questions:
+        start = time.perf_counter()
+        embeddings.embed_query(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    concurrent = asyncio.run(concurrent_queries(embeddings, [f"{q} (c)" for q in questions], concurrency))
+    embeddings.close()
+    return {
+        "backend": name,
+        "ingest_s": ingest,
+        "chunks_per_s": len(chunks) / ingest,
+        "query_p50": percentile(latencies, 50),
+        "query_p95": percentile(latencies, 95),
+        "concurrent_qps": len(questions) / concurrent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remote vs local embedding backend benchmark.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--copies", type=int, default=5, help="Copies of the PDF's chunks to ingest.")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads for the local model (0 = default).")
+    parser.add_argument("--local-variants", default="fp32,int8", help=f"Comma-separated: {', '.join(LOCAL_VARIANTS)}")
+    parser.add_argument("--remote-latency", type=float, default=0.15, help="Stand-in latency per embedding request.")
+    parser.add_argument("--live", action="store_true", help="Benchmark the real OpenRouter API instead of the stand-in.")
+    args = parser.parse_args()
+
+    from embeddings import OpenRouterEmbeddings, LocalEmbeddings
+    from evaluate import test_cases
+
+    chunks = load_chunks(args.pdf, args.copies)
+    base = [t["question"] for t in test_cases]
+    questions = [f"{base[i % len(base)]} (#{i})" for i in range(args.queries)]
+    print(f"Benchmarking with {len(chunks)} chunks and {len(questions)} queries...")
+
+    rows = []
+    if args.live:
+        from rag_engine import OPENROUTER_API_KEY, OPENROUTER_API_BASE, EMBEDDING_MODEL
+        remote = OpenRouterEmbeddings(model=EMBEDDING_MODEL, api_key=OPENROUTER_API_KEY, api_base=OPENROUTER_API_BASE)
+        rows.append(bench("openrouter (live)", remote, chunks, questions, args.concurrency))
+    else:
+        with MockOpenRouter(embedding_latency=args.remote_latency) as mock:
+            remote = OpenRouterEmbeddings(api_key="stub", api_base=mock.base_url)
+            rows.append(bench(f"openrouter (stub, {args.remote_latency * 1000:.0f}ms)", remote,
+                              chunks, questions, args.concurrency))
+
+    for variant in args.local_variants.split(","):
+        local = LocalEmbeddings(num_threads=args.threads, **LOCAL_VARIANTS[variant])
+        rows.append(bench(f"local {variant}", local, chunks, questions, args.concurrency))
+
+    print("\n" + "=" * 40)
+    print("EMBEDDING BACKEND BENCHMARK")
+    print("=" * 40)
+    print(f"{'Backend':<28}{'Ingest':>9}{'Chunks/s':>10}{'Query p50':>11}{'Query p95':>11}{'Conc. q/s':>11}")
+    for r in rows:
+        print(f"{r['backend']:<28}{r['ingest_s']:>8.2f}s{r['chunks_per_s']:>10.1f}{r['query_p50']:>9.1f}ms"
+              f"{r['query_p95']:>9.1f}ms{r['concurrent_qps']:>11.1f}")
+    print("\nNote: local models produce different vectors, so switching backends needs a re-ingest "
+          "(index keys include the model name).")
+
+
+if __name__ == "__main__":
+    main()
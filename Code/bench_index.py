@@ -0,0 +1,159 @@
+"""
+Index type benchmark: memory, search latency and recall@k of each FAISS index
+type (and optional dimension truncation) against the exact flat baseline.
+
+Uses synthetic low-rank, clustered vectors shaped like ada embeddings by
+default, or real ones saved as a .npy matrix (`--vectors`). Queries are noisy
+copies of corpus vectors. Each row reports recall against two ground truths:
+an exact flat search at full dimension (what truncation plus the index type
+costs together) and an exact flat search at the row's own dimension (what the
+index type alone costs).
+
+    python bench_index.py --num-vectors 200000
+    python bench_index.py --types flat,ivf,pq --dims 1536,768 --nprobe 8,32
+    python bench_index.py --vectors corpus_vectors.npy --types hnsw --ef-search 32,64,128
+"""
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from index_store import INDEX_TYPES, index_factory_string, configure_search, index_memory_bytes
+from calculate_latency import percentile
+
+
+def synthetic_vectors(n, dim, num_queries, rank=64, clusters=256, seed=0):
+    """
+    (corpus, queries) as unit vectors from a low-rank model, roughly like real
+    text embeddings: points around cluster centres in a `rank`-dimensional
+    space with a decaying spectrum, mapped into `dim` dimensions plus a little
+    isotropic noise. Neighbourhoods live in the low-rank part, so truncation
+    degrades them gradually, as it does for real embeddings; structureless
+    Gaussian vectors would lose them at any truncation.
+    """
+    rng = np.random.default_rng(seed)
+    spectrum = (1.0 / np.sqrt(np.arange(1, rank + 1))).astype(np.float32)
+    basis = rng.standard_normal((rank, dim)).astype(np.float32)
+    centres = rng.standard_normal((clusters, rank)).astype(np.float32)
+    latent = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, rank)).astype(np.float32)
+    query_latent = latent[rng.integers(0, n, num_queries)] + \
+        0.1 * rng.standard_normal((num_queries, rank)).astype(np.float32)
+
+    def embed(points):
+        vectors = (points * spectrum) @ basis + 0.1 * rng.standard_normal((len(points), dim)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    return embed(latent), embed(query_latent)
+
+
+def exact_neighbours(corpus, queries, k):
+    exact = faiss.IndexFlatL2(corpus.shape[1])
+    exact.add(corpus)
+    return exact.search(queries, k)[1]
+
+
+def truncate(vectors, dim):
+    head = np.ascontiguousarray(vectors[:, :dim])
+    faiss.normalize_L2(head)
+    return head
+
+
+def search_params(index_type, args):
+    """The nprobe / efSearch values to sweep for an index type."""
+    if index_type in ("ivf", "pq"):
+        return [("nprobe", n) for n in args.nprobe]
+    if index_type == "hnsw":
+        return [("efSearch", ef) for ef in args.ef_search]
+    return [(None, None)]
+
+
+def bench_config(index_type, dim, corpus, queries, truth, args):
+    """Rows for one index type at one dimension; `truth` is the full-dimension exact top k."""
+    vectors, query_vectors = truncate(corpus, dim), truncate(queries, dim)
+    dim_truth = truth if dim == corpus.shape[1] else exact_neighbours(vectors, query_vectors, args.k)
+    spec = index_factory_string(index_type, dim, len(vectors))
+    start = time.perf_counter()
+    index = faiss.index_factory(dim, spec)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    build = time.perf_counter() - start
+    memory = index_memory_bytes(index)
+
+    rows = []
+    for param, value in search_params(index_type, args):
+        if param == "nprobe":
+            configure_search(index, nprobe=value)
+        elif param == "efSearch":
+            configure_search(index, ef_search=value)
+        latencies, hits, dim_hits = [], 0, 0
+        for i in range(len(query_vectors)):
+            t = time.perf_counter()
+            _, found = index.search(query_vectors[i:i + 1], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            hits += len(set(found[0]) & set(truth[i]))
+            dim_hits += len(set(found[0]) & set(dim_truth[i]))
+        rows.append({
+            "config": f"{index_type} ({spec})" + (f" {param}={value}" if param else ""),
+            "dim": dim,
+            "memory_mb": memory / 2 ** 20,
+            "build_s": build,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "recall": hits / (len(query_vectors) * args.k),
+            "dim_recall": dim_hits / (len(query_vectors) * args.k),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory / latency / recall@k of FAISS index types vs flat.")
+    parser.add_argument("--vectors", help="Corpus vectors as a .npy matrix (default: synthetic).")
+    parser.add_argument("--num-vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536, help="Synthetic vector size (ada-002 is 1536).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3, help="Recall@k (the engine retrieves 3 chunks).")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types.")
+    parser.add_argument("--dims", default="", help="Comma-separated truncated sizes to add, e.g. 768,512.")
+    parser.add_argument("--nprobe", default="16", help="Comma-separated nprobe values for ivf / pq.")
+    parser.add_argument("--ef-search", default="64", help="Comma-separated efSearch values for hnsw.")
+    args = parser.parse_args()
+    args.nprobe = [int(n) for n in args.nprobe.split(",")]
+    args.ef_search = [int(n) for n in args.ef_search.split(",")]
+
+    if args.vectors:
+        corpus = np.ascontiguousarray(np.load(args.vectors).astype(np.float32))
+        faiss.normalize_L2(corpus)
+        rng = np.random.default_rng(1)
+        queries = corpus[rng.integers(0, len(corpus), args.queries)] + \
+            0.3 * rng.standard_normal((args.queries, corpus.shape[1])).astype(np.float32)
+        faiss.normalize_L2(queries)
+    else:
+        corpus, queries = synthetic_vectors(args.num_vectors, args.dim, args.queries)
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} ({args.vectors or 'synthetic low-rank'}) | "
+          f"{args.queries} queries | recall@{args.k}")
+    truth = exact_neighbours(corpus, queries, args.k)
+
+    dims = [corpus.shape[1]] + [int(d) for d in args.dims.split(",") if d]
+    rows = []
+    for dim in dims:
+        for index_type in args.types.split(","):
+            rows.extend(bench_config(index_type, dim, corpus, queries, truth, args))
+            print(f"  done: {index_type} @ {dim}d")
+
+    print("\n" + "=" * 40)
+    print("INDEX TYPE BENCHMARK (vs exact flat)")
+    print("=" * 40)
+    print(f"Recall vs full: against exact flat at {corpus.shape[1]}d; "
+          f"vs same-dim: against exact flat at the row's dimension")
+    print(f"{'Config':<40}{'Dim':>6}{'Memory':>11}{'Build':>9}{'p50':>9}{'p95':>9}"
+          f"{'Recall vs full':>16}{'vs same-dim':>13}")
+    for r in rows:
+        print(f"{r['config']:<40}{r['dim']:>6}{r['memory_mb']:>9.1f}MB{r['build_s']:>8.1f}s"
+              f"{r['p50_ms']:>7.2f}ms{r['p95_ms']:>7.2f}ms{r['recall']:>16.3f}{r['dim_recall']:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
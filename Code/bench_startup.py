@@ -0,0 +1,121 @@
+"""
+Cold-start benchmark: import time of the entry-point modules and
+time-to-first-answer of a fresh process.
+
+Each measurement runs in a new interpreter so nothing is already imported or
+cached. Time-to-first-answer runs against the local OpenRouter stand-in
+(mock_openrouter.py) with a prebuilt index, i.e. what a restarted Streamlit or
+query-service worker pays before it can answer.
+
+    python bench_startup.py
+    python bench_startup.py --repeat 5 --max-import-ms 300 --max-first-answer-s 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from mock_openrouter import MockOpenRouter
+
+ENTRY_MODULES = "rag_engine,evaluate,query_client,ingest"
+# Modules that should only be imported once something actually needs them
+HEAVY_MODULES = ("streamlit", "langchain_community", "langchain_openai", "langchain_classic",
+                 "langchain_text_splitters", "faiss", "numpy", "torch", "sentence_transformers", "pypdf")
+
+IMPORT_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+FIRST_ANSWER_PROBE = """
+import time, json
+start = time.perf_counter()
+from rag_engine import RAG_Engine
+imported = time.perf_counter()
+engine = RAG_Engine({pdf!r}, build_if_missing={build!r}, use_answer_cache=False)
+constructed = time.perf_counter()
+answer = engine.query("What is the budget for Project Nova?")
+answered = time.perf_counter()
+print(json.dumps({{"import": imported - start, "construct": constructed - imported,
+                   "first_query": answered - constructed, "total": answered - start,
+                   "error": answer.startswith("Error occurred during query")}}))
+"""
+
+
+def run_probe(code, env=None):
+    """Runs `code` in a fresh interpreter from this directory and returns its JSON output."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", code], cwd=here, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(modules, repeat):
+    rows = []
+    for module in modules:
+        runs = [run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)) for _ in range(repeat)]
+        rows.append({"module": module, "ms": min(r["seconds"] for r in runs) * 1000, "heavy": runs[0]["heavy"]})
+    return rows
+
+
+def bench_first_answer(pdf, repeat):
+    with MockOpenRouter() as mock, tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OPENROUTER_API_BASE=mock.base_url, OPENROUTER_API_KEY="stub",
+                   RAG_INDEX_CACHE_DIR=os.path.join(tmp, "index"),
+                   RAG_EMBEDDING_CACHE_PATH=os.path.join(tmp, "embedding_cache.sqlite"),
+                   RAG_TRACE_PATH=os.path.join(tmp, "traces.jsonl"))
+        env.pop("RAG_QUERY_SERVICE_URL", None)
+        # Build the index once, untimed; the measured runs load it like a restarted worker
+        run_probe(FIRST_ANSWER_PROBE.format(pdf=pdf, build=True), env)
+        runs = [run_probe(FIRST_ANSWER_PROBE.format(pdf=pdf, build=False), env) for _ in range(repeat)]
+    return min(runs, key=lambda r: r["total"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time-to-first-answer of a fresh process.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--modules", default=ENTRY_MODULES, help="Comma-separated modules to time.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported).")
+    parser.add_argument("--skip-first-answer", action="store_true")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if any module takes longer to import.")
+    parser.add_argument("--max-first-answer-s", type=float, help="Fail if time-to-first-answer is longer.")
+    args = parser.parse_args()
+
+    failures = []
+    print("=" * 40)
+    print("IMPORT TIME (fresh interpreter)")
+    print("=" * 40)
+    print(f"{'Module':<16}{'Import':>10}  Heavy modules loaded")
+    for row in bench_imports(args.modules.split(","), args.repeat):
+        print(f"{row['module']:<16}{row['ms']:>8.0f}ms  {', '.join(row['heavy']) or '-'}")
+        if args.max_import_ms is not None and row["ms"] > args.max_import_ms:
+            failures.append(f"import {row['module']} took {row['ms']:.0f}ms (budget {args.max_import_ms:.0f}ms)")
+
+    if not args.skip_first_answer:
+        result = bench_first_answer(args.pdf, args.repeat)
+        print("\n" + "=" * 40)
+        print("TIME TO FIRST ANSWER (prebuilt index, mock API)")
+        print("=" * 40)
+        print(f"Import: {result['import']:.2f}s | Construct: {result['construct']:.2f}s | "
+              f"First query: {result['first_query']:.2f}s | Total: {result['total']:.2f}s")
+        if result["error"]:
+            failures.append("the first query returned an error")
+        if args.max_first_answer_s is not None and result["total"] > args.max_first_answer_s:
+            failures.append(f"first answer took {result['total']:.2f}s (budget {args.max_first_answer_s:.2f}s)")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("\n✅ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
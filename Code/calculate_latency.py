@@ -1,29 +1,134 @@
+"""
+Per-stage latency report.
+
+Reads the span records written by telemetry.py (default: query_spans.jsonl)
+and prints p50/p95/p99 latency for every pipeline stage, with the mean token
+count and bytes sent where the stage records them. An evaluation CSV
+(evaluation_results.csv) can be passed instead; its "Time" column is reported
+as the end-to-end `query` stage.
+
+    python calculate_latency.py
+    python calculate_latency.py query_spans.jsonl
+    python calculate_latency.py evaluation_results.csv
+
+Runs are also kept over time: see run_history.py to compare two of them.
+"""
+import os
+import sys
 import csv
+import json
 import statistics
+from collections import defaultdict
+
+DEFAULT_SPANS_FILE = "query_spans.jsonl"
+DEFAULT_CSV_FILE = "evaluation_results.csv"
+# Per-span numeric attributes averaged into the report
+EXTRA_FIELDS = ("tokens", "prompt_tokens", "completion_tokens", "bytes_sent", "tokens_saved")
+STAGE_ORDER = ["query", "lexical_search", "embed_query", "vector_search", "rank_fusion", "abstain", "prompt_assembly", "llm_first_token", "llm_completion"]
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile (p in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
 
-filename = "evaluation_results.csv"
 
-try:
-    times = []
+def load_spans(filename):
+    """Returns {stage: [span record, ...]} from a spans JSONL file."""
+    stages = defaultdict(list)
     with open(filename, "r") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Extract time string like "2.50s" -> float 2.50
-            time_str = row["Time"].replace("s", "")
-            times.append(float(time_str))
-
-    if not times:
-        print("No data found in evaluation_results.csv")
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                stages[record["span"]].append(record)
+    return stages
+
+
+def load_csv_times(filename):
+    """Returns {"query": [records]} from an evaluation CSV's "Time" column."""
+    records = []
+    with open(filename, "r") as f:
+        for row in csv.DictReader(f):
+            # Extract time string like "2.50s" -> 2500 ms
+            records.append({"duration_ms": float(row["Time"].replace("s", "")) * 1000})
+    return {"query": records}
+
+
+def stage_summary(records):
+    durations = [r["duration_ms"] for r in records]
+    summary = {
+        "count": len(durations),
+        "mean": statistics.mean(durations),
+        "p50": percentile(durations, 50),
+        "p95": percentile(durations, 95),
+        "p99": percentile(durations, 99),
+        "max": max(durations),
+    }
+    for field in EXTRA_FIELDS:
+        values = [r[field] for r in records if isinstance(r.get(field), (int, float))]
+        if values:
+            summary[field] = statistics.mean(values)
+    return summary
+
+
+def summarize(stages):
+    ordered = [s for s in STAGE_ORDER if s in stages] + sorted(s for s in stages if s not in STAGE_ORDER)
+    return {stage: stage_summary(stages[stage]) for stage in ordered if stages[stage]}
+
+
+def print_report(summaries):
+    header = f"{'Stage':<18}{'Count':>7}{'Mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'Max':>10}  Extra"
+    print(header)
+    print("-" * len(header))
+    for stage, s in summaries.items():
+        extra = ", ".join(
+            f"{field}={s[field]:.0f}" for field in EXTRA_FIELDS
+            if field in s
+        )
+        print(f"{stage:<18}{s['count']:>7}{s['mean']:>8.0f}ms{s['p50']:>8.0f}ms{s['p95']:>8.0f}ms"
+              f"{s['p99']:>8.0f}ms{s['max']:>8.0f}ms  {extra}")
+
+
+def print_outcomes(stages):
+    """Share of queries by how they were answered, and the hedge / timeout rates."""
+    queries = [r for r in stages.get("query", []) if "llm_outcome" in r]
+    if not queries:
+        return
+    outcomes = defaultdict(int)
+    for r in queries:
+        outcomes[r["llm_outcome"]] += 1
+    print(f"\nLLM outcomes over {len(queries)} generated answers: "
+          + ", ".join(f"{name} {count / len(queries):.1%}" for name, count in sorted(outcomes.items())))
+    print(f"Hedged: {sum(bool(r.get('hedged')) for r in queries) / len(queries):.1%} | "
+          f"Failed over: {sum(bool(r.get('failed_over')) for r in queries) / len(queries):.1%} | "
+          f"Deadline exceeded: {sum(bool(r.get('timed_out')) for r in queries) / len(queries):.1%}")
+
+
+def main():
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
     else:
-        min_lat = min(times)
-        max_lat = max(times)
-        mean_lat = statistics.mean(times)
-        median_lat = statistics.median(times)
-
-        print(f"Minimum latency: {min_lat:.2f}s")
-        print(f"Maximum latency: {max_lat:.2f}s")
-        print(f"Mean latency: {mean_lat:.2f}s")
-        print(f"Median latency: {median_lat:.2f}s")
-
-except FileNotFoundError:
-    print(f"File {filename} not found.")
+        filename = DEFAULT_SPANS_FILE if os.path.exists(DEFAULT_SPANS_FILE) else DEFAULT_CSV_FILE
+
+    try:
+        stages = load_csv_times(filename) if filename.endswith(".csv") else load_spans(filename)
+    except FileNotFoundError:
+        print(f"File {filename} not found.")
+        return
+
+    summaries = summarize(stages)
+    if not summaries:
+        print(f"No data found in {filename}")
+        return
+    print(f"Latency report for {filename} (milliseconds)\n")
+    print_report(summaries)
+    print_outcomes(stages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Calibrates RAG_ABSTAIN_THRESHOLD from the evaluate.py test cases.
+
+Scores every question by the relevance of its best vector match, then picks the
+threshold that lets the most "Negative" (unanswerable) questions abstain
+without an LLM call while abstaining on at most `--max-false-abstain` of the
+"Positive" ones. Unless `--skip-llm`, the would-be-abstained questions are also
+run through the full pipeline once to measure the LLM calls and time saved.
+
+    python calibrate_threshold.py
+    python calibrate_threshold.py --max-false-abstain 0.05 --margin 0.01
+"""
+import argparse
+
+from evaluate import test_cases, looks_like_abstain
+
+
+def choose_threshold(scored, max_false_abstain=0.0):
+    """
+    `scored` is [(score, is_negative)]. Returns (threshold, negatives caught,
+    positives abstained) for the best midpoint between adjacent scores, or
+    (0.0, 0, 0) when no negative can abstain within the allowed false abstains.
+    """
+    positives = sum(1 for _, negative in scored if not negative)
+    allowed = int(max_false_abstain * positives)
+    scores = sorted({score for score, _ in scored})
+    best = (0.0, 0, 0)
+    for low, high in zip(scores, scores[1:]):
+        threshold = (low + high) / 2
+        caught = sum(1 for score, negative in scored if negative and score < threshold)
+        false_abstains = sum(1 for score, negative in scored if not negative and score < threshold)
+        if false_abstains <= allowed and (caught, -false_abstains) > (best[1], -best[2]):
+            best = (threshold, caught, false_abstains)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick an abstain threshold from the evaluation test cases.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--max-false-abstain", type=float, default=0.0,
+                        help="Fraction of answerable questions allowed to abstain.")
+    parser.add_argument("--margin", type=float, default=0.0,
+                        help="Subtracted from the chosen threshold to leave room for unseen questions.")
+    parser.add_argument("--skip-llm", action="store_true", help="Only score retrieval; don't measure savings.")
+    args = parser.parse_args()
+
+    from rag_engine import RAG_Engine
+    engine = RAG_Engine(args.pdf, use_answer_cache=False, abstain_threshold=0)
+
+    rows = []
+    for test in test_cases:
+        score = engine.retrieval_score(test["question"])
+        rows.append({"test": test, "score": score, "negative": test.get("behavior") == "ABSTAIN"})
+
+    threshold, caught, false_abstains = choose_threshold([(r["score"], r["negative"]) for r in rows],
+                                                         args.max_false_abstain)
+    if threshold:
+        threshold = max(0.0, threshold - args.margin)
+    negatives = sum(r["negative"] for r in rows)
+
+    print("\n" + "=" * 40)
+    print("RETRIEVAL SCORES (best match, cosine)")
+    print("=" * 40)
+    for r in sorted(rows, key=lambda r: r["score"]):
+        abstains = threshold and r["score"] < threshold
+        print(f"{r['score']:>7.3f}  {'ABSTAIN' if abstains else 'answer ':<8} "
+              f"({r['test']['type']}) {r['test']['question']}")
+
+    if not threshold:
+        print("\n❌ No threshold separates any unanswerable question from the answerable ones; "
+              "leave RAG_ABSTAIN_THRESHOLD unset.")
+        return
+
+    print(f"\nThreshold {threshold:.3f}: {caught}/{negatives} unanswerable questions abstain without the LLM, "
+          f"{false_abstains}/{len(rows) - negatives} answerable ones would abstain wrongly.")
+
+    if not args.skip_llm:
+        # What the abstained questions cost today: one full generation each
+        saved, already_abstained = [], 0
+        for r in rows:
+            if r["score"] >= threshold:
+                continue
+            answer, timings = engine.timed_query(r["test"]["question"])
+            saved.append(timings.get("total", 0.0) - timings.get("retrieval", 0.0))
+            already_abstained += looks_like_abstain(answer)
+        if saved:
+            print(f"LLM calls saved: {len(saved)}/{len(rows)} ({len(saved) / len(rows) * 100:.0f}% of this set)")
+            print(f"Latency saved: {sum(saved):.2f}s total, {sum(saved) / len(saved):.2f}s per abstained question")
+            print(f"The LLM itself abstained on {already_abstained}/{len(saved)} of them.")
+
+    print(f"\n✅ Use it with:\nexport RAG_ABSTAIN_THRESHOLD={threshold:.3f}")
+    if negatives < 10:
+        print(f"(Calibrated on only {negatives} unanswerable questions; add more negative cases for a "
+              f"tighter estimate, or use --margin.)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Compact, memory-mapped storage for chunk texts, in place of LangChain's pickled
+InMemoryDocstore (a Document object per chunk, held for the life of the process).
+
+All chunk texts of an index live in one UTF-8 blob (chunks.txt). Consecutive
+chunks of the same page overlap by up to `chunk_overlap` characters; the
+overlap is stored once and both chunks point into it. Each chunk is an
+(offset, length, metadata row, start index) record in flat arrays
+(chunks.idx), and metadata shared by a page's chunks is stored once
+(chunks.json). The blob and the records are memory-mapped, so text stays in the
+page cache (shared by every process serving the index) instead of the heap,
+and a Document is built only for the chunks a search actually returns.
+"""
+import os
+import json
+import mmap
+from array import array
+
+CHUNK_TEXT_FILE = "chunks.txt"
+CHUNK_RECORDS_FILE = "chunks.idx"
+CHUNK_META_FILE = "chunks.json"
+CHUNK_FILES = (CHUNK_TEXT_FILE, CHUNK_RECORDS_FILE, CHUNK_META_FILE)
+# Start index of chunks whose metadata has none
+NO_START_INDEX = -(2 ** 63)
+
+
+def write_chunk_store(path, chunks):
+    """
+    Writes `chunks`, an iterable of (docstore id, text, metadata) in index
+    order, to the chunk files in `path`. Returns {"chunks", "text_bytes",
+    "stored_bytes"}: the UTF-8 size of every chunk, and what the blob takes
+    after overlaps are shared.
+    """
+    ids, metadatas, meta_rows = [], [], {}
+    starts, offsets, lengths, rows = array("q"), array("Q"), array("I"), array("I")
+    text_bytes = written = 0
+    # The last chunk written that reached the end of the blob, for sharing overlaps with the next one
+    tail_text, tail_start, tail_row = "", None, None
+
+    with open(os.path.join(path, CHUNK_TEXT_FILE), "wb") as blob:
+        for doc_id, text, metadata in chunks:
+            metadata = dict(metadata)
+            start = metadata.pop("start_index", None)
+            key = json.dumps(metadata, sort_keys=True, default=str)
+            row = meta_rows.get(key)
+            if row is None:
+                row = meta_rows[key] = len(metadatas)
+                metadatas.append(metadata)
+            encoded_length = len(text.encode("utf-8"))
+            text_bytes += encoded_length
+
+            # Shares the overlap when this chunk starts inside the previous one on the same page
+            shared = (row == tail_row and tail_start is not None and start is not None
+                      and tail_start <= start <= tail_start + len(tail_text))
+            if shared:
+                rel = start - tail_start
+                overlap = min(len(tail_text) - rel, len(text))
+                shared = tail_text[rel:rel + overlap] == text[:overlap]
+            if shared:
+                offset = written - len(tail_text[rel:].encode("utf-8"))
+                if overlap < len(text):
+                    written += blob.write(text[overlap:].encode("utf-8"))
+                    tail_text, tail_start = text, start
+            else:
+                offset = written
+                written += blob.write(text.encode("utf-8"))
+                tail_text, tail_row = text, row
+                tail_start = start if start is not None and start >= 0 else None
+
+            ids.append(doc_id)
+            starts.append(NO_START_INDEX if start is None else start)
+            offsets.append(offset)
+            lengths.append(encoded_length)
+            rows.append(row)
+
+    # 8-byte arrays first keeps every array aligned in the mapped file
+    with open(os.path.join(path, CHUNK_RECORDS_FILE), "wb") as f:
+        for values in (starts, offsets, lengths, rows):
+            values.tofile(f)
+    with open(os.path.join(path, CHUNK_META_FILE), "w") as f:
+        json.dump({"ids": ids, "metadata": metadatas}, f)
+    return {"chunks": len(ids), "text_bytes": text_bytes, "stored_bytes": written}
+
+
+def _map(path):
+    """Read-only mapping of a file (empty bytes for an empty file, which can't be mapped)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    """
+    Docstore over the files written by write_chunk_store, with the interface
+    LangChain's FAISS uses (search / add / delete). Chunks added after loading
+    are kept as Documents until the index is saved again.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, CHUNK_META_FILE)) as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self._metadatas = meta["metadata"]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._added = {}
+        self._text = _map(os.path.join(path, CHUNK_TEXT_FILE))
+        self._records = _map(os.path.join(path, CHUNK_RECORDS_FILE))
+
+        n = len(self.ids)
+        self._view = memoryview(self._records)
+        self._starts = self._view[:8 * n].cast("q")
+        self._offsets = self._view[8 * n:16 * n].cast("Q")
+        self._lengths = self._view[16 * n:20 * n].cast("I")
+        self._meta_rows = self._view[20 * n:24 * n].cast("I")
+        _register_docstore()
+
+    def close(self):
+        """Unmaps the files, so they can be replaced or removed (Windows refuses while they are mapped)."""
+        for view in (self._starts, self._offsets, self._lengths, self._meta_rows, self._view):
+            view.release()
+        for mapped in (self._text, self._records):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+    def __len__(self):
+        return len(self._rows) + len(self._added)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._rows or doc_id in self._added
+
+    def mapped_bytes(self):
+        """Size of the memory-mapped text blob and records."""
+        return len(self._text) + len(self._records)
+
+    def text(self, doc_id):
+        """A chunk's text without building a Document, or None if the id is unknown."""
+        row = self._rows.get(doc_id)
+        if row is None:
+            doc = self._added.get(doc_id)
+            return doc.page_content if doc is not None else None
+        offset = self._offsets[row]
+        return self._text[offset:offset + self._lengths[row]].decode("utf-8")
+
+    def search(self, search):
+        """The Document for an id, or a "not found" string, like InMemoryDocstore."""
+        from langchain_core.documents import Document
+
+        row = self._rows.get(search)
+        if row is None:
+            return self._added.get(search, f"ID {search} not found.")
+        metadata = dict(self._metadatas[self._meta_rows[row]])
+        if self._starts[row] != NO_START_INDEX:
+            metadata["start_index"] = self._starts[row]
+        return Document(page_content=self.text(search), metadata=metadata)
+
+    def add(self, texts):
+        overlapping = [doc_id for doc_id in texts if doc_id in self]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids):
+        missing = [doc_id for doc_id in ids if doc_id not in self]
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+        for doc_id in ids:
+            if self._rows.pop(doc_id, None) is None:
+                del self._added[doc_id]
+
+
+def _register_docstore():
+    """LangChain's FAISS only adds to docstores that are Docstore / AddableMixin instances."""
+    from langchain_community.docstore.base import AddableMixin, Docstore
+
+    Docstore.register(ChunkStore)
+    AddableMixin.register(ChunkStore)
@@ -0,0 +1,181 @@
+"""
+Context assembly between retrieval and the prompt.
+
+Retrieved chunks overlap (CHUNK_OVERLAP characters of shared text between
+neighbours) and often repeat each other, which the stuff-documents prompt paid
+for in tokens on every query. `assemble_context`:
+
+1. merges chunks from the same page that overlap or touch into one passage,
+2. drops sentences that nearly duplicate one already in the context,
+3. fits what is left into a token budget, best-ranked passages first.
+"""
+import os
+import re
+from typing import List
+
+from telemetry import count_tokens
+
+# --- Configuration ---
+# 0 disables the budget (merging and de-duplication still apply)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+# Word-set Jaccard similarity at which a sentence counts as a repeat
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("RAG_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Shorter shared text isn't treated as chunk overlap
+MIN_OVERLAP_CHARS = 20
+# Sentences this short ("Yes.", headings) are never de-duplicated
+MIN_SENTENCE_WORDS = 4
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+LINE_BREAK = re.compile(r"\n+")
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if under MIN_OVERLAP_CHARS)."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    i = a.find(probe, max(0, len(a) - len(b)))
+    while i != -1:
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i = a.find(probe, i + 1)
+    return 0
+
+
+def _merge_pair(a, b):
+    """Merged text of two chunks from the same page, or None if they don't overlap or touch."""
+    start_a, start_b = a.metadata.get("start_index"), b.metadata.get("start_index")
+    if start_a is not None and start_b is not None:
+        if start_b < start_a:
+            a, b, start_a, start_b = b, a, start_b, start_a
+        end_a = start_a + len(a.page_content)
+        if start_b > end_a:
+            return None
+        return a.page_content + b.page_content[end_a - start_b:]
+    # Indexes built without start_index: fall back to finding the shared text
+    if b.page_content in a.page_content:
+        return a.page_content
+    if a.page_content in b.page_content:
+        return b.page_content
+    overlap = _overlap(a.page_content, b.page_content)
+    if overlap:
+        return a.page_content + b.page_content[overlap:]
+    overlap = _overlap(b.page_content, a.page_content)
+    if overlap:
+        return b.page_content + a.page_content[overlap:]
+    return None
+
+
+def merge_chunks(docs) -> List[dict]:
+    """
+    Merges overlapping / adjacent chunks of the same page. Returns passages
+    ({"page", "doc", "merged"}) in the rank of their best chunk.
+    """
+    passages = []
+    for doc in docs:
+        page = (doc.metadata.get("source"), doc.metadata.get("page"))
+        for passage in passages:
+            if passage["page"] != page:
+                continue
+            merged = _merge_pair(passage["doc"], doc)
+            if merged is not None:
+                metadata = dict(passage["doc"].metadata)
+                starts = [metadata.get("start_index"), doc.metadata.get("start_index")]
+                if None not in starts:
+                    metadata["start_index"] = min(starts)
+                passage["doc"] = type(doc)(page_content=merged, metadata=metadata)
+                passage["merged"] += 1
+                break
+        else:
+            passages.append({"page": page, "doc": doc, "merged": 0})
+    return passages
+
+
+def _lines(text: str) -> List[List[str]]:
+    """Sentences of `text`, grouped by the line they sit on (list items and table rows stay apart)."""
+    return [SENTENCE_BOUNDARY.split(line) for line in LINE_BREAK.split(text)]
+
+
+def _join(lines: List[List[str]]) -> str:
+    """Inverse of `_lines`: sentences of a line joined with a space, lines with a newline."""
+    return "\n".join(" ".join(line) for line in lines if line)
+
+
+def _words(sentence: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", sentence.lower()))
+
+
+def dedupe_sentences(texts: List[str], threshold: float = NEAR_DUPLICATE_THRESHOLD):
+    """Removes sentences that nearly repeat an earlier one. Returns (texts, sentences dropped)."""
+    seen, dropped, result = [], 0, []
+    for text in texts:
+        kept = []
+        for line in _lines(text):
+            kept.append([])
+            for sentence in line:
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                words = _words(sentence)
+                if len(words) >= MIN_SENTENCE_WORDS:
+                    if any(len(words & other) / len(words | other) >= threshold for other in seen):
+                        dropped += 1
+                        continue
+                    seen.append(words)
+                kept[-1].append(sentence)
+        result.append(_join(kept))
+    return [t for t in result if t], dropped
+
+
+def fit_budget(texts: List[str], budget: int) -> List[str]:
+    """Keeps passages in order until `budget` tokens; the one that crosses it is cut at a sentence."""
+    if budget <= 0:
+        return texts
+    fitted, used = [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if used + tokens <= budget:
+            fitted.append(text)
+            used += tokens
+            continue
+        partial, full = [], False
+        for line in _lines(text):
+            partial.append([])
+            for sentence in line:
+                cost = count_tokens(sentence)
+                if used + cost > budget:
+                    full = True
+                    break
+                partial[-1].append(sentence)
+                used += cost
+            if full:
+                break
+        partial = _join(partial)
+        if partial:
+            fitted.append(partial)
+        break
+    return fitted
+
+
+def assemble_context(docs, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Builds the prompt context from retrieved documents (best first).
+    Returns (context, stats) with the token counts before and after.
+    """
+    naive = "\n\n".join(doc.page_content for doc in docs)
+    passages = merge_chunks(docs)
+    texts, dropped = dedupe_sentences([p["doc"].page_content for p in passages])
+    texts = fit_budget(texts, budget)
+    context = "\n\n".join(texts)
+
+    tokens_before, tokens_after = count_tokens(naive), count_tokens(context)
+    stats = {
+        "chunks_in": len(docs),
+        "passages": len(texts),
+        "chunks_merged": sum(p["merged"] for p in passages),
+        "sentences_dropped": dropped,
+        "context_tokens_before": tokens_before,
+        "context_tokens": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
+    return context, stats
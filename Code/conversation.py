@@ -0,0 +1,126 @@
+"""
+Bounded per-session conversation history.
+
+The last `window` messages are kept verbatim. Older turns are compacted into a
+short extractive summary (each question with the first sentence of its answer),
+trimmed to a token budget, so a session's memory and the history sent to the
+LLM stay bounded no matter how long the chat runs. `max_chars` caps everything
+a session holds; past it, turns are compacted early.
+"""
+import os
+import re
+from collections import deque
+
+from telemetry import count_tokens
+
+# --- Configuration ---
+# Messages (user and assistant) kept verbatim
+HISTORY_WINDOW = int(os.getenv("RAG_HISTORY_WINDOW", "8"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("RAG_HISTORY_SUMMARY_TOKENS", "200"))
+# Characters one session may hold across its messages and summary
+HISTORY_MAX_CHARS = int(os.getenv("RAG_HISTORY_MAX_CHARS", "32000"))
+# History included in the prompt for follow-up questions
+HISTORY_PROMPT_TOKENS = int(os.getenv("RAG_HISTORY_PROMPT_TOKENS", "400"))
+# Short questions with a follow-up marker are retrieved together with the previous question
+FOLLOW_UP_MAX_WORDS = 8
+
+FIRST_SENTENCE = re.compile(r"(.+?[.!?])(\s|$)", re.S)
+# Pronouns pointing back at the previous turn, a leading "and"/"what about", or an ellipsis
+FOLLOW_UP_MARKERS = re.compile(
+    r"\b(it|its|they|them|their|theirs|that|this|those|these|he|she|him|his|her|there)\b"
+    r"|^\s*(and|also|but|so|what about|how about)\b|\.\.\.|…", re.I)
+
+
+def _first_sentence(text: str, limit: int = 200) -> str:
+    text = " ".join(text.split())
+    match = FIRST_SENTENCE.match(text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit - 1] + "…"
+
+
+class ConversationHistory:
+    """Recent messages verbatim plus a compacted summary of everything older."""
+
+    def __init__(self, window: int = HISTORY_WINDOW, summary_tokens: int = HISTORY_SUMMARY_TOKENS,
+                 max_chars: int = HISTORY_MAX_CHARS):
+        self.window = window
+        self.summary_tokens = summary_tokens
+        self.max_chars = max_chars
+        self.messages = deque()
+        self.summary_lines = []
+        self.compacted = 0  # messages folded into the summary so far
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+
+    def size_chars(self) -> int:
+        return sum(len(m["content"]) for m in self.messages) + sum(len(line) for line in self.summary_lines)
+
+    def append(self, role: str, content: str):
+        # One oversized message can't take the whole session budget
+        limit = self.max_chars // 2
+        if len(content) > limit:
+            content = content[:limit - 1] + "…"
+        self.messages.append({"role": role, "content": content})
+        while len(self.messages) > self.window or (self.size_chars() > self.max_chars and len(self.messages) > 1):
+            self._compact_oldest()
+
+    def _compact_oldest(self):
+        message = self.messages.popleft()
+        self.compacted += 1
+        if message["role"] == "user":
+            self.summary_lines.append(f"Q: {_first_sentence(message['content'])}")
+        elif self.summary_lines and self.summary_lines[-1].startswith("Q: "):
+            self.summary_lines[-1] += f" A: {_first_sentence(message['content'])}"
+        # Oldest lines go first once the summary is over budget
+        while len(self.summary_lines) > 1 and count_tokens(self.summary) > self.summary_tokens:
+            self.summary_lines.pop(0)
+
+    def last_user_message(self):
+        for message in reversed(self.messages):
+            if message["role"] == "user":
+                return message["content"]
+        return None
+
+    def is_follow_up(self, question: str) -> bool:
+        """A short question with a follow-up marker ("and its budget?") after an earlier question."""
+        return (self.last_user_message() is not None and len(question.split()) <= FOLLOW_UP_MAX_WORDS
+                and FOLLOW_UP_MARKERS.search(question) is not None)
+
+    def retrieval_query(self, question: str) -> str:
+        """The text to retrieve with: follow-ups are joined to the previous question."""
+        if self.is_follow_up(question):
+            return f"{self.last_user_message()} {question}"
+        return question
+
+    def prompt_text(self, max_tokens: int = HISTORY_PROMPT_TOKENS) -> str:
+        """Summary plus the most recent messages that fit in `max_tokens`."""
+        lines, used = [], 0
+        for message in reversed(self.messages):
+            line = f"{message['role'].capitalize()}: {message['content']}"
+            cost = count_tokens(line)
+            if used + cost > max_tokens:
+                break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+        if self.summary_lines and used + count_tokens(self.summary) <= max_tokens:
+            lines.insert(0, f"Earlier in the conversation:\n{self.summary}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {"summary_lines": list(self.summary_lines), "messages": list(self.messages),
+                "compacted": self.compacted}
+
+    @classmethod
+    def from_dict(cls, data: dict, **kwargs):
+        history = cls(**kwargs)
+        history.summary_lines = list(data.get("summary_lines", []))
+        history.compacted = data.get("compacted", 0)
+        for message in data.get("messages", []):
+            history.append(message["role"], message["content"])
+        return history
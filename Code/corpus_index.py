@@ -0,0 +1,177 @@
+"""
+Incremental index over a directory of PDF / text documents.
+
+Every file's content hash and chunk IDs are tracked in the persisted index
+metadata. `sync()` rescans the directory and only re-embeds files that were
+added or changed, deleting the chunks of changed or removed files from the live
+vector store, so a one-file edit never triggers a full rebuild. `watch()` runs
+`sync()` on a background thread to pick up changes without a restart.
+"""
+import os
+import hashlib
+import threading
+
+from index_store import (
+    INDEX_CACHE_DIR, INDEX_TYPE, file_sha256, index_key, index_exists, save_index, load_index,
+    build_vector_store, remove_vectors,
+)
+
+# Loader class names in langchain_community.document_loaders, imported on first use
+LOADERS = {
+    ".pdf": "PyPDFLoader",
+    ".txt": "TextLoader",
+    ".md": "TextLoader",
+}
+
+
+def load_file(path):
+    """Loads one supported file into LangChain Documents."""
+    loader_name = LOADERS.get(os.path.splitext(path)[1].lower())
+    if loader_name is None:
+        raise ValueError(f"Unsupported document type: {path}")
+    from langchain_community import document_loaders
+
+    return getattr(document_loaders, loader_name)(path).load()
+
+
+def scan_directory(directory):
+    """Returns {relative path: content hash} for every supported file under `directory`."""
+    found = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in LOADERS:
+                path = os.path.join(root, name)
+                found[os.path.relpath(path, directory)] = file_sha256(path)
+    return found
+
+
+class CorpusIndex:
+    def __init__(self, directory, embeddings, chunk_size, chunk_overlap,
+                 cache_dir=INDEX_CACHE_DIR, index_type=INDEX_TYPE, on_change=None):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        self.directory = os.path.abspath(directory)
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.cache_dir = cache_dir
+        self.index_type = index_type
+        self.on_change = on_change
+        # The key identifies the corpus and its settings; file contents are tracked in `files`
+        self.key = index_key(hashlib.sha256(self.directory.encode("utf-8")).hexdigest(),
+                             chunk_size, chunk_overlap, embeddings.model, index_type)
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                       add_start_index=True)
+        self.vector_store = None
+        self.meta = {}
+        self.files = {}
+        # Held while the vector store is mutated; searches take it too
+        self.lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def version(self):
+        """Changes whenever any file is added, changed or removed."""
+        payload = "\n".join(f"{path}:{info['hash']}" for path, info in sorted(self.files.items()))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def exists(self):
+        return index_exists(self.key, self.cache_dir)
+
+    def load(self):
+        # Not memory-mapped: mapped faiss indexes are read-only and this one gets updated in place
+        self.vector_store, self.meta = load_index(self.key, self.embeddings, cache_dir=self.cache_dir, mmap=False)
+        self.files = self.meta.get("files", {})
+        print(f"Loaded corpus index {self.key}: {len(self.files)} files, {self.meta['num_vectors']} vectors.")
+
+    def _split_file(self, rel_path, file_hash):
+        docs = load_file(os.path.join(self.directory, rel_path))
+        for doc in docs:
+            doc.metadata["source"] = rel_path
+        chunks = self.splitter.split_documents(docs)
+        ids = [f"{rel_path}:{file_hash[:12]}:{i}" for i in range(len(chunks))]
+        return chunks, ids
+
+    def sync(self):
+        """
+        Brings the index in line with the directory. Returns
+        {"added": [...], "updated": [...], "removed": [...]} file lists.
+        """
+        with self._sync_lock:
+            current = scan_directory(self.directory)
+            added = [p for p in current if p not in self.files]
+            updated = [p for p in current if p in self.files and self.files[p]["hash"] != current[p]]
+            removed = [p for p in self.files if p not in current]
+            changes = {"added": added, "updated": updated, "removed": removed}
+            if not (added or updated or removed):
+                return changes
+            if self.vector_store is None and not current:
+                raise ValueError(f"No supported documents found in {self.directory}")
+
+            # Parse, split and embed outside the lock so queries keep being served meanwhile
+            new_files, chunks, ids = {}, [], []
+            for rel_path in added + updated:
+                file_chunks, file_ids = self._split_file(rel_path, current[rel_path])
+                new_files[rel_path] = {"hash": current[rel_path], "chunk_ids": file_ids}
+                chunks.extend(file_chunks)
+                ids.extend(file_ids)
+            texts = [c.page_content for c in chunks]
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+            text_embeddings = list(zip(texts, vectors))
+            metadatas = [c.metadata for c in chunks]
+
+            with self.lock:
+                stale_ids = [i for p in updated + removed for i in self.files[p]["chunk_ids"]]
+                if self.vector_store is None:
+                    # IVF / PQ are trained on the first sync's vectors only; later files are added to them
+                    self.vector_store = build_vector_store(text_embeddings, self.embeddings, metadatas=metadatas,
+                                                           ids=ids, index_type=self.index_type)
+                else:
+                    if stale_ids:
+                        remove_vectors(self.vector_store, stale_ids)
+                    if text_embeddings:
+                        self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                for rel_path in removed:
+                    del self.files[rel_path]
+                self.files.update(new_files)
+                self.save()
+
+            print(f"Corpus sync: {len(added)} added, {len(updated)} updated, {len(removed)} removed "
+                  f"({len(ids)} chunks embedded, {len(stale_ids)} deleted).")
+            if self.on_change:
+                self.on_change(changes)
+            return changes
+
+    def save(self):
+        self.meta = save_index(self.vector_store, self.key, {
+            "source": self.directory,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model": self.embeddings.model,
+            "index_type": self.index_type,
+            "version": self.version,
+            "num_chunks": sum(len(info["chunk_ids"]) for info in self.files.values()),
+            "files": self.files,
+        }, cache_dir=self.cache_dir)
+
+    def watch(self, interval=5.0):
+        """Polls the directory every `interval` seconds and syncs changes in the background."""
+        if self._watcher is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Corpus sync failed: {e}")
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=loop, name="corpus-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        self._watcher = None
@@ -0,0 +1,167 @@
+"""
+Registry of named corpora, one persisted index each, for serving many project
+briefs from one process.
+
+Corpora are listed in a JSON file (`RAG_CORPORA_FILE`, default corpora.json):
+
+    {"nova": "project_nova_brief.pdf", "quasar": "documents/"}
+
+An engine is created and its index loaded the first time a corpus is queried.
+Loaded engines are kept in LRU order and the least recently used are evicted
+whenever their persisted index sizes add up to more than
+`RAG_CORPUS_MEMORY_BUDGET_MB`. All engines share one embeddings backend (and
+its cache). Build the indexes beforehand with `python ingest.py --corpora`.
+"""
+import os
+import json
+import asyncio
+import threading
+from collections import OrderedDict, defaultdict
+
+from index_store import index_disk_bytes
+
+# --- Configuration ---
+CORPORA_FILE = os.getenv("RAG_CORPORA_FILE", "corpora.json")
+CORPUS_MEMORY_BUDGET_MB = float(os.getenv("RAG_CORPUS_MEMORY_BUDGET_MB", "1024"))
+# Used when there is no corpora file
+DEFAULT_CORPORA = {"nova": "project_nova_brief.pdf"}
+
+
+def load_corpora(path=CORPORA_FILE):
+    """{corpus name: PDF or directory path} from `path`, or DEFAULT_CORPORA when it doesn't exist."""
+    if not os.path.exists(path):
+        return dict(DEFAULT_CORPORA)
+    with open(path) as f:
+        corpora = json.load(f)
+    # Relative paths are relative to the corpora file
+    base = os.path.dirname(os.path.abspath(path))
+    return {name: os.path.join(base, p) if not os.path.isabs(p) else p for name, p in corpora.items()}
+
+
+class CorpusRegistry:
+    """Routes queries by corpus name to lazily loaded, LRU-evicted RAG_Engines."""
+
+    def __init__(self, corpora=None, memory_budget_mb=CORPUS_MEMORY_BUDGET_MB, embeddings=None, **engine_kwargs):
+        self.corpora = dict(corpora if corpora is not None else load_corpora())
+        self.memory_budget = int(memory_budget_mb * 2 ** 20)
+        self.engine_kwargs = engine_kwargs
+        self._embeddings = embeddings
+        self._engines = OrderedDict()  # name -> (engine, bytes), least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = defaultdict(threading.Lock)
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+        # Per-corpus generation stats and single-flight, kept across evictions so /metrics counters never reset
+        self._generation_stats = {}
+        self._single_flights = {}
+
+    def names(self):
+        return sorted(self.corpora)
+
+    def loaded(self):
+        """{name: bytes} of the corpora currently in memory, least recently used first."""
+        with self._lock:
+            return {name: size for name, (_, size) in self._engines.items()}
+
+    def resident_bytes(self):
+        return sum(self.loaded().values())
+
+    def stats_by_corpus(self):
+        """{name: (GenerationStats, SingleFlight or None)} for every corpus loaded so far."""
+        with self._lock:
+            return {name: (stats, self._single_flights.get(name)) for name, stats in self._generation_stats.items()}
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from rag_engine import OPENROUTER_API_KEY, OPENROUTER_API_BASE, EMBEDDING_MODEL
+            from embeddings import EMBEDDING_BACKEND, EMBEDDING_DIM, make_embeddings
+            from embedding_cache import EmbeddingCache
+
+            self._embeddings = make_embeddings(
+                self.engine_kwargs.get("embedding_backend", EMBEDDING_BACKEND), cache=EmbeddingCache(),
+                api_key=OPENROUTER_API_KEY, api_base=OPENROUTER_API_BASE, model=EMBEDDING_MODEL,
+                dim=self.engine_kwargs.get("embedding_dim", EMBEDDING_DIM),
+            )
+        return self._embeddings
+
+    def _cached(self, name):
+        with self._lock:
+            entry = self._engines.get(name)
+            if entry is None:
+                return None
+            self._engines.move_to_end(name)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def _evict(self, incoming=0, keep=None):
+        """Evicts least recently used engines until `incoming` more bytes fit in the budget."""
+        with self._lock:
+            total = sum(size for _, size in self._engines.values())
+            while total + incoming > self.memory_budget:
+                victim = next((n for n in self._engines if n != keep), None)
+                if victim is None:
+                    break
+                engine, size = self._engines.pop(victim)
+                total -= size
+                self.stats["evictions"] += 1
+                engine.close()
+                print(f"Evicted corpus {victim!r} ({size / 2 ** 20:.1f} MB) to stay within the memory budget.")
+
+    def get(self, name):
+        """The loaded engine for `name`, loading it (and evicting others) if needed."""
+        if name not in self.corpora:
+            raise KeyError(f"Unknown corpus {name!r}. Known corpora: {', '.join(self.names())}")
+        engine = self._cached(name)
+        if engine is not None:
+            return engine
+
+        # One load per corpus at a time; other corpora keep serving meanwhile
+        with self._load_locks[name]:
+            engine = self._cached(name)
+            if engine is not None:
+                return engine
+            from rag_engine import RAG_Engine
+
+            kwargs = {"build_if_missing": False, **self.engine_kwargs}
+            engine = RAG_Engine(self.corpora[name], embeddings=self.embeddings, **kwargs)
+            with self._lock:
+                engine.generation_stats = self._generation_stats.setdefault(name, engine.generation_stats)
+                if engine.single_flight is not None:
+                    engine.single_flight = self._single_flights.setdefault(name, engine.single_flight)
+            # Make room before loading, using the persisted size as the estimate
+            self._evict(index_disk_bytes(engine.index_key, engine.cache_dir))
+            engine.warm_up()
+            size = index_disk_bytes(engine.index_key, engine.cache_dir)
+            if size > self.memory_budget:
+                print(f"Warning: corpus {name!r} ({size / 2 ** 20:.1f} MB) alone exceeds the memory budget.")
+            with self._lock:
+                self._engines[name] = (engine, size)
+                self.stats["loads"] += 1
+            self._evict(keep=name)
+            print(f"Loaded corpus {name!r} ({size / 2 ** 20:.1f} MB); "
+                  f"{len(self._engines)} in memory, {self.resident_bytes() / 2 ** 20:.1f} MB.")
+            return engine
+
+    def stream_query(self, name, user_question, **kwargs):
+        return self.get(name).stream_query(user_question, **kwargs)
+
+    def query(self, name, user_question, **kwargs):
+        try:
+            engine = self.get(name)
+        except Exception as e:
+            return f"Error occurred during query: {e}"
+        return engine.query(user_question, **kwargs)
+
+    async def aquery(self, name, user_question, **kwargs):
+        try:
+            # Loading reads the index from disk, so keep it off the event loop
+            engine = await asyncio.get_running_loop().run_in_executor(None, self.get, name)
+        except Exception as e:
+            return f"Error occurred during query: {e}"
+        return await engine.aquery(user_question, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for engine, _ in self._engines.values():
+                engine.close()
+            self._engines.clear()
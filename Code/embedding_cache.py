@@ -0,0 +1,119 @@
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by (model, sha256(text)) and kept in two tiers: a bounded
+in-memory LRU in front of a SQLite file that stores each vector as a packed
+float32 blob. Re-embedding an unchanged chunk or a repeated question is then a
+local lookup instead of an API call.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", ".embedding_cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("RAG_EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of embedding vectors."""
+
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH, max_memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            self._db.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+        """Returns {text: vector} for every text that is cached."""
+        found = {}
+        pending = {}
+        with self._lock:
+            for text in texts:
+                key = (model, text_hash(text))
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[text] = self._memory[key]
+                    self.stats["memory_hits"] += 1
+                else:
+                    pending.setdefault(key[1], []).append(text)
+
+            if pending and self._db is not None:
+                hashes = list(pending)
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(hashes), 500):
+                    batch = hashes[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                        [model, *batch],
+                    ).fetchall()
+                    for digest, blob in rows:
+                        vector = _unpack(blob)
+                        self._remember((model, digest), vector)
+                        for text in pending.pop(digest):
+                            found[text] = vector
+                            self.stats["disk_hits"] += 1
+
+            self.stats["misses"] += sum(len(group) for group in pending.values())
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """Stores {text: vector} pairs in both tiers."""
+        if not items:
+            return
+        with self._lock:
+            rows = []
+            for text, vector in items.items():
+                digest = text_hash(text)
+                self._remember((model, digest), list(vector))
+                rows.append((model, digest, len(vector), _pack(vector)))
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+            self.stats["writes"] += len(rows)
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
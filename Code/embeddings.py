@@ -0,0 +1,461 @@
+import os
+import json
+import math
+import time
+import queue
+import asyncio
+import threading
+from typing import TYPE_CHECKING, List, Optional
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache
+
+# The HTTP clients are imported when the first request is made
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
+EMBEDDING_BATCH_SIZE = int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("RAG_EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_TIMEOUT = float(os.getenv("RAG_EMBEDDING_TIMEOUT", "30"))
+
+# Keep only the first N dimensions of every vector (0 = full size), shrinking the index
+EMBEDDING_DIM = int(os.getenv("RAG_EMBEDDING_DIM", "0"))
+
+# --- Backend selection ---
+# "openrouter" (remote HTTP API) or "local" (sentence-transformers on CPU)
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "openrouter")
+EMBEDDING_BACKENDS = ("openrouter", "local")
+LOCAL_EMBEDDING_MODEL = os.getenv("RAG_LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# 0 leaves torch / onnxruntime at their default thread count
+LOCAL_EMBEDDING_THREADS = int(os.getenv("RAG_LOCAL_EMBEDDING_THREADS", "0"))
+LOCAL_EMBEDDING_ONNX = os.getenv("RAG_LOCAL_EMBEDDING_ONNX", "0") == "1"
+LOCAL_EMBEDDING_INT8 = os.getenv("RAG_LOCAL_EMBEDDING_INT8", "0") == "1"
+# Quantized ONNX export to load when both ONNX and int8 are enabled
+LOCAL_EMBEDDING_ONNX_INT8_FILE = os.getenv("RAG_LOCAL_EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+# How long a query waits for others to share its batch; 0 only batches queries already queued
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("RAG_LOCAL_EMBEDDING_MAX_WAIT_MS", "0"))
+
+
+class OpenRouterEmbeddings(Embeddings):
+    """Custom embedding class for OpenRouter API."""
+    def __init__(self, model: str = "text-embedding-ada-002", api_key: str = None,
+                 cache: Optional[EmbeddingCache] = None, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_workers: int = EMBEDDING_MAX_WORKERS, timeout: float = EMBEDDING_TIMEOUT,
+                 api_base: str = OPENROUTER_API_BASE):
+        if not api_key:
+            raise ValueError("OpenRouter API key must be provided.")
+        self.model = model
+        self.api_key = api_key
+        self.api_url = f"{api_base.rstrip('/')}/embeddings"
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self._session = None
+        self._executor = None
+        self._async_client = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        """Keep-alive session whose connection pool matches the worker count."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+        return self._executor
+
+    @property
+    def async_client(self) -> "httpx.AsyncClient":
+        """
+        Pooled async client. httpx connections belong to the event loop that opened
+        them, so a new client is created if we are called from a different loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            import httpx
+
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_workers * 4, max_keepalive_connections=self.max_workers * 4),
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    @staticmethod
+    def _parse_response(response_data) -> List[List[float]]:
+        # The API reports each item's position; don't rely on response order
+        items = sorted(response_data['data'], key=lambda item: item.get('index', 0))
+        return [item['embedding'] for item in items]
+
+    def _request_batch(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(
+            self.api_url,
+            data=json.dumps({"model": self.model, "input": texts}),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return self._parse_response(response.json())
+
+    async def _arequest_batch(self, texts: List[str]) -> List[List[float]]:
+        response = await self.async_client.post(
+            self.api_url,
+            content=json.dumps({"model": self.model, "input": texts}),
+        )
+        response.raise_for_status()
+        return self._parse_response(response.json())
+
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._request_batch(texts) if texts else []
+        # executor.map yields results in submission order, so output matches input order
+        results = []
+        for batch_vectors in self.executor.map(self._request_batch, batches):
+            results.extend(batch_vectors)
+        return results
+
+    async def _arequest_embeddings(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run(batch):
+            async with semaphore:
+                return await self._arequest_batch(batch)
+
+        results = []
+        for batch_vectors in await asyncio.gather(*(run(batch) for batch in batches)):
+            results.extend(batch_vectors)
+        return results
+
+    def _lookup_cached(self, texts: List[str]):
+        """Returns ({text: vector} for cached texts, de-duplicated list of texts to fetch)."""
+        found = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(t for t in texts if t not in found))
+        return found, missing
+
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self._request_embeddings(texts)
+
+        # Only texts never seen before (for this model) go over the network
+        found, missing = self._lookup_cached(texts)
+        if missing:
+            fresh = dict(zip(missing, self._request_embeddings(missing)))
+            self.cache.put_many(self.model, fresh)
+            found.update(fresh)
+        return [found[t] for t in texts]
+
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return await self._arequest_embeddings(texts)
+
+        # Cache lookups are local SQLite reads, cheap enough to run on the loop
+        found, missing = self._lookup_cached(texts)
+        if missing:
+            fresh = dict(zip(missing, await self._arequest_embeddings(missing)))
+            self.cache.put_many(self.model, fresh)
+            found.update(fresh)
+        return [found[t] for t in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._get_embeddings(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_embeddings([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aget_embeddings(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._aget_embeddings([text]))[0]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+
+
+class QueryBatcher:
+    """
+    Coalesces single-text embedding calls from concurrent callers into batches.
+    A worker thread takes the first queued text, gathers whatever else arrives
+    within `max_wait_ms` (up to `max_batch` texts) and embeds them with one
+    `encode(texts)` call.
+    """
+    def __init__(self, encode, max_batch: int, max_wait_ms: float = 0.0):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"batches": 0, "texts": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, text: str) -> Future:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self.stats["batches"] += 1
+            self.stats["texts"] += len(batch)
+            try:
+                vectors = self.encode([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+
+    def mean_batch_size(self) -> float:
+        return self.stats["texts"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    def close(self):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker = None
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers model run in-process on CPU.
+
+    Concurrent embed_query / aembed_query calls are batched dynamically: a
+    worker thread encodes whatever questions are queued together in one forward
+    pass, so many in-flight queries don't each pay for their own. Optional
+    int8 (dynamic quantization, or a quantized ONNX export) and ONNX Runtime
+    inference trade a little accuracy for speed.
+    """
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, num_threads: int = LOCAL_EMBEDDING_THREADS,
+                 onnx: bool = LOCAL_EMBEDDING_ONNX, int8: bool = LOCAL_EMBEDDING_INT8,
+                 max_wait_ms: float = LOCAL_EMBEDDING_MAX_WAIT_MS):
+        self.model_name = model
+        # Variants produce different vectors, so they must not share index or cache entries
+        self.model = model + ("+onnx" if onnx else "") + ("+int8" if int8 else "")
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.num_threads = num_threads
+        self.onnx = onnx
+        self.int8 = int8
+        self._encoder = None
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self.batcher = QueryBatcher(self._encode, self.batch_size, max_wait_ms)
+
+    @property
+    def encoder(self):
+        """Loads the model on first use, so importing this module stays cheap."""
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = self._load_encoder()
+        return self._encoder
+
+    def _load_encoder(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        if self.onnx:
+            model_kwargs = {"file_name": LOCAL_EMBEDDING_ONNX_INT8_FILE} if self.int8 else None
+            if self.num_threads > 0:
+                import onnxruntime
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = self.num_threads
+                model_kwargs = dict(model_kwargs or {}, session_options=session_options)
+            encoder = SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        else:
+            encoder = SentenceTransformer(self.model_name, device="cpu")
+            if self.int8:
+                encoder = torch.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"Loaded local embedding model {self.model} "
+              f"({torch.get_num_threads()} threads, dim {encoder.get_sentence_embedding_dimension()}).")
+        return encoder
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        # One forward pass at a time; concurrent passes would just fight over the same cores
+        with self._encode_lock:
+            vectors = self.encoder.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                          normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def _get_embeddings(self, texts: List[str], encode) -> List[List[float]]:
+        if self.cache is None:
+            return encode(texts)
+        found = self.cache.get_many(self.model, texts)
+        missing = list(dict.fromkeys(t for t in texts if t not in found))
+        if missing:
+            fresh = dict(zip(missing, encode(missing)))
+            self.cache.put_many(self.model, fresh)
+            found.update(fresh)
+        return [found[t] for t in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._get_embeddings(texts, self._encode) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_embeddings([text], lambda missing: [self.batcher.submit(missing[0]).result()])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.cache is not None:
+            found = self.cache.get_many(self.model, [text])
+            if text in found:
+                return found[text]
+        vector = await asyncio.wrap_future(self.batcher.submit(text))
+        if self.cache is not None:
+            self.cache.put_many(self.model, {text: vector})
+        return vector
+
+    def close(self):
+        self.batcher.close()
+
+    async def aclose(self):
+        self.close()
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Keeps the first `dim` components of another backend's vectors and
+    re-normalizes them. Cuts index memory and search cost at some recall cost
+    (see bench_index.py); the wrapped backend and its cache are used as-is.
+    """
+    def __init__(self, inner: Embeddings, dim: int):
+        self.inner = inner
+        self.dim = dim
+        self.model = f"{inner.model}@{dim}"
+        self.cache = getattr(inner, "cache", None)
+
+    def _truncate(self, vector: List[float]) -> List[float]:
+        head = vector[:self.dim]
+        norm = math.sqrt(sum(x * x for x in head)) or 1.0
+        return [x / norm for x in head]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._truncate(v) for v in self.inner.embed_documents(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._truncate(self.inner.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._truncate(v) for v in await self.inner.aembed_documents(texts)]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._truncate(await self.inner.aembed_query(text))
+
+    def close(self):
+        self.inner.close()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Micro-batches embed_query calls from concurrent requests into one
+    embed_documents call on the wrapped backend (used by query_service.py), so
+    N simultaneous questions cost one embedding request instead of N.
+    """
+    def __init__(self, inner: Embeddings, max_wait_ms: float, max_batch: int = EMBEDDING_BATCH_SIZE):
+        self.inner = inner
+        self.model = inner.model
+        self.cache = getattr(inner, "cache", None)
+        self.batcher = QueryBatcher(inner.embed_documents, max_batch, max_wait_ms)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.submit(text).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.batcher.submit(text))
+
+    def close(self):
+        self.batcher.close()
+        self.inner.close()
+
+    async def aclose(self):
+        self.batcher.close()
+        await self.inner.aclose()
+
+
+def make_embeddings(backend: str = EMBEDDING_BACKEND, cache: Optional[EmbeddingCache] = None,
+                    api_key: str = None, api_base: str = OPENROUTER_API_BASE,
+                    model: str = "text-embedding-ada-002", dim: int = EMBEDDING_DIM) -> Embeddings:
+    """
+    Builds the embeddings backend by name; `model` and `api_*` apply to the remote
+    one. A non-zero `dim` truncates its vectors to that many dimensions.
+    """
+    if backend == "local":
+        embeddings = LocalEmbeddings(cache=cache)
+    elif backend == "openrouter":
+        embeddings = OpenRouterEmbeddings(model=model, api_key=api_key, cache=cache, api_base=api_base)
+    else:
+        raise ValueError(f"Embedding backend must be one of {EMBEDDING_BACKENDS}, got {backend!r}")
+    return TruncatedEmbeddings(embeddings, dim) if dim else embeddings
@@ -1,7 +1,8 @@
 import time
 import csv
 import re
-from rag_engine import RAG_Engine
+from query_client import QUERY_SERVICE_URL, QueryServiceClient
+from run_history import record_run, run_config
 
 # -----------------------------
 # Helpers: normalization + matching
@@ -111,23 +112,60 @@ def score_abstain_case(response: str) -> tuple[bool, str]:
         return True, "Correctly abstained"
     return False, "Failed to abstain (Hallucination Risk)"
 
+def score_case(response: str, test: dict) -> tuple[bool, str]:
+    if test.get("behavior", "ANSWER") == "ABSTAIN":
+        return score_abstain_case(response)
+    return score_answer_case(response, test)
+
+def print_summary(results: list[dict]):
+    """Prints accuracy, QRS and per-type accuracy for a list of result rows."""
+    total = len(results)
+    correct_count = sum(1 for r in results if r["Result"] == "PASS")
+    
+    # Counters for Positive vs Negative data
+    pos_total = sum(1 for r in results if r["Data Type"] == "Positive")
+    pos_correct = sum(1 for r in results if r["Data Type"] == "Positive" and r["Result"] == "PASS")
+    neg_total = total - pos_total
+    neg_correct = correct_count - pos_correct
+
+    qrs = (correct_count / total) * 100 if total else 0.0
+    
+    print("\n" + "="*40)
+    print("EVALUATION SUMMARY")
+    print("="*40)
+    print(f"Total Questions: {total}")
+    print(f"Accuracy Metric: {qrs:.1f}% ({correct_count}/{total})")
+    print(f"Query Resolution Score (QRS): {qrs:.1f}%")
+    
+    if pos_total > 0:
+        print(f"Positive Data Accuracy: {pos_correct/pos_total*100:.1f}% ({pos_correct}/{pos_total})")
+    if neg_total > 0:
+        print(f"Negative Data Accuracy: {neg_correct/neg_total*100:.1f}% ({neg_correct}/{neg_total})")
+
+def save_results(results: list[dict], filename: str = "evaluation_results.csv"):
+    # CSV Export
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=results[0].keys())
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\nResults saved to {filename}")
+
 def run_evaluation():
     print("--- Starting Extended Chatbot Evaluation (25 Questions) ---")
 
     try:
-        engine = RAG_Engine("project_nova_brief.pdf")
+        if QUERY_SERVICE_URL:
+            # Share the running query service instead of loading another engine
+            engine = QueryServiceClient(QUERY_SERVICE_URL)
+            print(f"Using query service at {QUERY_SERVICE_URL}")
+        else:
+            from rag_engine import RAG_Engine
+            engine = RAG_Engine("project_nova_brief.pdf")
     except Exception as e:
         print(f"Failed to initialize: {e}")
         return
 
     results = []
-    correct_count = 0
-    
-    # Counters for Positive vs Negative data
-    pos_total = 0
-    pos_correct = 0
-    neg_total = 0
-    neg_correct = 0
 
     print(f"\nRunning {len(test_cases)} test cases...\n")
 
@@ -139,25 +177,10 @@ def run_evaluation():
         print(f"[{i+1}/{len(test_cases)}] ({data_type}) Q: {q}")
         
         start = time.time()
-        response = engine.query(q)
+        response, timings = engine.timed_query(q)
         duration = time.time() - start
         
-        if behavior == "ABSTAIN":
-            is_correct, reason = score_abstain_case(response)
-        else:
-            is_correct, reason = score_answer_case(response, test)
-        
-        if is_correct:
-            correct_count += 1
-            if data_type == "Positive":
-                pos_correct += 1
-            else:
-                neg_correct += 1
-        
-        if data_type == "Positive":
-            pos_total += 1
-        else:
-            neg_total += 1
+        is_correct, reason = score_case(response, test)
 
         print(f"  -> {'✅ PASS' if is_correct else '❌ FAIL'}: {reason} | {duration:.2f}s")
 
@@ -168,29 +191,21 @@ def run_evaluation():
             "Expected": behavior,
             "Actual Response": response.strip(),
             "Result": "PASS" if is_correct else "FAIL",
-            "Time": f"{duration:.2f}s"
+            "Time": f"{duration:.2f}s",
+            "TTFT": f"{timings.get('time_to_first_token', duration):.2f}s"
         })
 
-    qrs = (correct_count / len(test_cases)) * 100
-    
-    print("\n" + "="*40)
-    print("EVALUATION SUMMARY")
-    print("="*40)
-    print(f"Total Questions: {len(test_cases)}")
-    print(f"Accuracy Metric: {correct_count/len(test_cases)*100:.1f}% ({correct_count}/{len(test_cases)})")
-    print(f"Query Resolution Score (QRS): {qrs:.1f}%")
-    
-    if pos_total > 0:
-        print(f"Positive Data Accuracy: {pos_correct/pos_total*100:.1f}% ({pos_correct}/{pos_total})")
-    if neg_total > 0:
-        print(f"Negative Data Accuracy: {neg_correct/neg_total*100:.1f}% ({neg_correct}/{neg_total})")
+    print_summary(results)
+
+    cache = getattr(getattr(engine, "embeddings", None), "cache", None)
+    if cache is not None:
+        print(f"Embedding Cache Hit Rate: {cache.hit_rate()*100:.1f}% {cache.stats}")
+    answer_cache = getattr(engine, "answer_cache", None)
+    if answer_cache is not None:
+        print(f"Answer Cache Hit Rate: {answer_cache.hit_rate()*100:.1f}% {answer_cache.stats}")
     
-    # CSV Export
-    with open("evaluation_results.csv", "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=results[0].keys())
-        writer.writeheader()
-        writer.writerows(results)
-    print("\nResults saved to evaluation_results.csv")
+    save_results(results)
+    record_run("evaluate", results, run_config(engine))
 
 if __name__ == "__main__":
     run_evaluation()
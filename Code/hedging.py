@@ -0,0 +1,263 @@
+"""
+Deadline-aware LLM generation with a hedged request to a fallback model.
+
+The primary model is streamed first. If it hasn't produced a token within
+`hedge_after` seconds (or fails before its first token), the same prompt is
+sent to the fallback model and whichever produces a token first wins; the
+other stream is abandoned. If nothing has answered by the query deadline, a
+degraded answer (the most relevant passage, flagged as such) is returned
+instead of waiting any longer; an answer still streaming at the deadline is cut
+off with TRUNCATED_NOTE. Errors are not papered over: when every model fails
+before the deadline (a bad key or model name, an exhausted quota), the last
+error is raised.
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+
+# --- Configuration ---
+# Seconds from the start of the query until a degraded answer is returned (0 disables)
+QUERY_DEADLINE = float(os.getenv("RAG_QUERY_DEADLINE", "30"))
+# Seconds without a first token before hedging to the fallback model (0 disables hedging)
+HEDGE_AFTER = float(os.getenv("RAG_HEDGE_AFTER", "5"))
+# Defaults to a second request to the primary model
+FALLBACK_MODEL = os.getenv("RAG_FALLBACK_MODEL", "")
+DEGRADED_PREFIX = ("[Degraded answer: the language model did not respond in time. "
+                   "This is the most relevant passage from the document.]")
+TRUNCATED_NOTE = " … [answer cut off: the time limit was reached]"
+
+_INFINITY = float("inf")
+
+
+def degraded_answer(sources, max_chars=700):
+    """The flagged fallback answer: the top retrieved chunk, shortened."""
+    if not sources:
+        return f"{DEGRADED_PREFIX}\n\n(No passage was retrieved.)"
+    text = " ".join(sources[0].page_content.split())
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+    return f"{DEGRADED_PREFIX}\n\n{text}"
+
+
+class HedgedGeneration:
+    """
+    Answer tokens from a primary LLM, hedged to a fallback LLM and bounded by a
+    deadline. Iterate it (or `async for` it) once; the hedge delay counts from
+    the first token requested. Afterwards `winner` is "primary", "fallback" or
+    "degraded" (None if it raised), and `hedged` (fallback started because the
+    primary was slow), `failed_over` (because the primary failed), `timed_out`
+    and `errors` say what happened on the way.
+    """
+
+    def __init__(self, primary, fallback, prompt_value, started, degraded, deadline=QUERY_DEADLINE,
+                 hedge_after=HEDGE_AFTER):
+        self.llms = {"primary": primary, "fallback": fallback}
+        self.prompt_value = prompt_value
+        self.degraded = degraded
+        self._deadline_at = started + deadline if deadline else _INFINITY
+        self._hedge_after = hedge_after if hedge_after and fallback is not None else None
+        self._hedge_at = None
+        self.winner = None
+        self.hedged = False
+        self.failed_over = False
+        self.timed_out = False
+        self.truncated = False
+        self.errors = []
+        self._running = set()
+
+    @property
+    def model(self):
+        llm = self.llms.get(self.winner)
+        return getattr(llm, "model_name", None) if llm is not None else None
+
+    # --- Decisions shared by the sync and async drivers ---
+
+    def _start(self):
+        # Time spent queued before the first next() doesn't eat into the hedge delay
+        if self._hedge_after is not None:
+            self._hedge_at = time.time() + self._hedge_after
+
+    def _timeout(self):
+        """Seconds until the next hedge or deadline check, None to wait indefinitely."""
+        wake = self._deadline_at
+        if self.winner is None and self._hedge_at is not None:
+            wake = min(wake, self._hedge_at)
+        return None if wake == _INFINITY else max(0.0, wake - time.time())
+
+    def _on_timeout(self):
+        """'hedge' to start the fallback, or 'deadline' to stop waiting."""
+        if self.winner is None and self._hedge_at is not None and time.time() < self._deadline_at:
+            self._hedge_at = None
+            self.hedged = True
+            return "hedge"
+        self.timed_out = True
+        return "deadline"
+
+    def _on_event(self, source, kind, value):
+        """
+        Returns one of ("token", text), ("done",), ("skip",), ("fallback",)
+        or ("raise", error) for an event from one of the streams.
+        """
+        if self.winner is not None and source != self.winner:
+            return ("skip",)
+        if kind == "token":
+            self.winner = source
+            return ("token", value)
+        if kind == "done":
+            self.winner = source
+            return ("done",)
+        # An error
+        self.errors.append(f"{source}: {value}")
+        self._running.discard(source)
+        if self.winner == source:
+            self.truncated = True
+            return ("done",)
+        if source == "primary" and self.llms["fallback"] is not None and self._hedge_at is not None:
+            # Fail over right away instead of waiting for the hedge delay
+            self._hedge_at = None
+            self.failed_over = True
+            return ("fallback",)
+        # Only a missed deadline degrades; a model that errors is a real failure
+        return ("skip",) if self._running else ("raise", value)
+
+    def _degrade(self):
+        self.winner = "degraded"
+        return self.degraded
+
+    # --- Sync driver: one thread per stream ---
+
+    def _pump(self, source, events, cancel):
+        stream = self.llms[source].stream(self.prompt_value)
+        try:
+            for chunk in stream:
+                if cancel.is_set():
+                    return
+                if chunk.content:
+                    events.put((source, "token", chunk.content))
+            events.put((source, "done", None))
+        except Exception as e:
+            events.put((source, "error", e))
+        finally:
+            stream.close()
+
+    def __iter__(self):
+        events, cancels = queue.Queue(), {}
+
+        def launch(source):
+            cancels[source] = threading.Event()
+            self._running.add(source)
+            threading.Thread(target=self._pump, args=(source, events, cancels[source]),
+                             name=f"llm-{source}", daemon=True).start()
+
+        self._start()
+        launch("primary")
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=self._timeout())
+                except queue.Empty:
+                    if self._on_timeout() == "hedge":
+                        launch("fallback")
+                        continue
+                    if self.winner is None:
+                        yield self._degrade()
+                    else:
+                        self.truncated = True
+                        yield TRUNCATED_NOTE
+                    return
+                action = self._on_event(*event)
+                if action[0] == "token":
+                    for source, cancel in cancels.items():
+                        if source != self.winner:
+                            cancel.set()
+                    yield action[1]
+                elif action[0] == "done":
+                    return
+                elif action[0] == "fallback":
+                    launch("fallback")
+                elif action[0] == "raise":
+                    raise action[1]
+        finally:
+            for cancel in cancels.values():
+                cancel.set()
+
+    # --- Async driver: one task per stream ---
+
+    async def _apump(self, source, events):
+        try:
+            async for chunk in self.llms[source].astream(self.prompt_value):
+                if chunk.content:
+                    await events.put((source, "token", chunk.content))
+            await events.put((source, "done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await events.put((source, "error", e))
+
+    async def __aiter__(self):
+        events, tasks = asyncio.Queue(), {}
+
+        def launch(source):
+            self._running.add(source)
+            tasks[source] = asyncio.create_task(self._apump(source, events))
+
+        self._start()
+        launch("primary")
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), self._timeout())
+                except asyncio.TimeoutError:
+                    if self._on_timeout() == "hedge":
+                        launch("fallback")
+                        continue
+                    if self.winner is None:
+                        yield self._degrade()
+                    else:
+                        self.truncated = True
+                        yield TRUNCATED_NOTE
+                    return
+                action = self._on_event(*event)
+                if action[0] == "token":
+                    for source, task in tasks.items():
+                        if source != self.winner:
+                            task.cancel()
+                    yield action[1]
+                elif action[0] == "done":
+                    return
+                elif action[0] == "fallback":
+                    launch("fallback")
+                elif action[0] == "raise":
+                    raise action[1]
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+
+class GenerationStats:
+    """Counts of how generations ended, for the hedge / fallback / timeout rates on /metrics."""
+    FIELDS = ("generations", "hedged", "failovers", "fallback_wins", "timeouts", "degraded", "truncated",
+              "failed", "errors")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def record(self, generation):
+        with self._lock:
+            self.counts["generations"] += 1
+            self.counts["hedged"] += generation.hedged
+            self.counts["failovers"] += generation.failed_over
+            self.counts["fallback_wins"] += generation.winner == "fallback"
+            self.counts["timeouts"] += generation.timed_out
+            self.counts["degraded"] += generation.winner == "degraded"
+            self.counts["truncated"] += generation.truncated
+            self.counts["failed"] += generation.winner is None
+            self.counts["errors"] += len(generation.errors)
+
+    def rates(self):
+        with self._lock:
+            total = max(self.counts["generations"], 1)
+            return {field: self.counts[field] / total for field in self.FIELDS if field != "generations"}
@@ -0,0 +1,276 @@
+"""
+Persistent on-disk storage for the FAISS vector store.
+
+An index artifact is keyed by the content hash of its source document plus the
+chunking parameters, embedding model and index type, so a stale index is never
+served after the PDF or the settings change.
+
+Besides the exact flat index, large corpora can use an approximate or
+compressed FAISS index (IVF, HNSW, scalar or product quantization). Indexes
+that need training are trained on the vectors they are built from.
+"""
+import os
+import json
+import math
+import time
+import pickle
+import shutil
+import hashlib
+from typing import TYPE_CHECKING
+
+from chunk_store import CHUNK_META_FILE, ChunkStore, write_chunk_store
+
+# faiss, numpy and LangChain are imported inside the functions that need them,
+# so the constants and key helpers here are cheap to import
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# --- Configuration ---
+INDEX_CACHE_DIR = os.getenv("RAG_INDEX_CACHE_DIR", ".index_cache")
+INDEX_FILE = "index.faiss"
+# Pickled (InMemoryDocstore, index_to_docstore_id) of indexes saved before chunk_store.py
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "meta.json"
+
+# --- Index types ---
+# flat: exact float32 | ivf: inverted lists | hnsw: graph | sq16 / sq8: float16 / int8 scalar
+# quantization | pq: IVF + product quantization (smallest, least exact)
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq16", "sq8", "pq")
+# Lists probed per IVF / PQ search, and the HNSW search beam; higher = better recall, slower
+INDEX_NPROBE = int(os.getenv("RAG_INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("RAG_INDEX_EF_SEARCH", "64"))
+HNSW_M = 32
+# Below this many vectors IVF / PQ can't be trained sensibly and a flat index is used instead
+MIN_TRAINING_VECTORS = 1000
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_key(source_hash: str, chunk_size: int, chunk_overlap: int, embedding_model: str,
+              index_type: str = "flat") -> str:
+    """Builds the cache key for an index from everything that affects its contents."""
+    settings = {
+        "source": source_hash,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": embedding_model,
+    }
+    # Flat keys predate index types; leaving them unchanged keeps existing indexes valid
+    if index_type != "flat":
+        settings["index_type"] = index_type
+    payload = json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def index_dir(key: str, cache_dir: str = INDEX_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, key)
+
+
+def index_disk_bytes(key: str, cache_dir: str = INDEX_CACHE_DIR) -> int:
+    """Size of a persisted index on disk (0 if missing), an upper bound on what loading it takes."""
+    path = index_dir(key, cache_dir)
+    if not os.path.isdir(path):
+        return 0
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def index_exists(key: str, cache_dir: str = INDEX_CACHE_DIR) -> bool:
+    path = index_dir(key, cache_dir)
+    has_docstore = any(os.path.exists(os.path.join(path, name)) for name in (CHUNK_META_FILE, DOCSTORE_FILE))
+    return has_docstore and all(os.path.exists(os.path.join(path, name)) for name in (INDEX_FILE, META_FILE))
+
+
+def index_factory_string(index_type: str, dim: int, num_vectors: int) -> str:
+    """FAISS index_factory description for `index_type` sized for `num_vectors` vectors."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Index type must be one of {INDEX_TYPES}, got {index_type!r}")
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    if index_type == "sq16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "flat" or num_vectors < MIN_TRAINING_VECTORS:
+        return "Flat"
+    # ~4*sqrt(n) lists, each with the 39 training points faiss asks for
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    m = next(m for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+    nbits = 8 if num_vectors >= 256 * 39 else 6 if num_vectors >= 64 * 39 else 4
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+
+def configure_search(index, nprobe: int = INDEX_NPROBE, ef_search: int = INDEX_EF_SEARCH):
+    """Applies nprobe / efSearch to the index types that have them."""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+def build_vector_store(text_embeddings, embeddings, metadatas=None, ids=None,
+                       index_type: str = INDEX_TYPE) -> "FAISS":
+    """
+    Like FAISS.from_embeddings, but with the requested index type. The index is
+    trained on the given vectors when it needs training.
+    """
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+    spec = index_factory_string(index_type, vectors.shape[1], len(vectors))
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        print(f"Training {spec} index on {len(vectors)} vectors...")
+        index.train(vectors)
+    configure_search(index)
+    vector_store = FAISS(embedding_function=embeddings, index=index,
+                         docstore=InMemoryDocstore(), index_to_docstore_id={})
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_store
+
+
+def remove_vectors(vector_store: "FAISS", ids):
+    """
+    Deletes documents by docstore ID. HNSW graphs can't drop vectors, so for
+    those the index is rebuilt from its remaining vectors.
+    """
+    import faiss
+
+    try:
+        vector_store.delete(ids)
+        return
+    except RuntimeError:
+        pass
+    stale = set(ids)
+    mapping = vector_store.index_to_docstore_id
+    keep = [pos for pos in sorted(mapping) if mapping[pos] not in stale]
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)[keep]
+    index = faiss.clone_index(vector_store.index)
+    index.reset()
+    index.add(vectors)
+    vector_store.docstore.delete(list(stale & set(mapping.values())))
+    vector_store.index = index
+    vector_store.index_to_docstore_id = {new: mapping[old] for new, old in enumerate(keep)}
+
+
+def index_memory_bytes(index) -> int:
+    """Serialized size of a FAISS index, a close proxy for its resident memory."""
+    import faiss
+
+    return int(faiss.serialize_index(index).size)
+
+
+def _chunks_in_index_order(vector_store: "FAISS"):
+    """(docstore id, text, metadata) by index position, so positions can be rebuilt from the ids on load."""
+    mapping = vector_store.index_to_docstore_id
+    if sorted(mapping) != list(range(len(mapping))):
+        raise ValueError("index_to_docstore_id must map positions 0..n-1")
+    for pos in range(len(mapping)):
+        doc = vector_store.docstore.search(mapping[pos])
+        yield mapping[pos], doc.page_content, doc.metadata
+
+
+def save_index(vector_store: "FAISS", key: str, meta: dict, cache_dir: str = INDEX_CACHE_DIR) -> dict:
+    """
+    Writes the vectors, chunk store and metadata for `key` and returns the stored metadata.
+    The artifact is written to a temporary directory first and then renamed into
+    place, so a concurrent reader never sees a half-written index. Afterwards the
+    vector store's docstore is swapped for the compact ChunkStore just written,
+    so the process doesn't keep a Document per chunk. Callers that search
+    concurrently must hold their index lock: the old ChunkStore is unmapped.
+    """
+    import faiss
+
+    final_path = index_dir(key, cache_dir)
+    tmp_path = f"{final_path}.tmp-{os.getpid()}"
+    old_path = f"{final_path}.old-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+
+    faiss.write_index(vector_store.index, os.path.join(tmp_path, INDEX_FILE))
+    chunk_stats = write_chunk_store(tmp_path, _chunks_in_index_order(vector_store))
+
+    meta = dict(meta, key=key, created_at=time.time(), num_vectors=vector_store.index.ntotal,
+                index_class=type(vector_store.index).__name__, chunk_store=chunk_stats)
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    # The old store is unmapped first: Windows can't move or delete mapped files. Other processes
+    # still mapping the old files keep a consistent (old) view until they reload.
+    if isinstance(vector_store.docstore, ChunkStore):
+        vector_store.docstore.close()
+    # os.replace can't overwrite a non-empty directory, so the old one is moved aside first
+    if os.path.exists(final_path):
+        shutil.rmtree(old_path, ignore_errors=True)  # left over from an interrupted save
+        os.replace(final_path, old_path)
+    os.replace(tmp_path, final_path)
+    _attach_chunk_store(vector_store, final_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return meta
+
+
+def _attach_chunk_store(vector_store: "FAISS", path: str):
+    docstore = ChunkStore(path)
+    vector_store.docstore = docstore
+    # Shares the id strings with the chunk store instead of holding a second copy
+    vector_store.index_to_docstore_id = dict(enumerate(docstore.ids))
+
+
+def _read_faiss_index(path: str, mmap: bool):
+    import faiss
+
+    if not mmap:
+        return faiss.read_index(path)
+    # Newer faiss releases can map flat codes directly; older ones only map IVF lists.
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def load_index(key: str, embeddings, cache_dir: str = INDEX_CACHE_DIR, mmap: bool = True):
+    """
+    Loads a persisted index. Returns a (FAISS vector store, metadata) tuple.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    path = index_dir(key, cache_dir)
+    if not index_exists(key, cache_dir):
+        raise FileNotFoundError(f"No persisted index found at: {path}")
+
+    index = _read_faiss_index(os.path.join(path, INDEX_FILE), mmap)
+    configure_search(index)
+    with open(os.path.join(path, META_FILE), "r") as f:
+        meta = json.load(f)
+
+    if os.path.exists(os.path.join(path, CHUNK_META_FILE)):
+        docstore = ChunkStore(path)
+        index_to_docstore_id = dict(enumerate(docstore.ids))
+    else:
+        # Saved before chunk_store.py; rebuild it (`python ingest.py --force`) to get the compact store
+        with open(os.path.join(path, DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+    return vector_store, meta
@@ -0,0 +1,109 @@
+"""
+Offline ingest step: builds and persists the FAISS index for a document.
+
+Serving processes (app.py) only load the persisted index, so run this whenever
+the PDF or the chunking/embedding settings change:
+
+    python ingest.py project_nova_brief.pdf
+    python ingest.py documents/            # incremental: only changed files are re-embedded
+    python ingest.py documents/ --watch    # keep syncing as files change
+    python ingest.py --corpora             # every corpus in corpora.json (see corpus_registry.py)
+"""
+import os
+import sys
+import time
+import argparse
+
+from rag_engine import (
+    OPENROUTER_API_KEY, OPENROUTER_API_BASE, EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP,
+    build_index, pdf_index_key,
+)
+from embeddings import EMBEDDING_BACKEND, EMBEDDING_BACKENDS, EMBEDDING_DIM, make_embeddings
+from index_store import INDEX_CACHE_DIR, INDEX_TYPE, INDEX_TYPES, index_exists
+from embedding_cache import EmbeddingCache
+from corpus_index import CorpusIndex
+from corpus_registry import CORPORA_FILE, load_corpora
+
+
+def ingest_directory(args, path, embeddings):
+    corpus = CorpusIndex(path, embeddings, args.chunk_size, args.chunk_overlap,
+                         cache_dir=args.cache_dir, index_type=args.index_type)
+    if corpus.exists() and not args.force:
+        corpus.load()
+    changes = corpus.sync()
+    if not any(changes.values()):
+        print(f"✅ Corpus index {corpus.key} is up to date ({len(corpus.files)} files).")
+    else:
+        print(f"✅ Corpus index {corpus.key} synced to version {corpus.version}.")
+
+    if args.watch:
+        print(f"Watching {corpus.directory} every {args.watch_interval}s (Ctrl+C to stop)...")
+        try:
+            while True:
+                time.sleep(args.watch_interval)
+                corpus.sync()
+        except KeyboardInterrupt:
+            pass
+
+
+def ingest_path(args, path, embeddings):
+    if os.path.isdir(path):
+        ingest_directory(args, path, embeddings)
+        return
+
+    key = pdf_index_key(path, args.chunk_size, args.chunk_overlap, embeddings.model, args.index_type)
+    if index_exists(key, args.cache_dir) and not args.force:
+        print(f"✅ Index {key} is up to date. Use --force to rebuild.")
+        return
+
+    _, meta = build_index(
+        path, embeddings,
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, cache_dir=args.cache_dir,
+        index_type=args.index_type,
+    )
+    print(f"✅ Built index {meta['key']}: {meta['num_chunks']} chunks from {meta['num_pages']} pages.")
+    stats = embeddings.cache.stats
+    print(f"   Embedding cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses "
+          f"({embeddings.cache.hit_rate():.0%} hit rate)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the persisted vector index for a PDF or a directory.")
+    parser.add_argument("pdf_path", nargs="?", default="project_nova_brief.pdf", help="PDF file or document directory.")
+    parser.add_argument("--cache-dir", default=INDEX_CACHE_DIR)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if a valid index exists.")
+    parser.add_argument("--watch", action="store_true", help="Directories only: keep syncing changes.")
+    parser.add_argument("--watch-interval", type=float, default=5.0)
+    parser.add_argument("--embedding-backend", default=EMBEDDING_BACKEND, choices=EMBEDDING_BACKENDS,
+                        help="Remote OpenRouter embeddings or a local sentence-transformers model.")
+    parser.add_argument("--index-type", default=INDEX_TYPE, choices=INDEX_TYPES,
+                        help="flat (exact) or an approximate / compressed index for large corpora.")
+    parser.add_argument("--embedding-dim", type=int, default=EMBEDDING_DIM,
+                        help="Truncate vectors to this many dimensions (0 = full size).")
+    parser.add_argument("--corpora", nargs="?", const=CORPORA_FILE,
+                        help="Ingest every corpus in this JSON file (default: corpora.json) instead of pdf_path.")
+    args = parser.parse_args()
+
+    if args.embedding_backend == "openrouter" and not OPENROUTER_API_KEY:
+        print("❌ ERROR: OPENROUTER_API_KEY not found. Please check your .env file.")
+        sys.exit(1)
+
+    embeddings = make_embeddings(
+        args.embedding_backend, cache=EmbeddingCache(), api_key=OPENROUTER_API_KEY,
+        api_base=OPENROUTER_API_BASE, model=EMBEDDING_MODEL, dim=args.embedding_dim,
+    )
+    if args.corpora:
+        if args.watch:
+            print("❌ ERROR: --watch takes a single directory, not --corpora.")
+            sys.exit(1)
+        for name, path in load_corpora(args.corpora).items():
+            print(f"--- Corpus {name}: {path} ---")
+            ingest_path(args, path, embeddings)
+    else:
+        ingest_path(args, args.pdf_path, embeddings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Streaming ingest pipeline for large PDFs.
+
+    parse (process pool) -> split -> embed (threads) -> index
+
+Pages are parsed in worker processes a range at a time, split into chunks as
+they arrive, and embedded in batches while parsing continues. Every hand-off is
+a bounded queue, so only a few batches are in memory at once, and ingest time
+tracks the slowest stage rather than the sum of all of them.
+"""
+import os
+import time
+import queue
+import threading
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from index_store import INDEX_TYPE, build_vector_store
+
+# --- Configuration ---
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_PAGES_PER_TASK = int(os.getenv("RAG_INGEST_PAGES_PER_TASK", "8"))
+# Batches allowed to wait between two stages
+INGEST_QUEUE_SIZE = int(os.getenv("RAG_INGEST_QUEUE_SIZE", "8"))
+# Index types that can take vectors batch by batch; the others are trained once all vectors are in
+INCREMENTAL_INDEX_TYPES = ("flat", "hnsw")
+
+# One PdfReader per worker process and file, so each task doesn't re-parse the cross-reference table
+_readers = {}
+
+
+def _parse_pages(path, start, stop):
+    """Worker: returns ([(page number, text)], seconds spent) for pages [start, stop)."""
+    from pypdf import PdfReader
+
+    began = time.perf_counter()
+    reader = _readers.get(path)
+    if reader is None:
+        reader = _readers[path] = PdfReader(path)
+    pages = [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+    return pages, time.perf_counter() - began
+
+
+def count_pages(path):
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+class StageTimer:
+    """Busy time per stage, summed across that stage's workers."""
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+
+def iter_pages(path, workers=INGEST_WORKERS, pages_per_task=INGEST_PAGES_PER_TASK, timer=None):
+    """Yields page Documents in order, parsing ahead with at most 2 tasks per worker in flight."""
+    from langchain_core.documents import Document
+
+    num_pages = count_pages(path)
+    ranges = iter([(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(_parse_pages, path, *r) for _, r in zip(range(workers * 2), ranges))
+        while pending:
+            pages, seconds = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_parse_pages, path, *next_range))
+            if timer is not None:
+                timer.add("parse", seconds / workers)
+            for page, text in pages:
+                # Same metadata PyPDFLoader attaches
+                yield Document(page_content=text, metadata={"source": path, "page": page})
+
+
+def iter_chunk_batches(pages, splitter, batch_size, timer=None):
+    """Splits pages as they arrive and yields lists of `batch_size` chunks."""
+    batch = []
+    for page in pages:
+        start = time.perf_counter()
+        batch.extend(splitter.split_documents([page]))
+        if timer is not None:
+            timer.add("split", time.perf_counter() - start)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+def run_pipeline(pdf_path, embeddings, chunk_size, chunk_overlap, index_type=INDEX_TYPE,
+                 workers=INGEST_WORKERS, embed_workers=None, queue_size=INGEST_QUEUE_SIZE):
+    """
+    Parses, splits, embeds and indexes `pdf_path` as a stream.
+    Returns (vector_store, stats) where stats has pages, chunks, per-stage seconds and wall time.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=True)
+    batch_size = getattr(embeddings, "batch_size", 64)
+    embed_workers = embed_workers or getattr(embeddings, "max_workers", 4)
+    timer = StageTimer()
+    to_embed = queue.Queue(maxsize=queue_size)
+    to_index = queue.Queue(maxsize=queue_size)
+    errors = []
+    counts = {"pages": 0}
+    wall_start = time.perf_counter()
+
+    def produce():
+        try:
+            def counted(pages):
+                for page in pages:
+                    counts["pages"] += 1
+                    yield page
+
+            pages = counted(iter_pages(pdf_path, workers=workers, timer=timer))
+            for seq, batch in enumerate(iter_chunk_batches(pages, splitter, batch_size, timer=timer)):
+                if errors:
+                    break
+                to_embed.put((seq, batch))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(embed_workers):
+                to_embed.put(None)
+
+    def embed():
+        try:
+            while True:
+                item = to_embed.get()
+                if item is None:
+                    return
+                if errors:
+                    continue  # keep draining so the producer never blocks
+                seq, batch = item
+                start = time.perf_counter()
+                try:
+                    texts = [chunk.page_content for chunk in batch]
+                    vectors = embeddings.embed_documents(texts)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                timer.add("embed", (time.perf_counter() - start) / embed_workers)
+                to_index.put((seq, batch, texts, vectors))
+        finally:
+            to_index.put(None)
+
+    threads = [threading.Thread(target=produce, name="ingest-parse", daemon=True)]
+    threads += [threading.Thread(target=embed, name=f"ingest-embed-{i}", daemon=True) for i in range(embed_workers)]
+    for thread in threads:
+        thread.start()
+
+    # Index stage runs here, on the calling thread
+    vector_store, buffered, chunks, finished = None, [], 0, 0
+    # Embed workers finish out of order; batches are indexed by sequence number so docstore
+    # positions follow page order (which is also what lets the chunk store share overlaps)
+    ready, next_seq = {}, 0
+    incremental = index_type in INCREMENTAL_INDEX_TYPES
+    try:
+        while finished < embed_workers:
+            item = to_index.get()
+            if item is None:
+                finished += 1
+                continue
+            if errors:
+                continue
+            seq, batch, texts, vectors = item
+            ready[seq] = (batch, texts, vectors)
+            while next_seq in ready:
+                batch, texts, vectors = ready.pop(next_seq)
+                next_seq += 1
+                chunks += len(batch)
+                start = time.perf_counter()
+                text_embeddings = list(zip(texts, vectors))
+                metadatas = [chunk.metadata for chunk in batch]
+                if not incremental:
+                    buffered.append((text_embeddings, metadatas))
+                elif vector_store is None:
+                    vector_store = build_vector_store(text_embeddings, embeddings, metadatas=metadatas,
+                                                      index_type=index_type)
+                else:
+                    vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+                timer.add("index", time.perf_counter() - start)
+    except BaseException as e:
+        # Stops the producer and makes the embed workers skip what is left
+        errors.append(e)
+        raise
+    finally:
+        # Drain so no worker stays blocked on a full queue, then wait for them
+        while finished < embed_workers:
+            if to_index.get() is None:
+                finished += 1
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    if buffered:
+        # Trained index types need every vector before they can be built
+        start = time.perf_counter()
+        vector_store = build_vector_store([te for tes, _ in buffered for te in tes], embeddings,
+                                          metadatas=[m for _, ms in buffered for m in ms], index_type=index_type)
+        timer.add("index", time.perf_counter() - start)
+    if vector_store is None:
+        raise ValueError(f"No text could be extracted from {pdf_path}")
+
+    stats = {
+        "pages": counts["pages"],
+        "chunks": chunks,
+        "stage_seconds": dict(timer.seconds),
+        "wall_seconds": time.perf_counter() - wall_start,
+    }
+    return vector_store, stats
+
+
+def print_stats(stats):
+    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stats["stage_seconds"].items())
+    print(f"Ingested {stats['pages']} pages -> {stats['chunks']} chunks in {stats['wall_seconds']:.2f}s "
+          f"(busy per stage: {stages})")
@@ -0,0 +1,107 @@
+"""
+In-process BM25 inverted index over the indexed chunks.
+
+Lets exact-term questions ("Orion", "CyberGuard", "AES-256") be answered
+without the remote query-embedding round trip, and supplies the lexical half
+of hybrid retrieval (reciprocal rank fusion with the vector results).
+"""
+import re
+import math
+from collections import defaultdict, Counter
+from typing import Dict, Iterable, List, Tuple
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "what", "who", "whom", "when", "where", "why", "how",
+    "which", "of", "for", "to", "in", "on", "at", "and", "or", "be", "by", "with", "does", "do", "did",
+    "much", "many", "must", "it", "its", "this", "that", "there", "as", "from", "used", "s",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses ranked ID lists; each list contributes 1 / (k + rank) per ID."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self._total_length = 0
+
+    @classmethod
+    def from_texts(cls, items: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        """Builds an index from (doc_id, text) pairs."""
+        index = cls(**kwargs)
+        for doc_id, text in items:
+            index.add(doc_id, text)
+        return index
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: str, text: str):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self._total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            self.postings[term].pop(doc_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        self._total_length -= self.doc_lengths.pop(doc_id)
+
+    def idf(self, term: str) -> float:
+        n = len(self.doc_lengths)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns up to k (doc_id, BM25 score) pairs, best first."""
+        if not self.doc_lengths:
+            return []
+        avgdl = self._total_length / len(self.doc_lengths)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def coverage(self, query: str, doc_id: str) -> float:
+        """
+        IDF-weighted share of the query's terms that occur in `doc_id` (0-1).
+        Terms the corpus has never seen count at full weight, so questions about
+        things the document doesn't mention score low.
+        """
+        terms = set(tokenize(query))
+        if not terms or doc_id not in self.doc_terms:
+            return 0.0
+        doc_terms = self.doc_terms[doc_id]
+        weights = {t: self.idf(t) for t in terms}
+        total = sum(weights.values())
+        matched = sum(w for t, w in weights.items() if t in doc_terms)
+        return matched / total if total else 0.0
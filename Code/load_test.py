@@ -0,0 +1,178 @@
+"""
+Offline load test and benchmark suite.
+
+Starts the local OpenRouter stand-in (mock_openrouter.py), then:
+
+1. Drives RAG_Engine.aquery with an open-loop load generator: questions arrive
+   at the target QPS whether or not earlier ones have finished, and latency is
+   measured from each question's scheduled arrival, so queueing delay is not
+   hidden when the system falls behind.
+2. Measures ingest time versus corpus size on synthetic PDFs built by repeating
+   the Project Nova brief.
+
+    python load_test.py --qps 20 --duration 30 --chat-latency 0.8 --error-rate 0.01
+    python load_test.py --skip-load --corpus-pages 1,10,50
+    python load_test.py --same-questions --skip-ingest   # bursts of identical questions (single-flight)
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from hedging import DEGRADED_PREFIX
+from mock_openrouter import MockOpenRouter
+from calculate_latency import percentile, load_spans, summarize, print_report
+from run_history import record_run, run_config
+
+
+def make_corpus_pdf(path, copies):
+    """Writes a PDF containing `copies` renumbered copies of the Project Nova brief."""
+    from fpdf import FPDF
+    from generate_pdf import content
+
+    pdf = FPDF()
+    pdf.set_font("Arial", size=12)
+    for copy in range(copies):
+        pdf.add_page()
+        for line in content.strip().split("\n"):
+            line = line.replace("Project Nova", f"Project Nova-{copy}")
+            pdf.multi_cell(0, 8, txt=line.encode("latin-1", "replace").decode("latin-1"))
+    pdf.output(path)
+
+
+async def open_loop(engine, questions, qps, duration, poisson=True, seed=0, unique=True):
+    """
+    Fires questions at `qps` for `duration` seconds; returns (latencies of
+    answered questions, errors, degraded answers, wall time).
+    """
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    latencies, errors, degraded, tasks = [], 0, 0, []
+
+    async def fire(question, scheduled):
+        nonlocal errors, degraded
+        answer = await engine.aquery(question)
+        if answer.startswith("Error occurred during query"):
+            errors += 1
+        elif answer.startswith(DEGRADED_PREFIX):
+            # The model missed the deadline: not a success, and its latency is the deadline's
+            degraded += 1
+        else:
+            latencies.append(loop.time() - scheduled)
+
+    start = loop.time()
+    next_arrival = start
+    i = 0
+    while next_arrival - start < duration:
+        delay = next_arrival - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Unique suffix so the embedding and answer caches (and single-flight) can't absorb the load
+        question = f"{questions[i % len(questions)]} (#{i})" if unique else questions[i % len(questions)]
+        tasks.append(asyncio.create_task(fire(question, next_arrival)))
+        i += 1
+        next_arrival += rng.expovariate(qps) if poisson else 1.0 / qps
+    await asyncio.gather(*tasks)
+    return latencies, errors, degraded, loop.time() - start
+
+
+def run_load_test(args, tmp):
+    from rag_engine import RAG_Engine
+    from evaluate import test_cases
+
+    engine = RAG_Engine(args.pdf, cache_dir=os.path.join(tmp, "index"), use_answer_cache=args.answer_cache,
+                        retrieval_mode=args.retrieval_mode)
+    questions = [t["question"] for t in test_cases]
+    latencies, errors, degraded, wall = asyncio.run(open_loop(engine, questions, args.qps, args.duration, not args.uniform,
+                                                    unique=not args.same_questions))
+
+    sent = len(latencies) + errors + degraded
+    print("\n" + "=" * 40)
+    print("LOAD TEST (open loop)")
+    print("=" * 40)
+    print(f"Target QPS: {args.qps} for {args.duration}s ({'uniform' if args.uniform else 'Poisson'} arrivals), "
+          f"retrieval mode: {args.retrieval_mode}")
+    print(f"Sent: {sent} | Succeeded: {len(latencies)} | Errors: {errors} ({errors / max(sent, 1) * 100:.1f}%) | "
+          f"Degraded: {degraded} ({degraded / max(sent, 1) * 100:.1f}%)")
+    print(f"Throughput: {len(latencies) / wall:.1f} answers/s over {wall:.1f}s")
+    if latencies:
+        print(f"Latency p50: {percentile(latencies, 50):.2f}s | p95: {percentile(latencies, 95):.2f}s | "
+              f"p99: {percentile(latencies, 99):.2f}s | max: {max(latencies):.2f}s")
+    if engine.single_flight is not None:
+        stats = engine.single_flight.stats
+        print(f"Single-flight: {stats['leaders']} upstream calls, {stats['coalesced']} coalesced "
+              f"({engine.single_flight.coalesced_rate() * 100:.1f}%), {stats['errors']} failed flights")
+    if os.path.exists(os.environ["RAG_TRACE_PATH"]):
+        print("\nPer-stage latency (ms):")
+        print_report(summarize(load_spans(os.environ["RAG_TRACE_PATH"])))
+    # Latency of every answered request (failed and degraded ones are counted in `errors` / `degraded`)
+    record_run("load_test", [{"ID": str(i + 1), "Time": seconds} for i, seconds in enumerate(latencies)],
+               run_config(engine, qps=args.qps, duration=args.duration, arrivals="uniform" if args.uniform else "poisson",
+                          chat_latency=args.chat_latency, embedding_latency=args.embedding_latency,
+                          error_rate=args.error_rate, errors=errors, degraded=degraded,
+                          same_questions=args.same_questions))
+
+
+def run_ingest_benchmark(args, tmp):
+    from rag_engine import OPENROUTER_API_KEY, OPENROUTER_API_BASE, EMBEDDING_MODEL, build_index
+    from embeddings import OpenRouterEmbeddings
+
+    print("\n" + "=" * 40)
+    print("INGEST TIME vs CORPUS SIZE")
+    print("=" * 40)
+    rows = []
+    for copies in [int(n) for n in args.corpus_pages.split(",")]:
+        pdf_path = os.path.join(tmp, f"corpus_{copies}.pdf")
+        make_corpus_pdf(pdf_path, copies)
+        # No embedding cache: every chunk is embedded, as on a first ingest
+        embeddings = OpenRouterEmbeddings(model=EMBEDDING_MODEL, api_key=OPENROUTER_API_KEY,
+                                          api_base=OPENROUTER_API_BASE)
+        start = time.perf_counter()
+        _, meta = build_index(pdf_path, embeddings, cache_dir=os.path.join(tmp, f"ingest_{copies}"))
+        elapsed = time.perf_counter() - start
+        rows.append((copies, meta["num_chunks"], elapsed))
+
+    print(f"\n{'Brief copies':>12}{'Chunks':>10}{'Ingest':>10}{'Chunks/s':>10}")
+    for copies, chunks, elapsed in rows:
+        print(f"{copies:>12}{chunks:>10}{elapsed:>9.2f}s{chunks / elapsed:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against a local OpenRouter stand-in.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--qps", type=float, default=10.0, help="Target arrival rate.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load.")
+    parser.add_argument("--uniform", action="store_true", help="Evenly spaced arrivals instead of Poisson.")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the answer cache enabled.")
+    parser.add_argument("--same-questions", action="store_true",
+                        help="Repeat the test questions verbatim, so identical ones overlap in flight.")
+    parser.add_argument("--retrieval-mode", default="vector", choices=["vector", "hybrid", "lexical", "auto"])
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.8)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--corpus-pages", default="1,5,20", help="Comma-separated corpus sizes (brief copies).")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-ingest", action="store_true")
+    args = parser.parse_args()
+
+    mock = MockOpenRouter(embedding_latency=args.embedding_latency, chat_latency=args.chat_latency,
+                          jitter=args.jitter, error_rate=args.error_rate, seed=0)
+    with mock, tempfile.TemporaryDirectory() as tmp:
+        # rag_engine reads its configuration at import time, so point it at the stub first
+        os.environ["OPENROUTER_API_BASE"] = mock.base_url
+        os.environ["OPENROUTER_API_KEY"] = "stub"
+        os.environ["RAG_EMBEDDING_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        os.environ["RAG_TRACE_PATH"] = os.path.join(tmp, "spans.jsonl")
+
+        if not args.skip_load:
+            run_load_test(args, tmp)
+        if not args.skip_ingest:
+            run_ingest_benchmark(args, tmp)
+        print(f"\nMock server stats: {mock.stats}")
+
+
+if __name__ == "__main__":
+    main()
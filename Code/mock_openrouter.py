@@ -0,0 +1,246 @@
+"""
+Local stand-in for the OpenRouter API, for benchmarks and offline runs.
+
+Serves `/api/v1/embeddings` and `/api/v1/chat/completions` (plain and
+streaming) with configurable latency, jitter and error injection. Embeddings are deterministic hashed
+bag-of-words vectors, so retrieval over them is meaningful, and chat answers
+are extracted from the context line that best overlaps the question, so
+evaluation scores are meaningful too.
+
+    python mock_openrouter.py --port 8900 --chat-latency 0.5
+    OPENROUTER_API_BASE=http://127.0.0.1:8900/api/v1 OPENROUTER_API_KEY=stub python evaluate.py
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ABSTAIN_ANSWER = "I do not have information on this topic based on the provided document."
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "what", "who", "when", "where", "how", "which", "of",
+    "for", "to", "in", "on", "and", "or", "be", "by", "with", "does", "do", "much", "many", "must",
+}
+
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def hashed_embedding(text, dim=1536):
+    """Deterministic, L2-normalised hashed bag-of-words vector."""
+    vector = [0.0] * dim
+    for token in _tokens(text):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def extractive_answer(prompt):
+    """Answers with the context line sharing the most content words with the question."""
+    context, _, question = prompt.rpartition("Question:")
+    if "Context:" in context:
+        context = context.split("Context:", 1)[1]
+    wanted = set(_tokens(question)) - STOPWORDS
+    best_line, best_overlap = None, 0
+    for line in context.splitlines():
+        overlap = len(wanted & set(_tokens(line)))
+        if overlap > best_overlap:
+            best_line, best_overlap = line.strip(), overlap
+    return best_line if best_line else ABSTAIN_ANSWER
+
+
+class MockOpenRouter:
+    """Threaded HTTP server speaking the subset of the OpenRouter API we use."""
+
+    def __init__(self, host="127.0.0.1", port=0, embedding_latency=0.0, chat_latency=0.0, dim=1536,
+                 jitter=0.0, error_rate=0.0, error_status=500, seed=None, prompt_latency=0.0):
+        """
+        Latencies are in seconds; `prompt_latency` is added to a chat completion's
+        time to first token per 1000 prompt tokens, so longer prompts answer slower. `jitter` scales each latency by a random factor
+        in [1 - jitter, 1 + jitter]; `error_rate` is the fraction of requests
+        answered with `error_status` instead of a result.
+        """
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.prompt_latency = prompt_latency
+        self.dim = dim
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.stats = {"embedding_requests": 0, "embedded_texts": 0, "chat_requests": 0, "errors_injected": 0}
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def latency(self, base):
+        if not self.jitter:
+            return base
+        return max(0.0, base * self._random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def should_fail(self):
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _make_handler(mock):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if mock.should_fail():
+                    mock._count(errors_injected=1)
+                    self._send_json(mock.error_status, {"error": {"message": "Injected failure", "code": mock.error_status}})
+                elif self.path.endswith("/embeddings"):
+                    self._embeddings(request)
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(request)
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _embeddings(self, request):
+                texts = request.get("input", [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                mock._count(embedding_requests=1, embedded_texts=len(texts))
+                time.sleep(mock.latency(mock.embedding_latency))
+                self._send_json(200, {
+                    "object": "list",
+                    "model": request.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": hashed_embedding(t, mock.dim)}
+                        for i, t in enumerate(texts)
+                    ],
+                    "usage": {"prompt_tokens": sum(len(_tokens(t)) for t in texts)},
+                })
+
+            def _chat(self, request):
+                mock._count(chat_requests=1)
+                prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+                answer = extractive_answer(prompt)
+                # Prefill: time grows with the prompt
+                time.sleep(mock.latency(mock.prompt_latency * len(_tokens(prompt)) / 1000))
+                completion_id = f"mock-{time.time_ns()}"
+                if request.get("stream"):
+                    self._stream_chat(request, completion_id, answer)
+                    return
+                time.sleep(mock.latency(mock.chat_latency))
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(_tokens(prompt)),
+                        "completion_tokens": len(_tokens(answer)),
+                        "total_tokens": len(_tokens(prompt)) + len(_tokens(answer)),
+                    },
+                })
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream_chat(self, request, completion_id, answer):
+                """Server-sent events; half the latency before the first token, the rest spread over tokens."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = re.findall(r"\S+\s*", answer) or [answer]
+                total_latency = mock.latency(mock.chat_latency)
+                time.sleep(total_latency / 2)
+                for i, piece in enumerate(pieces + [None]):
+                    delta = {"content": piece} if piece is not None else {}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None if piece is not None else "stop"}],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    if piece is not None:
+                        time.sleep(total_latency / 2 / len(pieces))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenRouter stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings call.")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="Seconds per chat completion.")
+    parser.add_argument("--prompt-latency", type=float, default=0.0, help="Extra seconds per 1000 prompt tokens.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Relative latency jitter, e.g. 0.2 for +/-20%%.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    mock = MockOpenRouter(args.host, args.port, args.embedding_latency, args.chat_latency,
+                          jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+                          prompt_latency=args.prompt_latency)
+    print(f"Mock OpenRouter listening on {mock.base_url}")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Client for query_service.py with the parts of the RAG_Engine interface that
+app.py, evaluate.py and batch_runner.py use (query, timed_query, aquery,
+stream_query), so they can share one service instead of each loading an engine.
+"""
+import os
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import requests
+
+QUERY_SERVICE_URL = os.getenv("RAG_QUERY_SERVICE_URL")
+
+
+def _documents(sources):
+    """Source dicts back into objects shaped like LangChain Documents."""
+    return [SimpleNamespace(page_content=s["content"], metadata={"source": s["source"], "page": s["page"]})
+            for s in sources]
+
+
+class RemoteQueryStream:
+    """Same shape as rag_engine.QueryStream: iterate for tokens, then read `timings`."""
+    def __init__(self, response):
+        self._events = (json.loads(line[len(b"data: "):]) for line in response.iter_lines()
+                        if line.startswith(b"data: "))
+        first = next(self._events)
+        if "error" in first:
+            raise RuntimeError(first["error"])
+        self.sources = _documents(first["sources"])
+        self.cache_hit = first["cache_hit"]
+        self.abstained = first.get("abstained", False)
+        self.coalesced = first.get("coalesced", False)
+        self.answer = None
+        self.timings = None
+        self.outcome = None
+
+    def __iter__(self):
+        parts = []
+        for event in self._events:
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            if event.get("done"):
+                self.timings = event["timings"]
+                self.outcome = event.get("outcome")
+                break
+            parts.append(event["token"])
+            yield event["token"]
+        self.answer = "".join(parts)
+
+
+class QueryServiceClient:
+    def __init__(self, base_url: str = QUERY_SERVICE_URL, timeout: float = 120, corpus: str = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.corpus = corpus
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """One requests.Session per thread: Streamlit shares a cached client across script threads."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def ready(self) -> bool:
+        try:
+            return self.session.get(f"{self.base_url}/readyz", timeout=5).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def corpora(self):
+        """Corpus names the service routes to (empty unless it runs with --corpora)."""
+        return self.session.get(f"{self.base_url}/corpora", timeout=5).json()["corpora"]
+
+    def _body(self, user_question, history):
+        body = {"question": user_question}
+        if self.corpus is not None:
+            body["corpus"] = self.corpus
+        if history:
+            body["history"] = history.to_dict()
+        return body
+
+    def stream_query(self, user_question, history=None):
+        response = self.session.post(f"{self.base_url}/query/stream", json=self._body(user_question, history),
+                                     stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        return RemoteQueryStream(response)
+
+    def query(self, user_question, history=None):
+        return self.timed_query(user_question, history)[0]
+
+    def timed_query(self, user_question, history=None):
+        try:
+            response = self.session.post(f"{self.base_url}/query", json=self._body(user_question, history),
+                                         timeout=self.timeout)
+            result = response.json()
+            if response.status_code != 200:
+                return result.get("error", f"Error occurred during query: HTTP {response.status_code}"), {}
+            return result["answer"], result["timings"]
+        except Exception as e:
+            return f"Error occurred during query: {e}", {}
+
+    async def aquery(self, user_question, history=None):
+        return await asyncio.get_running_loop().run_in_executor(None, self.query, user_question, history)
@@ -0,0 +1,334 @@
+"""
+Shared HTTP query service around a single RAG_Engine.
+
+Every Streamlit worker used to load its own engine (and index) and send its own
+embedding request per question. Run one of these instead and point the UI and
+evaluate.py at it with RAG_QUERY_SERVICE_URL. Query embeddings from concurrent
+requests are collected into micro-batches (`--batch-wait-ms`), so simultaneous
+questions share one embedding call.
+
+    python query_service.py --pdf project_nova_brief.pdf --port 8800 --batch-wait-ms 5
+
+Endpoints:
+    POST /query          {"question": "...", "history": optional ConversationHistory.to_dict(),
+                          "corpus": optional corpus name (with --corpora)}
+                         -> {"answer", "sources", "timings", "cache_hit", "abstained", "outcome", "coalesced"}
+    POST /query/stream   the same as server-sent events: sources, then tokens, then timings
+    GET  /healthz        the process is up
+    GET  /readyz         the engine is loaded (503 while loading or after a failed load)
+    GET  /corpora        corpus names and which are loaded (with --corpora)
+    GET  /metrics        Prometheus text format
+
+With `--corpora corpora.json`, queries naming a corpus are routed to a
+CorpusRegistry that loads indexes on demand within RAG_CORPUS_MEMORY_BUDGET_MB;
+queries without one go to `--pdf`.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conversation import ConversationHistory
+from corpus_registry import CORPUS_MEMORY_BUDGET_MB
+
+# --- Configuration ---
+QUERY_SERVICE_HOST = os.getenv("RAG_QUERY_SERVICE_HOST", "127.0.0.1")
+QUERY_SERVICE_PORT = int(os.getenv("RAG_QUERY_SERVICE_PORT", "8800"))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("RAG_QUERY_BATCH_MAX_WAIT_MS", "5"))
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# (metric, hedging.GenerationStats field)
+GENERATION_METRICS = (
+    ("rag_llm_generations_total", "generations"),
+    ("rag_llm_hedged_total", "hedged"),
+    ("rag_llm_failovers_total", "failovers"),
+    ("rag_llm_fallback_wins_total", "fallback_wins"),
+    ("rag_llm_deadline_exceeded_total", "timeouts"),
+    ("rag_llm_degraded_answers_total", "degraded"),
+    ("rag_llm_failed_total", "failed"),
+    ("rag_llm_errors_total", "errors"),
+)
+# (metric, SingleFlight.stats key)
+SINGLE_FLIGHT_METRICS = (
+    ("rag_single_flight_leaders_total", "leaders"),
+    ("rag_single_flight_coalesced_total", "coalesced"),
+    ("rag_single_flight_errors_total", "errors"),
+)
+
+
+def serialize_sources(sources):
+    return [
+        {"source": doc.metadata.get("source"), "page": doc.metadata.get("page"), "content": doc.page_content}
+        for doc in sources
+    ]
+
+
+class ServiceMetrics:
+    """Request counters, an in-flight gauge and a latency histogram, rendered for Prometheus."""
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.in_flight = 0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, path, status, seconds=None, cache_hit=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[(path, status)] += 1
+            if cache_hit:
+                self.cache_hits[cache_hit] += 1
+            if seconds is not None:
+                self.latency_count += 1
+                self.latency_sum += seconds
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if seconds <= bound:
+                        self.latency_buckets[i] += 1
+
+    def render(self, service):
+        lines = [
+            "# TYPE rag_requests_total counter",
+            *(f'rag_requests_total{{path="{path}",status="{status}"}} {count}'
+              for (path, status), count in sorted(self.requests.items())),
+            "# TYPE rag_requests_in_flight gauge",
+            f"rag_requests_in_flight {self.in_flight}",
+            "# TYPE rag_query_seconds histogram",
+            *(f'rag_query_seconds_bucket{{le="{bound}"}} {count}'
+              for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets)),
+            f'rag_query_seconds_bucket{{le="+Inf"}} {self.latency_count}',
+            f"rag_query_seconds_sum {self.latency_sum:.6f}",
+            f"rag_query_seconds_count {self.latency_count}",
+            "# TYPE rag_answer_cache_hits_total counter",
+            *(f'rag_answer_cache_hits_total{{tier="{tier}"}} {count}' for tier, count in sorted(self.cache_hits.items())),
+            "# TYPE rag_engine_ready gauge",
+            f"rag_engine_ready {int(service.state == 'ready')}",
+        ]
+        # Generation and single-flight counters per corpus ("default" is the engine for the --pdf)
+        per_corpus = []
+        if service.engine is not None:
+            per_corpus.append(("default", service.engine.generation_stats, service.engine.single_flight))
+        if service.registry is not None:
+            per_corpus += [(name, stats, flights)
+                           for name, (stats, flights) in sorted(service.registry.stats_by_corpus().items())]
+        for metric, field in GENERATION_METRICS:
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{corpus="{name}"}} {stats.counts[field]}' for name, stats, _ in per_corpus]
+        flights = [(name, f) for name, _, f in per_corpus if f is not None]
+        if flights:
+            for metric, field in SINGLE_FLIGHT_METRICS:
+                lines.append(f"# TYPE {metric} counter")
+                lines += [f'{metric}{{corpus="{name}"}} {f.stats[field]}' for name, f in flights]
+            lines.append("# TYPE rag_single_flight_in_flight gauge")
+            lines += [f'rag_single_flight_in_flight{{corpus="{name}"}} {f.in_flight()}' for name, f in flights]
+        registry = service.registry
+        if registry is not None:
+            lines += [
+                "# TYPE rag_corpora_loaded gauge",
+                f"rag_corpora_loaded {len(registry.loaded())}",
+                "# TYPE rag_corpora_resident_bytes gauge",
+                f"rag_corpora_resident_bytes {registry.resident_bytes()}",
+                "# TYPE rag_corpus_evictions_total counter",
+                f"rag_corpus_evictions_total {registry.stats['evictions']}",
+            ]
+        batcher = service.batcher
+        if batcher is not None:
+            lines += [
+                "# TYPE rag_embedding_batches_total counter",
+                f"rag_embedding_batches_total {batcher.stats['batches']}",
+                "# TYPE rag_embedding_batched_queries_total counter",
+                f"rag_embedding_batched_queries_total {batcher.stats['texts']}",
+                "# TYPE rag_embedding_batch_size_mean gauge",
+                f"rag_embedding_batch_size_mean {batcher.mean_batch_size():.3f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class QueryService:
+    """Loads the engine in the background and serves it over HTTP."""
+
+    def __init__(self, pdf_path, host=QUERY_SERVICE_HOST, port=QUERY_SERVICE_PORT,
+                 batch_wait_ms=QUERY_BATCH_MAX_WAIT_MS, corpora=None, memory_budget_mb=CORPUS_MEMORY_BUDGET_MB,
+                 **engine_kwargs):
+        self.pdf_path = pdf_path
+        self.batch_wait_ms = batch_wait_ms
+        self.corpora = corpora
+        self.memory_budget_mb = memory_budget_mb
+        self.engine_kwargs = engine_kwargs
+        self.engine = None
+        self.registry = None
+        self.batcher = None
+        self.state = "loading"
+        self.error = None
+        self.metrics = ServiceMetrics()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load_engine(self):
+        from rag_engine import RAG_Engine
+        from embeddings import BatchingEmbeddings
+
+        try:
+            engine = RAG_Engine(self.pdf_path, **self.engine_kwargs)
+            # Before warm_up, so the loaded store and every query use the batching path /metrics measures
+            engine.embeddings = BatchingEmbeddings(engine.embeddings, self.batch_wait_ms)
+            self.batcher = engine.embeddings.batcher
+            engine.warm_up()
+            if self.corpora:
+                from corpus_registry import CorpusRegistry
+
+                # Corpora share the default engine's micro-batched embeddings
+                self.registry = CorpusRegistry(self.corpora, self.memory_budget_mb, embeddings=engine.embeddings,
+                                               **self.engine_kwargs)
+            self.engine = engine
+            self.state = "ready"
+            print(f"✅ Engine ready; serving on {self.url}")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"❌ Engine failed to load: {e}")
+
+    def _make_handler(service):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_event(self, payload):
+                data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/healthz":
+                    self._send(200, {"status": "ok"})
+                elif self.path == "/readyz":
+                    status = 200 if service.state == "ready" else 503
+                    self._send(status, {"status": service.state, "error": service.error})
+                elif self.path == "/corpora":
+                    registry = service.registry
+                    names = registry.names() if registry is not None else []
+                    loaded = registry.loaded() if registry is not None else {}
+                    self._send(200, {"corpora": names, "loaded": loaded})
+                elif self.path == "/metrics":
+                    body = service.metrics.render(service).encode("utf-8")
+                    self._send(200, body, "text/plain; version=0.0.4")
+                else:
+                    self._send(404, {"error": f"Unknown path {self.path}"})
+
+            def do_POST(self):
+                if self.path not in ("/query", "/query/stream"):
+                    self._send(404, {"error": f"Unknown path {self.path}"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    question = body["question"]
+                    history = ConversationHistory.from_dict(body["history"]) if body.get("history") else None
+                    corpus = body.get("corpus")
+                except (ValueError, KeyError, TypeError):
+                    self._send(400, {"error": 'Expected a JSON body like {"question": "..."}'})
+                    return
+                if service.state != "ready":
+                    self._send(503, {"error": f"Engine is {service.state}", "detail": service.error})
+                    return
+                if corpus is not None and (service.registry is None or corpus not in service.registry.corpora):
+                    self._send(404, {"error": f"Unknown corpus {corpus!r}"})
+                    return
+
+                service.metrics.begin()
+                start, status, cache_hit, streaming = time.time(), 500, None, False
+                try:
+                    engine = service.engine if corpus is None else service.registry.get(corpus)
+                    stream = engine.stream_query(question, history)
+                    cache_hit = stream.cache_hit
+                    if self.path == "/query":
+                        answer = "".join(stream)
+                        self._send(200, {"answer": answer, "sources": serialize_sources(stream.sources),
+                                         "timings": stream.timings, "cache_hit": cache_hit,
+                                         "abstained": stream.abstained, "outcome": stream.outcome,
+                                         "coalesced": stream.coalesced})
+                    else:
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/event-stream")
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                        streaming = True
+                        self._write_event({"sources": serialize_sources(stream.sources), "cache_hit": cache_hit,
+                                           "abstained": stream.abstained, "coalesced": stream.coalesced})
+                        for token in stream:
+                            self._write_event({"token": token})
+                        self._write_event({"done": True, "timings": stream.timings, "outcome": stream.outcome})
+                        self.wfile.write(b"0\r\n\r\n")
+                    status = 200
+                except Exception as e:
+                    if not streaming:
+                        self._send(500, {"error": f"Error occurred during query: {e}"})
+                    else:
+                        # The 200 and chunked headers are already out; report the failure in-band
+                        self._write_event({"error": f"Error occurred during query: {e}"})
+                        self.wfile.write(b"0\r\n\r\n")
+                finally:
+                    service.metrics.end(self.path, status, time.time() - start, cache_hit)
+
+        return Handler
+
+    def serve_forever(self):
+        threading.Thread(target=self.load_engine, name="engine-loader", daemon=True).start()
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shared RAG_Engine over HTTP.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf", help="PDF file or document directory.")
+    parser.add_argument("--host", default=QUERY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_SERVICE_PORT)
+    parser.add_argument("--batch-wait-ms", type=float, default=QUERY_BATCH_MAX_WAIT_MS,
+                        help="How long a query embedding waits for others to batch with.")
+    parser.add_argument("--build", action="store_true", help="Build the index if it is missing.")
+    parser.add_argument("--corpora", help="JSON file of {corpus name: path} to route queries by corpus.")
+    parser.add_argument("--memory-budget-mb", type=float, default=CORPUS_MEMORY_BUDGET_MB,
+                        help="RAM for loaded corpora; least recently used ones are evicted past it.")
+    args = parser.parse_args()
+
+    corpora = None
+    if args.corpora:
+        from corpus_registry import load_corpora
+        corpora = load_corpora(args.corpora)
+    service = QueryService(args.pdf, args.host, args.port, args.batch_wait_ms, corpora=corpora,
+                           memory_budget_mb=args.memory_budget_mb, build_if_missing=args.build)
+    print(f"Query service listening on {service.url} (loading {args.pdf}...)")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
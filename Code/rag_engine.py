@@ -1,133 +1,743 @@
 import os
-import streamlit as st
-import requests
 import json
-from typing import List
+import time
+import asyncio
+import logging
+import threading
 from dotenv import load_dotenv
 
 import warnings
 warnings.filterwarnings("ignore")
 
-# LangChain Imports
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+# Heavy dependencies (LangChain, FAISS, numpy, the OpenAI client) are imported
+# where they are first used, so importing this module stays cheap for CLIs.
+from embeddings import EMBEDDING_BACKEND, EMBEDDING_DIM, OpenRouterEmbeddings, make_embeddings
+from embedding_cache import EmbeddingCache
+from answer_cache import AnswerCache, cache_namespace
+from telemetry import Tracer, count_tokens
+from corpus_index import CorpusIndex
+from ingest_pipeline import run_pipeline, print_stats
+from context_assembly import CONTEXT_TOKEN_BUDGET, assemble_context
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from conversation import HISTORY_PROMPT_TOKENS
+from singleflight import SINGLE_FLIGHT, SingleFlight
+from hedging import (
+    QUERY_DEADLINE, HEDGE_AFTER, FALLBACK_MODEL, HedgedGeneration, GenerationStats, degraded_answer,
+)
+from index_store import (
+    INDEX_CACHE_DIR, INDEX_TYPE, INDEX_TYPES, INDEX_NPROBE, INDEX_EF_SEARCH, file_sha256, index_key, index_dir,
+    index_exists, save_index, load_index, configure_search,
+)
 
-# ✅ UPDATED: Chains are now in 'langchain_classic' in v1.0+
-from langchain_classic.chains import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.embeddings import Embeddings
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 load_dotenv()
 
+# app.py copies the key from Streamlit secrets into the environment before importing this module
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-# Fallback to streamlit secrets if not in env
-if not OPENROUTER_API_KEY and hasattr(st, "secrets"):
-    try:
-        OPENROUTER_API_KEY = st.secrets["OPENROUTER_API_KEY"]
-    except KeyError:
-        pass
-
-OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
+
+OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
 MODEL_NAME = "deepseek/deepseek-chat"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Defaults; compare alternatives with sweep.py
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+RETRIEVAL_K = int(os.getenv("RAG_RETRIEVAL_K", "3"))
+# "vector" (default), "hybrid" (BM25 + vector, reciprocal rank fusion), "lexical" (BM25 only),
+# or "auto" (BM25 fast path when its confidence is high, hybrid otherwise)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical", "auto")
+RETRIEVAL_CANDIDATES = 10
+LEXICAL_CONFIDENCE = float(os.getenv("RAG_LEXICAL_CONFIDENCE", "0.75"))
+# Questions whose best chunk scores below this get ABSTAIN_MESSAGE without an LLM call
+# (0 disables; pick a value with calibrate_threshold.py)
+ABSTAIN_THRESHOLD = float(os.getenv("RAG_ABSTAIN_THRESHOLD", "0"))
+ABSTAIN_MESSAGE = "I do not have information on this topic based on the provided document."
 
+PROMPT_TEMPLATE = """
+        You are an expert assistant for 'Project Nova'. Your task is to answer questions accurately based ONLY on the provided context.
+        If the answer is not available in the context, clearly state "I do not have information on this topic based on the provided document." Do not make up information.
 
-class OpenRouterEmbeddings(Embeddings):
-    """Custom embedding class for OpenRouter API."""
-    def __init__(self, model: str = "text-embedding-ada-002", api_key: str = None):
-        if not api_key:
-            raise ValueError("OpenRouter API key must be provided.")
-        self.model = model
-        self.api_key = api_key
-        self.api_url = "https://openrouter.ai/api/v1/embeddings"
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        Context:
+        {context}
 
-    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        response = requests.post(
-            self.api_url,
-            headers=self.headers,
-            data=json.dumps({"model": self.model, "input": texts})
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        return [item['embedding'] for item in response_data['data']]
+        Question: {input}
+        """
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self._get_embeddings(texts)
+# Used for follow-up questions: the same instructions plus the bounded conversation history
+CONVERSATION_PROMPT_TEMPLATE = """
+        You are an expert assistant for 'Project Nova'. Your task is to answer questions accurately based ONLY on the provided context.
+        If the answer is not available in the context, clearly state "I do not have information on this topic based on the provided document." Do not make up information.
+        Use the conversation only to understand what the question refers to.
 
-    def embed_query(self, text: str) -> List[float]:
-        return self._get_embeddings([text])[0]
+        Context:
+        {context}
+
+        Conversation:
+        {history}
+
+        Question: {input}
+        """
+
+
+def relevance_score(distance):
+    """Cosine similarity from a squared L2 distance between unit vectors (all our embeddings are normalized)."""
+    return 1.0 - distance / 2.0
+
+
+def pdf_index_key(pdf_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embedding_model=EMBEDDING_MODEL,
+                  index_type=INDEX_TYPE):
+    """Returns the persisted-index cache key for a PDF and the given settings."""
+    return index_key(file_sha256(pdf_path), chunk_size, chunk_overlap, embedding_model, index_type)
+
+
+def build_index(pdf_path, embeddings, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, cache_dir=INDEX_CACHE_DIR,
+                index_type=INDEX_TYPE):
+    """
+    Parses, splits and embeds a PDF as a stream (see ingest_pipeline.py), then
+    persists the resulting vector store. Returns (vector_store, index metadata).
+    """
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
+
+    # 1-3. Parse pages in worker processes, split and embed them as they arrive
+    print(f"Creating {index_type} vector store with {type(embeddings).__name__} ({embeddings.model})...")
+    vector_store, stats = run_pipeline(pdf_path, embeddings, chunk_size, chunk_overlap, index_type=index_type)
+    print_stats(stats)
+    print("Vector store created successfully.")
+
+    # 4. Persist it so later processes only have to load
+    key = pdf_index_key(pdf_path, chunk_size, chunk_overlap, embeddings.model, index_type)
+    meta = save_index(vector_store, key, {
+        "source": os.path.abspath(pdf_path),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": embeddings.model,
+        "index_type": index_type,
+        "num_pages": stats["pages"],
+        "num_chunks": stats["chunks"],
+        "ingest_seconds": round(stats["wall_seconds"], 3),
+    }, cache_dir=cache_dir)
+    print(f"Index saved to {index_dir(key, cache_dir)}")
+    return vector_store, meta
 
 
 class RAG_Engine:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                 cache_dir=INDEX_CACHE_DIR, build_if_missing=True, use_answer_cache=True,
+                 watch_interval=None, retrieval_mode=RETRIEVAL_MODE, embedding_backend=EMBEDDING_BACKEND,
+                 index_type=INDEX_TYPE, embedding_dim=EMBEDDING_DIM, nprobe=INDEX_NPROBE,
+                 ef_search=INDEX_EF_SEARCH, context_budget=CONTEXT_TOKEN_BUDGET,
+                 abstain_threshold=ABSTAIN_THRESHOLD, embeddings=None, retrieval_k=RETRIEVAL_K,
+                 deadline=QUERY_DEADLINE, hedge_after=HEDGE_AFTER, fallback_model=FALLBACK_MODEL,
+                 single_flight=SINGLE_FLIGHT):
         """
         Initializes the RAG engine using LangChain components.
+        `pdf_path` is a single PDF or a directory of PDF/text files.
+        Nothing heavy happens here: the persisted index is loaded on the first
+        query (or `warm_up()`), and built then if missing, unless
+        `build_if_missing` is False (serving processes), in which case
+        `python ingest.py` must be run first. For a directory, changed files are
+        re-indexed incrementally, and with `watch_interval` (seconds) changes are
+        picked up in the background without a restart. `retrieval_mode` is one
+        of RETRIEVAL_MODES; `embedding_backend` is "openrouter" or "local"
+        (sentence-transformers on CPU). `index_type` is one of INDEX_TYPES, with
+        `nprobe` / `ef_search` tuning the approximate ones; a non-zero
+        `embedding_dim` truncates vectors to that many dimensions. Retrieved
+        chunks are merged, de-duplicated and fitted to `context_budget` tokens
+        (0: no budget, None: pass them to the prompt unchanged). When the best
+        vector match scores below `abstain_threshold` (cosine similarity, 0
+        disables), the engine answers ABSTAIN_MESSAGE without calling the LLM.
+        Pass `embeddings` to share one embeddings backend between engines.
+        `retrieval_k` chunks are retrieved per question. Generation is bounded
+        by `deadline` seconds per query (then a flagged degraded answer is
+        returned) and hedged to `fallback_model` (default: the primary model)
+        when no token has arrived after `hedge_after` seconds; 0 disables either.
+        Repeated and near-identical questions are answered from an AnswerCache
+        unless `use_answer_cache` is False, and with `single_flight` identical
+        questions asked while one is still in flight share its upstream calls.
         """
         print("Initializing RAG Engine...")
-        
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval_mode must be one of {RETRIEVAL_MODES}, got {retrieval_mode!r}")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}, got {index_type!r}")
         if not OPENROUTER_API_KEY:
-             st.error("OpenRouter API Key not found. Please check your .env file or Streamlit secrets.")
-             raise ValueError("API Key missing")
-
-        # 1. Load the document
+            raise ValueError("OpenRouter API Key not found. Please check your .env file or Streamlit secrets.")
         if not os.path.exists(pdf_path):
-             raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
-             
-        loader = PyPDFLoader(pdf_path)
-        self.documents = loader.load()
-        print(f"Loaded {len(self.documents)} pages from the PDF.")
-
-        # 2. Split the document into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        self.split_docs = text_splitter.split_documents(self.documents)
-        print(f"Split the document into {len(self.split_docs)} chunks.")
-
-        # 3. Create embeddings and vector store
-        print("Creating vector store with custom OpenRouter embeddings...")
-        self.embeddings = OpenRouterEmbeddings(api_key=OPENROUTER_API_KEY)
-        self.vector_store = FAISS.from_documents(self.split_docs, embedding=self.embeddings)
-        print("Vector store created successfully.")
-
-        # 4. Initialize LLM
-        self.llm = ChatOpenAI(
-            model_name=MODEL_NAME,
+            raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
+
+        self.pdf_path = pdf_path
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.cache_dir = cache_dir
+        self.build_if_missing = build_if_missing
+        self.watch_interval = watch_interval
+        self.retrieval_mode = retrieval_mode
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.context_budget = context_budget
+        self.abstain_threshold = abstain_threshold
+        self.retrieval_k = retrieval_k
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model or MODEL_NAME
+        self.generation_stats = GenerationStats()
+        self.single_flight = SingleFlight() if single_flight else None
+        self.lexical_index = None
+
+        # Cheap to create: no model load or connection happens until the first embedding
+        self.embeddings = embeddings or make_embeddings(
+            embedding_backend, cache=EmbeddingCache(), api_key=OPENROUTER_API_KEY,
+            api_base=OPENROUTER_API_BASE, model=EMBEDDING_MODEL, dim=embedding_dim,
+        )
+        self.corpus = None
+        self.index_lock = threading.RLock()
+        if os.path.isdir(pdf_path):
+            self.corpus = CorpusIndex(pdf_path, self.embeddings, chunk_size, chunk_overlap, cache_dir=cache_dir,
+                                      index_type=index_type, on_change=lambda changes: self._on_index_change())
+            self.index_lock = self.corpus.lock
+            self.index_key = self.corpus.key
+        else:
+            self.index_key = pdf_index_key(pdf_path, chunk_size, chunk_overlap, self.embeddings.model, index_type)
+        # Fail now rather than on the first question if a serving process has nothing to load
+        if not build_if_missing and not index_exists(self.index_key, cache_dir):
+            raise FileNotFoundError(f"No prebuilt index for {pdf_path}. Run `python ingest.py {pdf_path}` first.")
+
+        # The index, LLM and prompt are loaded on first use (see warm_up)
+        self._vector_store = None
+        self._llm = None
+        self._fallback_llm = None
+        self._prompt = None
+        self._conversation_prompt = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self.index_meta = None
+
+        # Answer cache, scoped to the index version, model and prompt once the index is loaded
+        self.answer_cache = AnswerCache() if use_answer_cache else None
+
+        # Per-stage latency tracing
+        self.tracer = Tracer()
+        print("RAG Engine ready; the index and LLM load on first use.")
+
+    def _ensure_loaded(self):
+        """Loads the persisted vector store (or builds it) the first time it is needed."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            if self.corpus is not None:
+                self._load_corpus()
+            elif index_exists(self.index_key, self.cache_dir):
+                self._vector_store, self.index_meta = load_index(self.index_key, self.embeddings,
+                                                                 cache_dir=self.cache_dir)
+                print(f"Loaded persisted index {self.index_key} ({self.index_meta['num_vectors']} vectors).")
+            else:
+                self._vector_store, self.index_meta = build_index(
+                    self.pdf_path, self.embeddings, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                    cache_dir=self.cache_dir, index_type=self.index_type,
+                )
+            # Not via the vector_store property: it calls _ensure_loaded, which would wait on this lock
+            store = self.corpus.vector_store if self.corpus is not None else self._vector_store
+            configure_search(store.index, nprobe=self.nprobe, ef_search=self.ef_search)
+            self._loaded = True
+            self._reset_answer_cache()
+            print(f"Index ready in {time.perf_counter() - start:.2f}s.")
+
+    def _load_corpus(self):
+        if self.corpus.exists():
+            self.corpus.load()
+        if self.build_if_missing:
+            # Only re-embeds files that changed since the index was persisted
+            self.corpus.sync()
+        self.index_meta = self.corpus.meta
+        if self.watch_interval:
+            self.corpus.watch(self.watch_interval)
+
+    def close(self):
+        """Stops background work (the corpus watcher); queries already running finish normally."""
+        if self.corpus is not None:
+            self.corpus.stop_watching()
+
+    def warm_up(self):
+        """Loads everything the first query would, e.g. at server start-up."""
+        self._ensure_loaded()
+        return self.llm, self.fallback_llm, self.prompt
+
+    @property
+    def vector_store(self):
+        self._ensure_loaded()
+        # A corpus replaces its store on the first sync, so always ask it
+        return self.corpus.vector_store if self.corpus is not None else self._vector_store
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self._make_llm(MODEL_NAME)
+        return self._llm
+
+    @property
+    def fallback_llm(self):
+        """The model hedged requests go to; None when hedging is off."""
+        if not self.hedge_after:
+            return None
+        if self._fallback_llm is None:
+            self._fallback_llm = self._make_llm(self.fallback_model)
+        return self._fallback_llm
+
+    def _make_llm(self, model_name):
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            model_name=model_name,
             openai_api_base=OPENROUTER_API_BASE,
             openai_api_key=OPENROUTER_API_KEY,
-            temperature=0.3
+            temperature=0.3,
+            # A request never outlives the query deadline
+            timeout=self.deadline or None,
         )
 
-        # 5. Create Chain
-        prompt = ChatPromptTemplate.from_template("""
-        You are an expert assistant for 'Project Nova'. Your task is to answer questions accurately based ONLY on the provided context.
-        If the answer is not available in the context, clearly state "I do not have information on this topic based on the provided document." Do not make up information.
+    @property
+    def prompt(self):
+        if self._prompt is None:
+            from langchain_core.prompts import ChatPromptTemplate
 
-        Context:
-        {context}
+            self._prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+        return self._prompt
 
-        Question: {input}
-        """)
-        
-        document_chain = create_stuff_documents_chain(self.llm, prompt)
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
-        self.retrieval_chain = create_retrieval_chain(retriever, document_chain)
-        print("RAG Pipeline assembled.")
+    @property
+    def conversation_prompt(self):
+        if self._conversation_prompt is None:
+            from langchain_core.prompts import ChatPromptTemplate
+
+            self._conversation_prompt = ChatPromptTemplate.from_template(CONVERSATION_PROMPT_TEMPLATE)
+        return self._conversation_prompt
+
+    @property
+    def retrieval_chain(self):
+        """The plain LangChain retrieval chain (no caching, tracing or context assembly)."""
+        # ✅ UPDATED: Chains are now in 'langchain_classic' in v1.0+
+        from langchain_classic.chains import create_retrieval_chain
+        from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+
+        document_chain = create_stuff_documents_chain(self.llm, self.prompt)
+        retriever = self.vector_store.as_retriever(search_kwargs={"k": self.retrieval_k})
+        return create_retrieval_chain(retriever, document_chain)
+
+    @property
+    def index_version(self):
+        """Identifies the indexed content; changes whenever the corpus is updated."""
+        return self.corpus.version if self.corpus is not None else self.index_key
+
+    def _on_index_change(self):
+        self.lexical_index = None
+        self._reset_answer_cache()
+
+    def _reset_answer_cache(self):
+        # Scoped to the index version, model and prompt, so index updates invalidate it
+        if self.answer_cache is not None:
+            self.answer_cache.set_namespace(cache_namespace(self.index_version, MODEL_NAME, PROMPT_TEMPLATE))
+
+    def _get_lexical_index(self):
+        """BM25 index over every chunk in the docstore, built on first use (no network involved)."""
+        if self.lexical_index is None:
+            with self.index_lock:
+                store = self.vector_store
+                # A ChunkStore reads texts straight from its blob, without building Documents
+                text = getattr(store.docstore, "text", None) or (
+                    lambda doc_id: store.docstore.search(doc_id).page_content)
+                self.lexical_index = BM25Index.from_texts(
+                    (doc_id, text(doc_id)) for doc_id in store.index_to_docstore_id.values()
+                )
+        return self.lexical_index
+
+    def _search(self, query_vector, k):
+        """Vector search; returns [(docstore id, distance)], best first."""
+        import faiss
+        import numpy as np
 
-    def query(self, user_question):
+        query = np.asarray([query_vector], dtype=np.float32)
+        with self.index_lock:
+            if self.vector_store._normalize_L2:
+                faiss.normalize_L2(query)
+            distances, positions = self.vector_store.index.search(query, k)
+            mapping = self.vector_store.index_to_docstore_id
+            return [(mapping[int(p)], float(d)) for p, d in zip(positions[0], distances[0]) if p != -1]
+
+    def _documents(self, doc_ids):
+        with self.index_lock:
+            return [self.vector_store.docstore.search(doc_id) for doc_id in doc_ids]
+
+    def _lexical_stage(self, trace, user_question):
         """
-        The main query function.
+        Runs BM25 unless the mode is "vector". Returns (lexical hits, sources),
+        where sources is set only when the lexical path answers on its own.
         """
+        if self.retrieval_mode == "vector":
+            return None, None
+        with trace.span("lexical_search") as attrs:
+            index = self._get_lexical_index()
+            hits = index.search(user_question, k=max(RETRIEVAL_CANDIDATES, self.retrieval_k))
+            confidence = index.coverage(user_question, hits[0][0]) if hits else 0.0
+            attrs.update(hits=len(hits), confidence=round(confidence, 3))
+        if self.retrieval_mode == "lexical" or (self.retrieval_mode == "auto" and confidence >= LEXICAL_CONFIDENCE):
+            return hits, self._documents([doc_id for doc_id, _ in hits[:self.retrieval_k]])
+        return hits, None
+
+    def _vector_stage(self, trace, query_vector, lexical_hits):
+        """
+        Vector search, fused with the lexical hits when there are any (hybrid / auto).
+        Returns (documents, relevance score of the best vector match).
+        """
+        k = self.retrieval_k if lexical_hits is None else max(RETRIEVAL_CANDIDATES, self.retrieval_k)
+        with trace.span("vector_search", k=k, index_size=self.vector_store.index.ntotal) as attrs:
+            hits = self._search(query_vector, k)
+            top_score = relevance_score(hits[0][1]) if hits else 0.0
+            attrs["top_score"] = round(top_score, 4)
+        if lexical_hits is None:
+            return self._documents([doc_id for doc_id, _ in hits]), top_score
+        with trace.span("rank_fusion"):
+            fused = reciprocal_rank_fusion([[d for d, _ in hits], [d for d, _ in lexical_hits]])
+        return self._documents([doc_id for doc_id, _ in fused[:self.retrieval_k]]), top_score
+
+    def _should_abstain(self, trace, top_score):
+        """True when the best match is too weak to answer from; records an `abstain` span."""
+        if not self.abstain_threshold or top_score is None or top_score >= self.abstain_threshold:
+            return False
+        now = time.time()
+        trace.add_span("abstain", now, now, top_score=round(top_score, 4), threshold=self.abstain_threshold)
+        print(f"Abstaining: best match {top_score:.3f} < {self.abstain_threshold:.3f}")
+        return True
+
+    def retrieval_score(self, user_question):
+        """Relevance score of the best vector match for a question (used by calibrate_threshold.py)."""
+        self._ensure_loaded()
+        hits = self._search(self.embeddings.embed_query(user_question), 1)
+        return relevance_score(hits[0][1]) if hits else 0.0
+
+    def _record_retrieval(self, trace, start, lexical_hits, query_vector):
+        """Adds a `retrieval:<path>` span so latency can be compared per retrieval path."""
+        if query_vector is None:
+            path = "lexical"
+        else:
+            path = "vector" if lexical_hits is None else "hybrid"
+        trace.add_span(f"retrieval:{path}", start, time.time(), mode=self.retrieval_mode)
+
+    def _cached_answer(self, user_question, query_vector=None):
+        """Exact-tier lookup when no vector is given, semantic-tier lookup otherwise."""
+        if self.answer_cache is None:
+            return None, None
+        if query_vector is None:
+            return self.answer_cache.get_exact(user_question), "exact"
+        return self.answer_cache.get_semantic(query_vector), "semantic"
+
+    def _answer_namespace(self):
+        """The answer cache namespace a query starts under; an answer landing after a switch is dropped."""
+        return self.answer_cache.namespace if self.answer_cache is not None else None
+
+    def _remember_answer(self, user_question, query_vector, answer, sources, namespace=None):
+        if self.answer_cache is not None:
+            self.answer_cache.put(user_question, query_vector, answer, sources, namespace=namespace)
+
+    def _embedding_attributes(self, user_question):
+        attrs = {"tokens": count_tokens(user_question), "backend": type(self.embeddings).__name__}
+        if isinstance(getattr(self.embeddings, "inner", self.embeddings), OpenRouterEmbeddings):
+            payload = json.dumps({"model": self.embeddings.model, "input": [user_question]})
+            attrs["bytes_sent"] = len(payload.encode("utf-8"))
+        return attrs
+
+    def _assemble_prompt(self, trace, user_question, sources, history=None):
+        """
+        Formats the prompt as the stuff-documents chain would, over the assembled
+        context, with the bounded conversation history for follow-up questions.
+        """
+        with trace.span("prompt_assembly") as attrs:
+            if self.context_budget is None:
+                context = "\n\n".join(doc.page_content for doc in sources)
+            else:
+                context, stats = assemble_context(sources, budget=self.context_budget)
+                attrs.update(stats)
+            if history:
+                history_text = history.prompt_text(HISTORY_PROMPT_TOKENS)
+                attrs["history_tokens"] = count_tokens(history_text)
+                prompt_value = self.conversation_prompt.invoke(
+                    {"input": user_question, "context": context, "history": history_text})
+            else:
+                prompt_value = self.prompt.invoke({"input": user_question, "context": context})
+            prompt_text = prompt_value.to_string()
+            attrs.update(num_chunks=len(sources), prompt_tokens=count_tokens(prompt_text),
+                         bytes_sent=len(prompt_text.encode("utf-8")))
+        return prompt_value
+
+    def _generation(self, trace, prompt_value, sources):
+        """Answer tokens, hedged to the fallback model and bounded by the query deadline."""
+        return HedgedGeneration(self.llm, self.fallback_llm, prompt_value, trace.start, degraded_answer(sources),
+                                deadline=self.deadline, hedge_after=self.hedge_after)
+
+    @staticmethod
+    def _follow_up_history(user_question, history):
+        """The history to answer with, or None when the question stands on its own."""
+        return history if history is not None and history.is_follow_up(user_question) else None
+
+    def stream_query(self, user_question, history=None):
+        """
+        Streaming query. Retrieval runs before this returns, so `stream.sources`
+        is available before the first token; iterating the stream yields answer
+        tokens as the LLM produces them. `history` is the session's
+        ConversationHistory (without this question); it is used only when the
+        question is a follow-up (ConversationHistory.is_follow_up), and those
+        bypass the answer cache, since their answer depends on it. Standalone
+        questions are coalesced with an identical one already in flight (see
+        singleflight.py) and get a CoalescedStream.
+        """
+        history = self._follow_up_history(user_question, history)
+        if history or self.single_flight is None:
+            return self._stream_query(user_question, history)
+        flight, leader = self.single_flight.run(user_question, lambda: self._stream_query(user_question))
+        return CoalescedStream(flight, coalesced=not leader)
+
+    def _stream_query(self, user_question, history=None):
         print(f"Received query: {user_question}")
+        self._ensure_loaded()
+        namespace = self._answer_namespace()
+        trace = self.tracer.start(user_question)
+        retrieval_question = history.retrieval_query(user_question) if history else user_question
+
+        cached, tier = self._cached_answer(user_question) if not history else (None, None)
+        query_vector, lexical_hits, sources = None, None, None
+        if cached is None:
+            retrieval_start = time.time()
+            lexical_hits, sources = self._lexical_stage(trace, retrieval_question)
+            if sources is None:
+                with trace.span("embed_query", **self._embedding_attributes(retrieval_question)):
+                    query_vector = self.embeddings.embed_query(retrieval_question)
+                if not history:
+                    cached, tier = self._cached_answer(user_question, query_vector)
+        if cached is not None:
+            print(f"Answer cache hit ({tier}).")
+            return QueryStream(self, trace, user_question, cached["sources"], iter([cached["answer"]]), cache_hit=tier)
+
+        top_score = None
+        if sources is None:
+            sources, top_score = self._vector_stage(trace, query_vector, lexical_hits)
+        self._record_retrieval(trace, retrieval_start, lexical_hits, query_vector)
+        if self._should_abstain(trace, top_score):
+            return QueryStream(self, trace, user_question, [], iter([ABSTAIN_MESSAGE]), abstained=True)
+        prompt_value = self._assemble_prompt(trace, user_question, sources, history)
+        return QueryStream(self, trace, user_question, sources, self._generation(trace, prompt_value, sources),
+                           query_vector=query_vector, cacheable=not history, namespace=namespace)
+
+    def query(self, user_question, history=None):
+        """
+        The main query function.
+        """
+        return self.timed_query(user_question, history)[0]
+
+    def timed_query(self, user_question, history=None):
+        """
+        `query`, returning (answer, timings) with this call's own timings ({}
+        if it failed). The engine is shared, so timings travel with the answer.
+        """
         try:
-            response = self.retrieval_chain.invoke({"input": user_question})
-            answer = response["answer"]
+            stream = self.stream_query(user_question, history)
+            answer = "".join(stream)
             print(f"Generated answer: {answer}")
-            return answer
+            return answer, stream.timings
         except Exception as e:
-            return f"Error occurred during query: {e}"
\ No newline at end of file
+            return f"Error occurred during query: {e}", {}
+
+    async def aquery(self, user_question, history=None):
+        """
+        Async version of `query`. Embedding, retrieval and generation all run on
+        pooled async clients, so many questions can be in flight in one process.
+        Identical questions already in flight share one upstream call.
+        """
+        print(f"Received query: {user_question}")
+        try:
+            history = self._follow_up_history(user_question, history)
+            if history or self.single_flight is None:
+                return await self._aquery(user_question, history)
+            return await self.single_flight.ado(user_question, lambda: self._aquery(user_question))
+        except Exception as e:
+            return f"Error occurred during query: {e}"
+
+    async def _aquery(self, user_question, history=None):
+        if not self._loaded:
+            await asyncio.get_running_loop().run_in_executor(None, self._ensure_loaded)
+        namespace = self._answer_namespace()
+        trace = self.tracer.start(user_question)
+        retrieval_question = history.retrieval_query(user_question) if history else user_question
+        cached, tier = self._cached_answer(user_question) if not history else (None, None)
+        query_vector, lexical_hits, sources = None, None, None
+        if cached is None:
+            retrieval_start = time.time()
+            lexical_hits, sources = self._lexical_stage(trace, retrieval_question)
+            if sources is None:
+                with trace.span("embed_query", **self._embedding_attributes(retrieval_question)):
+                    query_vector = await self.embeddings.aembed_query(retrieval_question)
+                if not history:
+                    cached, tier = self._cached_answer(user_question, query_vector)
+        if cached is not None:
+            print(f"Answer cache hit ({tier}).")
+            self._finish_trace(trace, cached["answer"], cache_hit=tier)
+            return cached["answer"]
+
+        top_score = None
+        if sources is None:
+            # The index lock can block, so keep it off the event loop
+            sources, top_score = await asyncio.get_running_loop().run_in_executor(
+                None, self._vector_stage, trace, query_vector, lexical_hits
+            )
+        self._record_retrieval(trace, retrieval_start, lexical_hits, query_vector)
+        if self._should_abstain(trace, top_score):
+            self._finish_trace(trace, ABSTAIN_MESSAGE, abstained=True)
+            return ABSTAIN_MESSAGE
+        prompt_value = self._assemble_prompt(trace, user_question, sources, history)
+        llm_start = time.time()
+        first_token = None
+        parts = []
+        generation = self._generation(trace, prompt_value, sources)
+        try:
+            async for token in generation:
+                if first_token is None:
+                    first_token = time.time()
+                parts.append(token)
+        except Exception:
+            self.generation_stats.record(generation)
+            raise
+        answer = "".join(parts)
+        self._finish_trace(trace, answer, llm_start=llm_start, first_token=first_token, generation=generation)
+        if not history and generation.winner != "degraded" and not generation.truncated:
+            self._remember_answer(user_question, query_vector, answer, sources, namespace)
+        print(f"Generated answer: {answer}")
+        return answer
+
+    def _finish_trace(self, trace, answer, llm_start=None, first_token=None, cache_hit=None, abstained=False,
+                      generation=None):
+        """Adds the LLM spans, exports the trace and returns the query's timings."""
+        end = time.time()
+        outcome = {}
+        if generation is not None:
+            self.generation_stats.record(generation)
+            outcome = {"llm_outcome": generation.winner, "hedged": generation.hedged,
+                       "failed_over": generation.failed_over,
+                       "timed_out": generation.timed_out}
+        if llm_start is not None:
+            model = (generation.model if generation is not None else None) or MODEL_NAME
+            trace.add_span("llm_first_token", llm_start, first_token or end, model=model)
+            trace.add_span("llm_completion", llm_start, end, model=model,
+                           completion_tokens=count_tokens(answer), bytes_received=len(answer.encode("utf-8")))
+        self.tracer.finish(trace, cache_hit=cache_hit or "none", abstained=abstained, **outcome)
+
+        retrieval = sum(trace.duration(name) or 0.0
+                        for name in ("embed_query", "lexical_search", "vector_search", "rank_fusion"))
+        timings = {
+            "retrieval": retrieval,
+            "time_to_first_token": (first_token or end) - trace.start,
+            "total": end - trace.start,
+        }
+        logger.debug("Timings: first token %.2fs, total %.2fs", timings["time_to_first_token"], timings["total"])
+        return timings
+
+
+class QueryStream:
+    """
+    Iterable of answer tokens for one question, with its retrieved `sources`
+    and, once fully consumed, its `timings` and full `answer`. `cache_hit` is
+    "exact" or "semantic" when the answer came from the answer cache, and
+    `abstained` is True when retrieval was too weak to call the LLM. When
+    generated, `generation` (a HedgedGeneration) says which model answered or
+    whether the answer is a degraded one.
+    """
+    def __init__(self, engine, trace, question, sources, tokens, query_vector=None, cache_hit=None,
+                 cacheable=True, abstained=False, namespace=None):
+        self.engine = engine
+        self.trace = trace
+        self.question = question
+        self.sources = sources
+        self.answer = None
+        self.timings = None
+        self.cache_hit = cache_hit
+        self._tokens = tokens
+        self.generation = tokens if isinstance(tokens, HedgedGeneration) else None
+        self._query_vector = query_vector
+        self._namespace = namespace
+        self.abstained = abstained
+        self._cacheable = cacheable and not abstained
+        self.coalesced = False
+
+    @property
+    def outcome(self):
+        """How the answer was produced: "cache", "abstained", "primary", "fallback" or "degraded"."""
+        if self.cache_hit is not None:
+            return "cache"
+        if self.abstained:
+            return "abstained"
+        return self.generation.winner if self.generation is not None else None
+
+    def __iter__(self):
+        # The LLM call is lazy: it starts when iteration does
+        llm_start = time.time() if self.cache_hit is None and not self.abstained else None
+        first_token = None
+        parts = []
+        try:
+            for token in self._tokens:
+                if first_token is None:
+                    first_token = time.time()
+                parts.append(token)
+                yield token
+        except Exception:
+            # Every model failed before the deadline; still counted on /metrics
+            if self.generation is not None:
+                self.engine.generation_stats.record(self.generation)
+            raise
+        self.answer = "".join(parts)
+        self.timings = self.engine._finish_trace(self.trace, self.answer, llm_start=llm_start,
+                                                 first_token=first_token, cache_hit=self.cache_hit,
+                                                 abstained=self.abstained, generation=self.generation)
+        if self.generation is not None and (self.generation.winner == "degraded" or self.generation.truncated):
+            return
+        if self.cache_hit is None and self._cacheable:
+            self.engine._remember_answer(self.question, self._query_vector, self.answer, self.sources,
+                                         self._namespace)
+
+
+class CoalescedStream:
+    """
+    A QueryStream shared through single-flight: the same attributes, with the
+    tokens replayed from the shared flight. `coalesced` is True when this call
+    joined a flight another caller started (and made no upstream calls).
+    Raises the leader's error, at creation or mid-stream, wherever it failed.
+    """
+    def __init__(self, flight, coalesced=False):
+        self.flight = flight
+        self.coalesced = coalesced
+        self.stream = flight.wait_started()
+        self.question = self.stream.question
+        self.sources = self.stream.sources
+        self.cache_hit = self.stream.cache_hit
+        self.abstained = self.stream.abstained
+        self.answer = None
+        self.timings = None
+
+    @property
+    def generation(self):
+        return self.stream.generation
+
+    @property
+    def outcome(self):
+        return self.stream.outcome
+
+    def __iter__(self):
+        parts = []
+        for token in self.flight.subscribe():
+            parts.append(token)
+            yield token
+        self.answer = "".join(parts)
+        # The leader's timings: followers share its retrieval and generation
+        self.timings = self.stream.timings
@@ -1,9 +1,6 @@
 import os
 import sys
-import json
-import requests
 import warnings
-from typing import List
 from dotenv import load_dotenv
 
 warnings.filterwarnings("ignore")
@@ -12,7 +9,6 @@ warnings.filterwarnings("ignore")
 load_dotenv()
 
 # LangChain Community Imports (Loaders & Vector Stores)
-from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
@@ -23,42 +19,16 @@ from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_classic.chains import create_retrieval_chain
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.embeddings import Embeddings
+
+from embeddings import EMBEDDING_BACKEND, make_embeddings
+from embedding_cache import EmbeddingCache
+from corpus_index import load_file, scan_directory
 
 # --- Configuration ---
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
 MODEL_NAME = "deepseek/deepseek-chat"
-DOCUMENT_PATH = "./documents/project_quasar_brief.txt"
-
-class OpenRouterEmbeddings(Embeddings):
-    """Custom embedding class for OpenRouter API."""
-    def __init__(self, model: str = "text-embedding-ada-002", api_key: str = None):
-        if not api_key:
-            raise ValueError("OpenRouter API key must be provided.")
-        self.model = model
-        self.api_key = api_key
-        self.api_url = "https://openrouter.ai/api/v1/embeddings"
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
-    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        response = requests.post(
-            self.api_url,
-            headers=self.headers,
-            data=json.dumps({"model": self.model, "input": texts})
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        return [item['embedding'] for item in response_data['data']]
-
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self._get_embeddings(texts)
-
-    def embed_query(self, text: str) -> List[float]:
-        return self._get_embeddings([text])[0]
+DOCUMENTS_DIR = "./documents"
 
 def main():
     if not OPENROUTER_API_KEY:
@@ -67,15 +37,19 @@ def main():
 
     print(f"✅ API Key loaded. (Ends with: {OPENROUTER_API_KEY[-4:]})")
 
-    # 1. Load Document
-    if not os.path.exists(DOCUMENT_PATH):
-        print(f"❌ ERROR: Document not found at {DOCUMENT_PATH}")
+    # 1. Load Documents (every PDF/text file in the documents folder)
+    if not os.path.isdir(DOCUMENTS_DIR):
+        print(f"❌ ERROR: Documents folder not found at {DOCUMENTS_DIR}")
         sys.exit(1)
         
     try:
-        loader = TextLoader(DOCUMENT_PATH)
-        docs = loader.load()
-        print(f"✅ Document loaded: {len(docs)} document(s).")
+        docs = []
+        for rel_path in scan_directory(DOCUMENTS_DIR):
+            docs.extend(load_file(os.path.join(DOCUMENTS_DIR, rel_path)))
+        if not docs:
+            print(f"❌ ERROR: No documents found in {DOCUMENTS_DIR}")
+            sys.exit(1)
+        print(f"✅ Documents loaded: {len(docs)} document(s).")
     except Exception as e:
         print(f"❌ ERROR: Failed to load document: {e}")
         sys.exit(1)
@@ -88,9 +62,11 @@ def main():
     # 3. Create Vector Store
     print("Initialize Custom Embeddings...")
     try:
-        embeddings = OpenRouterEmbeddings(api_key=OPENROUTER_API_KEY)
+        # RAG_EMBEDDING_BACKEND=local embeds on this machine instead of over the network
+        embeddings = make_embeddings(EMBEDDING_BACKEND, cache=EmbeddingCache(), api_key=OPENROUTER_API_KEY)
         vector_store = FAISS.from_documents(split_docs, embedding=embeddings)
         print("✅ Vector store created successfully.")
+        print(f"   Embedding cache: {embeddings.cache.stats}")
     except Exception as e:
         print(f"❌ ERROR: Failed to create vector store: {e}")
         sys.exit(1)
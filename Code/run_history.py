@@ -0,0 +1,342 @@
+"""
+Local history of evaluation and benchmark runs, with compare and a regression gate.
+
+evaluate.py, batch_runner.py and load_test.py append every run to a SQLite
+file (`RAG_RUN_HISTORY_PATH`): the git commit, the configuration (engine
+settings and RAG_* environment variables), and each question's result and
+latency. Compare any two runs, or gate a run against a baseline: the gate
+exits 1 when p95 latency grows by more than `--max-p95-regression` (a
+fraction) or accuracy drops by more than `--max-accuracy-drop` (points).
+
+    python run_history.py list
+    python run_history.py show latest
+    python run_history.py compare previous latest
+    python run_history.py gate --baseline 12 --max-p95-regression 0.1 --max-accuracy-drop 0
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import subprocess
+
+from calculate_latency import percentile
+
+# --- Configuration ---
+RUN_HISTORY_PATH = os.getenv("RAG_RUN_HISTORY_PATH", ".run_history/runs.sqlite3")
+GATE_MAX_P95_REGRESSION = float(os.getenv("RAG_GATE_MAX_P95_REGRESSION", "0.10"))
+GATE_MAX_ACCURACY_DROP = float(os.getenv("RAG_GATE_MAX_ACCURACY_DROP", "0"))
+# RAG_Engine settings recorded with each run
+ENGINE_CONFIG_ATTRS = ("pdf_path", "chunk_size", "chunk_overlap", "retrieval_k", "retrieval_mode", "index_type",
+                       "context_budget", "abstain_threshold", "deadline", "hedge_after", "fallback_model",
+                       "base_url", "corpus")
+
+
+def git_revision():
+    """(commit, has uncommitted changes) of the checkout this file lives in, or (None, None) outside git."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_config(engine=None, **extra):
+    """RAG_* environment variables plus the engine's settings (a QueryServiceClient records its URL)."""
+    # File locations are left out: benchmarks point them at fresh temporary directories
+    config = {name: value for name, value in sorted(os.environ.items())
+              if name.startswith("RAG_") and not name.endswith(("_PATH", "_DIR"))}
+    if engine is not None:
+        config["engine"] = type(engine).__name__
+        for attr in ENGINE_CONFIG_ATTRS:
+            value = getattr(engine, attr, None)
+            if value is not None:
+                config[attr] = value
+        model = getattr(sys.modules.get(type(engine).__module__), "MODEL_NAME", None)
+        if model:
+            config["model"] = model
+        embedding_model = getattr(getattr(engine, "embeddings", None), "model", None)
+        if embedding_model:
+            config["embedding_model"] = embedding_model
+    config.update(extra)
+    return config
+
+
+def _seconds_ms(value):
+    """"2.50s" (the evaluation CSV format) or a number of seconds -> milliseconds."""
+    if value is None or value == "":
+        return None
+    return float(str(value).rstrip("s")) * 1000
+
+
+def summarize_run(questions):
+    """Accuracy (over scored questions) and latency percentiles for a run's question rows."""
+    latencies = [q["latency_ms"] for q in questions if q["latency_ms"] is not None]
+    ttfts = [q["ttft_ms"] for q in questions if q["ttft_ms"] is not None]
+    scored = [q["passed"] for q in questions if q["passed"] is not None]
+    summary = {"questions": len(questions), "accuracy": sum(scored) / len(scored) * 100 if scored else None}
+    for p in (50, 95, 99):
+        summary[f"p{p}_ms"] = percentile(latencies, p) if latencies else None
+    summary["mean_ttft_ms"] = sum(ttfts) / len(ttfts) if ttfts else None
+    return summary
+
+
+class RunHistory:
+    """SQLite store of runs and their per-question results."""
+
+    def __init__(self, path=RUN_HISTORY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, kind TEXT NOT NULL, label TEXT,"
+            " git_commit TEXT, git_dirty INTEGER, config TEXT NOT NULL, summary TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " run_id INTEGER NOT NULL REFERENCES runs(id), question_id TEXT, question TEXT, data_type TEXT,"
+            " passed INTEGER, latency_ms REAL, ttft_ms REAL);"
+            "CREATE INDEX IF NOT EXISTS questions_run ON questions(run_id);"
+        )
+
+    def record(self, kind, results, config=None, label=None):
+        """
+        Appends a run. `results` are evaluation result rows (ID, Question,
+        Data Type, Result, Time, TTFT; any may be missing). Returns the run id.
+        """
+        questions = [{
+            "question_id": None if r.get("ID") is None else str(r["ID"]),
+            "question": r.get("Question"),
+            "data_type": r.get("Data Type"),
+            "passed": None if r.get("Result") is None else r["Result"] == "PASS",
+            "latency_ms": _seconds_ms(r.get("Time")),
+            "ttft_ms": _seconds_ms(r.get("TTFT")),
+        } for r in results]
+        commit, dirty = git_revision()
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO runs (created_at, kind, label, git_commit, git_dirty, config, summary)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), kind, label, commit, dirty, json.dumps(config or {}, default=str),
+                 json.dumps(summarize_run(questions))),
+            )
+            run_id = cursor.lastrowid
+            self._db.executemany(
+                "INSERT INTO questions (run_id, question_id, question, data_type, passed, latency_ms, ttft_ms)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, q["question_id"], q["question"], q["data_type"], q["passed"], q["latency_ms"],
+                  q["ttft_ms"]) for q in questions],
+            )
+        return run_id
+
+    def _run(self, row):
+        run = dict(row)
+        run["config"] = json.loads(run["config"])
+        run["summary"] = json.loads(run["summary"])
+        return run
+
+    def runs(self, kind=None, limit=20):
+        """Most recent runs first."""
+        query, params = "SELECT * FROM runs", ()
+        if kind:
+            query, params = query + " WHERE kind = ?", (kind,)
+        rows = self._db.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        return [self._run(row) for row in rows]
+
+    def resolve(self, ref, kind=None, before=None):
+        """
+        A run by id, "latest", or "previous" (the run before `before`, or
+        before the latest). Restricted to `kind` when given.
+        """
+        kind_clause, params = ("AND kind = ?", (kind,)) if kind else ("", ())
+        if ref == "latest":
+            row = self._db.execute(f"SELECT * FROM runs WHERE 1=1 {kind_clause} ORDER BY id DESC LIMIT 1",
+                                   params).fetchone()
+        elif ref == "previous":
+            if before is None:
+                latest = self.resolve("latest", kind)
+                before = latest["id"] if latest else 0
+            row = self._db.execute(f"SELECT * FROM runs WHERE id < ? {kind_clause} ORDER BY id DESC LIMIT 1",
+                                   (before,) + params).fetchone()
+        else:
+            row = self._db.execute("SELECT * FROM runs WHERE id = ?", (int(ref),)).fetchone()
+        return self._run(row) if row is not None else None
+
+    def questions(self, run_id):
+        rows = self._db.execute("SELECT * FROM questions WHERE run_id = ? ORDER BY rowid", (run_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self._db.close()
+
+
+def record_run(kind, results, config=None, label=None, path=RUN_HISTORY_PATH):
+    """Appends a run to the history and says so; a history failure never fails the run itself."""
+    try:
+        history = RunHistory(path)
+        run_id = history.record(kind, results, config, label)
+        history.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: could not record the run in {path}: {e}")
+        return None
+    print(f"Run {run_id} recorded in {path} (compare with `python run_history.py compare previous {run_id}`)")
+    return run_id
+
+
+# --- Reporting ---
+
+def _describe(run):
+    commit = (run["git_commit"] or "no git")[:8] + ("+dirty" if run["git_dirty"] else "")
+    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created_at"]))
+    label = f" {run['label']!r}" if run["label"] else ""
+    return f"run {run['id']} ({run['kind']}{label}, {when}, {commit})"
+
+
+def _fmt(value, unit=""):
+    if value is None:
+        return "-"
+    return f"{value:.1f}%" if unit == "%" else f"{value:.0f}ms"
+
+
+def config_changes(base, new):
+    keys = sorted(set(base) | set(new))
+    return [(key, base.get(key), new.get(key)) for key in keys if base.get(key) != new.get(key)]
+
+
+def print_runs(runs):
+    print(f"{'Run':>5}  {'Kind':<12}{'When':<18}{'Commit':<15}{'Qs':>5}{'Accuracy':>10}{'p95':>10}  Label")
+    for run in runs:
+        s = run["summary"]
+        commit = (run["git_commit"] or "-")[:8] + ("+" if run["git_dirty"] else "")
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created_at"]))
+        print(f"{run['id']:>5}  {run['kind']:<12}{when:<18}{commit:<15}{s['questions']:>5}"
+              f"{_fmt(s['accuracy'], '%'):>10}{_fmt(s['p95_ms']):>10}  {run['label'] or ''}")
+
+
+def print_comparison(history, base, new, top=5):
+    print(f"Baseline:  {_describe(base)}")
+    print(f"Candidate: {_describe(new)}\n")
+
+    changes = config_changes(base["config"], new["config"])
+    if changes:
+        print("Configuration changes:")
+        for key, old, value in changes:
+            print(f"  {key}: {old!r} -> {value!r}")
+        print()
+
+    print(f"{'Metric':<14}{'Baseline':>10}{'Candidate':>11}{'Change':>12}")
+    for metric, unit in (("accuracy", "%"), ("p50_ms", ""), ("p95_ms", ""), ("p99_ms", ""), ("mean_ttft_ms", "")):
+        old, value = base["summary"].get(metric), new["summary"].get(metric)
+        if old is None or value is None:
+            change = ""
+        elif unit == "%":
+            change = f"{value - old:+.1f} pts"
+        else:
+            change = f"{(value - old) / old * 100:+.1f}%" if old else f"{value - old:+.0f}ms"
+        print(f"{metric:<14}{_fmt(old, unit):>10}{_fmt(value, unit):>11}{change:>12}")
+
+    # Per question, matched on the question text
+    old_questions = {q["question"]: q for q in history.questions(base["id"]) if q["question"]}
+    pairs = [(old_questions[q["question"]], q) for q in history.questions(new["id"])
+             if q["question"] in old_questions]
+    flips = [(old, q) for old, q in pairs if old["passed"] is not None and q["passed"] is not None
+             and old["passed"] != q["passed"]]
+    if flips:
+        print("\nResult changes:")
+        for old, q in flips:
+            print(f"  {'PASS -> FAIL' if old['passed'] else 'FAIL -> PASS'}: {q['question']}")
+    timed = [(q["latency_ms"] - old["latency_ms"], q["question"]) for old, q in pairs
+             if old["latency_ms"] is not None and q["latency_ms"] is not None]
+    if timed:
+        print(f"\nLargest latency changes (of {len(timed)} matched questions):")
+        for delta, question in sorted(timed, key=lambda t: -abs(t[0]))[:top]:
+            print(f"  {delta:+8.0f}ms  {question}")
+
+
+def gate(base, new, max_p95_regression=GATE_MAX_P95_REGRESSION, max_accuracy_drop=GATE_MAX_ACCURACY_DROP):
+    """Returns the list of regressions of `new` against `base` (empty when it passes)."""
+    failures = []
+    old_p95, new_p95 = base["summary"].get("p95_ms"), new["summary"].get("p95_ms")
+    if old_p95 and new_p95 is not None and new_p95 > old_p95 * (1 + max_p95_regression):
+        failures.append(f"p95 latency {old_p95:.0f}ms -> {new_p95:.0f}ms "
+                        f"(+{(new_p95 - old_p95) / old_p95 * 100:.1f}%, allowed +{max_p95_regression * 100:.1f}%)")
+    old_acc, new_acc = base["summary"].get("accuracy"), new["summary"].get("accuracy")
+    if old_acc is not None and new_acc is not None and old_acc - new_acc > max_accuracy_drop:
+        failures.append(f"accuracy {old_acc:.1f}% -> {new_acc:.1f}% "
+                        f"({new_acc - old_acc:+.1f} pts, allowed -{max_accuracy_drop:.1f} pts)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browse, compare and gate recorded evaluation / benchmark runs.")
+    parser.add_argument("--path", default=RUN_HISTORY_PATH, help="Run history SQLite file.")
+    parser.add_argument("--kind", help="Only consider runs of this kind (evaluate, batch, load_test).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = commands.add_parser("list", help="Recent runs.")
+    list_cmd.add_argument("--limit", type=int, default=20)
+
+    show_cmd = commands.add_parser("show", help="One run's configuration and summary.")
+    show_cmd.add_argument("run", nargs="?", default="latest")
+
+    compare_cmd = commands.add_parser("compare", help="Diff two runs.")
+    compare_cmd.add_argument("baseline", nargs="?", default="previous")
+    compare_cmd.add_argument("candidate", nargs="?", default="latest")
+
+    gate_cmd = commands.add_parser("gate", help="Exit 1 if the candidate regresses against the baseline.")
+    gate_cmd.add_argument("--baseline", default="previous", help="Run id, or 'previous' (default).")
+    gate_cmd.add_argument("--candidate", default="latest", help="Run id, or 'latest' (default).")
+    gate_cmd.add_argument("--max-p95-regression", type=float, default=GATE_MAX_P95_REGRESSION,
+                          help="Allowed relative p95 latency increase (0.1 = 10%%).")
+    gate_cmd.add_argument("--max-accuracy-drop", type=float, default=GATE_MAX_ACCURACY_DROP,
+                          help="Allowed accuracy drop in percentage points.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ No run history at {args.path}. Run evaluate.py (or batch_runner.py / load_test.py) first.")
+        sys.exit(1)
+    history = RunHistory(args.path)
+
+    if args.command == "list":
+        print_runs(history.runs(args.kind, args.limit))
+        return
+
+    if args.command == "show":
+        run = history.resolve(args.run, args.kind)
+        if run is None:
+            print(f"❌ No run {args.run!r}.")
+            sys.exit(1)
+        print(_describe(run))
+        print(json.dumps({"summary": run["summary"], "config": run["config"]}, indent=2))
+        return
+
+    candidate = history.resolve(args.candidate, args.kind)
+    # "previous" is relative to the candidate, of the same kind
+    kind = args.kind or (candidate["kind"] if candidate else None)
+    baseline = history.resolve(args.baseline, kind, before=candidate["id"] if candidate else None)
+    if candidate is None or baseline is None:
+        missing = args.candidate if candidate is None else args.baseline
+        if args.command == "gate" and candidate is not None:
+            print(f"✅ No baseline run ({missing!r}) to gate {_describe(candidate)} against; passing.")
+            return
+        print(f"❌ No run {missing!r} in {args.path}.")
+        sys.exit(1)
+
+    print_comparison(history, baseline, candidate)
+    if args.command == "gate":
+        failures = gate(baseline, candidate, args.max_p95_regression, args.max_accuracy_drop)
+        print()
+        if failures:
+            for failure in failures:
+                print(f"❌ Regression: {failure}")
+            sys.exit(1)
+        print(f"✅ No regression against {_describe(baseline)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+When many users ask the same question at once (right after an announcement,
+say), only the first call (the leader) embeds, retrieves and generates.
+Identical calls arriving while it is in flight (followers) wait for it and
+share its result instead of making their own API calls. Streaming followers
+replay the tokens produced so far and then follow the live stream, and an
+error in the leader is raised to every waiter. Questions match after
+normalize_question (the evaluate.normalize rules). A flight is forgotten as
+soon as it lands; repeats after that are the answer cache's job.
+"""
+import os
+import asyncio
+import threading
+
+from answer_cache import normalize_question
+
+# --- Configuration ---
+SINGLE_FLIGHT = os.getenv("RAG_SINGLE_FLIGHT", "1") == "1"
+
+
+class Flight:
+    """One in-flight call: its result once started, the tokens streamed so far, and how it ended."""
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.tokens = []
+        self.started = False
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    # --- Leader side ---
+
+    def start(self, result):
+        with self._cond:
+            self.result, self.started = result, True
+            self._cond.notify_all()
+
+    def publish(self, token):
+        with self._cond:
+            self.tokens.append(token)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self.started = self.done = True
+            self._cond.notify_all()
+
+    # --- Waiter side ---
+
+    def wait_started(self):
+        """The leader's result once it is available; raises the leader's error if it failed before that."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.started)
+            if self.result is None and self.error is not None:
+                raise self.error
+            return self.result
+
+    def subscribe(self):
+        """Every token from the first one on, live; raises the leader's error where the stream broke off."""
+        seen = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.done or len(self.tokens) > seen)
+                new, done, error = self.tokens[seen:], self.done, self.error
+            yield from new
+            seen += len(new)
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """In-flight calls by normalized question, with counters for /metrics."""
+
+    def __init__(self):
+        self._flights = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "errors": 0}
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights) + len(self._tasks)
+
+    def coalesced_rate(self):
+        with self._lock:
+            calls = self.stats["leaders"] + self.stats["coalesced"]
+            return self.stats["coalesced"] / calls if calls else 0.0
+
+    # --- Sync flights ---
+
+    def run(self, question, start):
+        """
+        Returns (flight, is_leader). The leader's `start()` returns an iterable
+        of tokens (a QueryStream); a background thread drains it into the
+        flight, so followers never depend on the leader's caller reading on.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            self.stats["leaders"] += 1
+        threading.Thread(target=self._fly, args=(flight, start), name="single-flight", daemon=True).start()
+        return flight, True
+
+    def _fly(self, flight, start):
+        error = None
+        try:
+            result = start()
+            flight.start(result)
+            for token in result:
+                flight.publish(token)
+        except Exception as e:
+            error = e
+        # Later identical questions start a new flight
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self.stats["errors"] += error is not None
+        flight.finish(error)
+
+    # --- Async flights ---
+
+    async def ado(self, question, factory):
+        """
+        Awaits `factory()` once per normalized question; identical calls made
+        meanwhile on the same event loop await the same task. Cancelling one
+        waiter doesn't cancel the shared call.
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, normalize_question(question))
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None:
+                self.stats["coalesced"] += 1
+            else:
+                task = self._tasks[key] = loop.create_task(factory())
+                task.add_done_callback(lambda t: self._landed(key, t))
+                self.stats["leaders"] += 1
+        return await asyncio.shield(task)
+
+    def _landed(self, key, task):
+        with self._lock:
+            self._tasks.pop(key, None)
+            self.stats["errors"] += not task.cancelled() and task.exception() is not None
@@ -0,0 +1,184 @@
+"""
+Chunking / retrieval parameter sweep.
+
+Builds an index for every chunk size x overlap x index type, runs the
+evaluate.py test cases against it for every k, and prints accuracy (QRS) next
+to ingest time, index size, prompt tokens and p95 query latency. Rows on the
+accuracy / p95 latency Pareto front are marked with *; pick production
+settings from those.
+
+Runs offline against the local OpenRouter stand-in (mock_openrouter.py): its
+hashed embeddings are cached across configurations and its extractive "LLM"
+answers from the retrieved context, so accuracy reflects retrieval quality.
+`--prompt-latency` makes longer prompts answer slower, as a real model would.
+
+    python sweep.py
+    python sweep.py --chunk-sizes 300,500,1000,1500 --overlaps 0,50,150 --k 2,3,5 --index-types flat,hnsw
+"""
+import os
+import csv
+import time
+import argparse
+import tempfile
+import statistics
+
+from mock_openrouter import MockOpenRouter
+from calculate_latency import percentile
+
+
+class SpanCollector:
+    """Keeps finished traces in memory instead of writing them to the JSONL trace file."""
+    def __init__(self):
+        self.records = []
+
+    def export(self, trace):
+        self.records.extend(trace.records())
+
+    def mean(self, span, field):
+        values = [r[field] for r in self.records if r["span"] == span and isinstance(r.get(field), (int, float))]
+        return statistics.mean(values) if values else 0.0
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def pareto_front(rows):
+    """Marks rows no other row beats on both accuracy (higher) and p95 latency (lower)."""
+    for row in rows:
+        row["pareto"] = not any(
+            other["accuracy"] >= row["accuracy"] and other["p95_ms"] <= row["p95_ms"]
+            and (other["accuracy"] > row["accuracy"] or other["p95_ms"] < row["p95_ms"])
+            for other in rows
+        )
+    return rows
+
+
+def evaluate_config(engine, k, repeat):
+    """Runs every test case `repeat` times with `k` retrieved chunks; returns the result row fields."""
+    from evaluate import test_cases, score_case
+    from telemetry import Tracer
+
+    collector = SpanCollector()
+    engine.tracer = Tracer([collector])
+    engine.retrieval_k = k
+    latencies, correct, positives, positives_correct = [], 0, 0, 0
+    for _ in range(repeat):
+        for test in test_cases:
+            start = time.perf_counter()
+            response = engine.query(test["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            ok, _ = score_case(response, test)
+            correct += ok
+            if test["type"] == "Positive":
+                positives += 1
+                positives_correct += ok
+    total = len(test_cases) * repeat
+    return {
+        "accuracy": correct / total * 100,
+        "positive_accuracy": positives_correct / max(positives, 1) * 100,
+        "prompt_tokens": collector.mean("prompt_assembly", "prompt_tokens"),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def run_sweep(args, tmp):
+    from rag_engine import RAG_Engine, OPENROUTER_API_KEY, OPENROUTER_API_BASE, EMBEDDING_MODEL, build_index
+    from embeddings import make_embeddings
+    from embedding_cache import EmbeddingCache
+    from index_store import index_disk_bytes
+
+    # One cache for every configuration: each distinct chunk is embedded once
+    embeddings = make_embeddings("openrouter", cache=EmbeddingCache(args.embedding_cache), api_key=OPENROUTER_API_KEY,
+                                 api_base=OPENROUTER_API_BASE, model=EMBEDDING_MODEL)
+
+    # Warm-up ingest, untimed: one-time imports and process-pool start-up would otherwise land in
+    # the first configuration's ingest time. Its own uncached client leaves the shared cache as it was.
+    print("Warming up the ingest path...")
+    warm_embeddings = make_embeddings("openrouter", api_key=OPENROUTER_API_KEY, api_base=OPENROUTER_API_BASE,
+                                      model=EMBEDDING_MODEL)
+    build_index(args.pdf, warm_embeddings, chunk_size=int_list(args.chunk_sizes)[0], chunk_overlap=0,
+                cache_dir=os.path.join(tmp, "warm_up"), index_type="flat")
+
+    rows = []
+    for chunk_size in int_list(args.chunk_sizes):
+        for overlap in int_list(args.overlaps):
+            if overlap >= chunk_size:
+                continue
+            for index_type in args.index_types.split(","):
+                cache_dir = os.path.join(tmp, "indexes")
+                start = time.perf_counter()
+                _, meta = build_index(args.pdf, embeddings, chunk_size=chunk_size, chunk_overlap=overlap,
+                                      cache_dir=cache_dir, index_type=index_type)
+                ingest_seconds = time.perf_counter() - start
+                engine = RAG_Engine(args.pdf, chunk_size=chunk_size, chunk_overlap=overlap, cache_dir=cache_dir,
+                                    build_if_missing=False, use_answer_cache=False, index_type=index_type,
+                                    embeddings=embeddings)
+                engine.warm_up()
+                for k in int_list(args.k):
+                    row = {
+                        "chunk_size": chunk_size, "overlap": overlap, "k": k, "index_type": index_type,
+                        "chunks": meta["num_chunks"], "ingest_s": ingest_seconds,
+                        "index_kb": index_disk_bytes(meta["key"], cache_dir) / 1024,
+                        **evaluate_config(engine, k, args.repeat),
+                    }
+                    rows.append(row)
+                    print(f"  done: chunk_size={chunk_size} overlap={overlap} {index_type} k={k} -> "
+                          f"QRS {row['accuracy']:.1f}%, p95 {row['p95_ms']:.0f}ms")
+    return pareto_front(rows)
+
+
+def print_table(rows):
+    print("\n" + "=" * 40)
+    print("PARAMETER SWEEP (* = Pareto-optimal on QRS vs p95 latency)")
+    print("=" * 40)
+    print(f"  {'Chunk':>6}{'Overlap':>8}{'k':>3} {'Index':<6}{'Chunks':>7}{'QRS':>8}{'Pos':>8}"
+          f"{'Prompt tok':>11}{'p50':>8}{'p95':>8}{'Ingest':>8}{'Index':>9}")
+    for r in sorted(rows, key=lambda r: (-r["accuracy"], r["p95_ms"])):
+        print(f"{'*' if r['pareto'] else ' '} {r['chunk_size']:>6}{r['overlap']:>8}{r['k']:>3} {r['index_type']:<6}"
+              f"{r['chunks']:>7}{r['accuracy']:>7.1f}%{r['positive_accuracy']:>7.1f}%{r['prompt_tokens']:>11.0f}"
+              f"{r['p50_ms']:>6.0f}ms{r['p95_ms']:>6.0f}ms{r['ingest_s']:>7.1f}s{r['index_kb']:>7.0f}KB")
+
+
+def save_rows(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nResults saved to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking / retrieval settings: QRS vs latency and cost.")
+    parser.add_argument("--pdf", default="project_nova_brief.pdf")
+    parser.add_argument("--chunk-sizes", default="500,1000,1500")
+    parser.add_argument("--overlaps", default="50,150")
+    parser.add_argument("--k", default="2,3,5", help="Comma-separated numbers of retrieved chunks.")
+    parser.add_argument("--index-types", default="flat", help="Comma-separated index types (see index_store.py).")
+    parser.add_argument("--repeat", type=int, default=2, help="Passes over the test cases per configuration.")
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="Mock seconds per chat completion.")
+    parser.add_argument("--prompt-latency", type=float, default=0.2, help="Mock seconds per 1000 prompt tokens.")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--embedding-cache", default=".embedding_cache/sweep.sqlite3",
+                        help="Kept between runs so repeated sweeps embed nothing new.")
+    parser.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    mock = MockOpenRouter(embedding_latency=args.embedding_latency, chat_latency=args.chat_latency,
+                          prompt_latency=args.prompt_latency)
+    with mock, tempfile.TemporaryDirectory() as tmp:
+        # rag_engine reads its configuration at import time, so point it at the stub first
+        os.environ["OPENROUTER_API_BASE"] = mock.base_url
+        os.environ["OPENROUTER_API_KEY"] = "stub"
+        os.environ.pop("RAG_QUERY_SERVICE_URL", None)
+        rows = run_sweep(args, tmp)
+    if not rows:
+        print("❌ No valid configuration (every overlap was >= its chunk size).")
+        return
+    print_table(rows)
+    save_rows(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()
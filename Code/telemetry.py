@@ -0,0 +1,149 @@
+"""
+Per-query, per-stage latency instrumentation.
+
+Each query gets a QueryTrace holding one span per pipeline stage
+(embed_query, vector_search, prompt_assembly, llm_first_token, llm_completion,
+plus the enclosing `query` span). Spans carry token counts and bytes sent, and
+are exported as JSONL records (one per span) and, optionally, to OpenTelemetry.
+`calculate_latency.py` turns the JSONL file into a p50/p95/p99 report.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+TRACE_PATH = os.getenv("RAG_TRACE_PATH", "query_spans.jsonl")
+OTEL_ENABLED = os.getenv("RAG_OTEL_ENABLED", "").lower() in ("1", "true", "yes")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """cl100k token count when tiktoken is installed, else a ~4 chars/token estimate."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+class QueryTrace:
+    """Spans for a single query. Times are wall-clock seconds (time.time())."""
+
+    def __init__(self, question: str, **attributes):
+        self.query_id = uuid.uuid4().hex
+        self.question = question
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.spans = []
+
+    def add_span(self, name: str, start: float, end: float, **attributes):
+        self.spans.append({"name": name, "start": start, "end": end, "attributes": attributes})
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Times the enclosed block; the yielded dict can be filled with attributes."""
+        start = time.time()
+        try:
+            yield attributes
+        finally:
+            self.add_span(name, start, time.time(), **attributes)
+
+    def duration(self, name: str):
+        for span in self.spans:
+            if span["name"] == name:
+                return span["end"] - span["start"]
+        return None
+
+    def records(self):
+        all_spans = [{"name": "query", "start": self.start, "end": self.end or time.time(),
+                      "attributes": self.attributes}] + self.spans
+        return [
+            {
+                "query_id": self.query_id,
+                "question": self.question,
+                "span": s["name"],
+                "start": s["start"],
+                "duration_ms": (s["end"] - s["start"]) * 1000,
+                **s["attributes"],
+            }
+            for s in all_spans
+        ]
+
+
+class JsonlSpanExporter:
+    def __init__(self, path: str = TRACE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: QueryTrace):
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in trace.records())
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class OpenTelemetrySpanExporter:
+    """
+    Re-emits finished traces through the OpenTelemetry API, so whichever SDK
+    exporter is configured (OTLP, console, ...) receives them. Requires the
+    optional `opentelemetry-api` package.
+    """
+    def __init__(self, service_name: str = "rag-engine"):
+        from opentelemetry import trace
+        self._tracer = trace.get_tracer(service_name)
+        self._trace_api = trace
+
+    def export(self, query_trace: QueryTrace):
+        to_ns = lambda seconds: int(seconds * 1e9)
+        root = self._tracer.start_span("query", start_time=to_ns(query_trace.start),
+                                       attributes=_otel_attributes(query_trace.attributes))
+        context = self._trace_api.set_span_in_context(root)
+        for span in query_trace.spans:
+            child = self._tracer.start_span(span["name"], context=context, start_time=to_ns(span["start"]),
+                                            attributes=_otel_attributes(span["attributes"]))
+            child.end(end_time=to_ns(span["end"]))
+        root.end(end_time=to_ns(query_trace.end or time.time()))
+
+
+def _otel_attributes(attributes):
+    return {k: v for k, v in attributes.items() if isinstance(v, (str, bool, int, float))}
+
+
+class Tracer:
+    """Creates traces and hands finished ones to every configured exporter."""
+
+    def __init__(self, exporters=None):
+        self.exporters = exporters if exporters is not None else default_exporters()
+
+    def start(self, question: str, **attributes) -> QueryTrace:
+        return QueryTrace(question, **attributes)
+
+    def finish(self, trace: QueryTrace, **attributes):
+        trace.end = time.time()
+        trace.attributes.update(attributes)
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                print(f"Span export failed ({type(exporter).__name__}): {e}")
+        return trace
+
+
+def default_exporters():
+    exporters = []
+    if TRACE_PATH:
+        exporters.append(JsonlSpanExporter(TRACE_PATH))
+    if OTEL_ENABLED:
+        try:
+            exporters.append(OpenTelemetrySpanExporter())
+        except ImportError:
+            print("RAG_OTEL_ENABLED is set but opentelemetry-api is not installed; skipping.")
+    return exporters
@@ -0,0 +1,68 @@
+"""
+End-to-end smoke tests: queries through RAG_Engine against the local
+OpenRouter stand-in (mock_openrouter.py), so no API key or network is needed.
+
+    python -m pytest -q test_smoke.py
+"""
+import os
+import sys
+import json
+import subprocess
+
+from mock_openrouter import MockOpenRouter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# rag_engine reads its configuration at import time, so the query runs in a fresh interpreter
+QUERY_PROBE = """
+import json
+from rag_engine import RAG_Engine
+engine = RAG_Engine("project_nova_brief.pdf")
+stream = engine.stream_query("What is the total budget?")
+answer = "".join(stream)
+print(json.dumps({"answer": answer, "sources": len(stream.sources), "timings": stream.timings}))
+"""
+# A second, unrelated question in a conversation is answered from the cache; a real follow-up isn't
+HISTORY_PROBE = """
+import json
+from rag_engine import RAG_Engine
+from conversation import ConversationHistory
+engine = RAG_Engine("project_nova_brief.pdf")
+"".join(engine.stream_query("What is the total budget?"))
+history = ConversationHistory()
+history.append("assistant", "Hello! Ask me about Project Nova.")
+history.append("user", "Who is the project lead?")
+history.append("assistant", "The project lead is named in the brief.")
+standalone = engine.stream_query("What is the total budget?", history)
+"".join(standalone)
+follow_up = engine.stream_query("And what is its timeline?", history)
+"".join(follow_up)
+print(json.dumps({"standalone": standalone.cache_hit, "follow_up": follow_up.cache_hit}))
+"""
+
+
+def run_probe(probe, tmp_path):
+    """Runs `probe` against the mock and returns the JSON it prints last."""
+    with MockOpenRouter() as mock:
+        env = dict(os.environ, OPENROUTER_API_BASE=mock.base_url, OPENROUTER_API_KEY="stub",
+                   RAG_INDEX_CACHE_DIR=str(tmp_path / "index"),
+                   RAG_EMBEDDING_CACHE_PATH=str(tmp_path / "embeddings.sqlite3"),
+                   RAG_TRACE_PATH=str(tmp_path / "spans.jsonl"))
+        env.pop("RAG_QUERY_SERVICE_URL", None)
+        # A deadlock while loading shows up as a timeout instead of a hung test run
+        result = subprocess.run([sys.executable, "-c", probe], cwd=HERE, env=env, capture_output=True,
+                                text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_one_query_end_to_end(tmp_path):
+    output = run_probe(QUERY_PROBE, tmp_path)
+    assert output["answer"] and not output["answer"].startswith("Error occurred during query")
+    assert output["sources"] > 0
+    assert output["timings"]["total"] > 0
+
+
+def test_standalone_question_with_history_uses_answer_cache(tmp_path):
+    output = run_probe(HISTORY_PROBE, tmp_path)
+    assert output["standalone"] == "exact"
+    assert output["follow_up"] is None